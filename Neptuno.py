@@ -2,6 +2,8 @@
 #!/usr/bin/env python3
 """neptuno.py — Flask backend con manejo de CSV delimiter, selección de carpeta, SID generator y DB config."""
 from __future__ import annotations
+import time
+_T_INICIO = time.perf_counter()        # antes de importar numpy, oracledb, Flask…
 import io
 import json
 import os
@@ -14,12 +16,32 @@ import csv
 
 import logging
 from subprocess import CalledProcessError
-import hashlib, random, time, struct
+import hashlib, struct
+import bisect
+import codecs
+import copy
+import functools
+import gzip
+import mmap
+import shutil
+import signal
+import tempfile
+import threading
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from itertools import chain, islice
 import xml.etree.ElementTree as ET
 
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
+import numpy as np
 import oracledb
 
+_T_IMPORTADO = time.perf_counter()
+
 _ONE_E18 = 1_000_000_000_000_000_000
 
 BASE = Path(__file__).resolve().parent
@@ -30,33 +52,133 @@ app = Flask(__name__)
 
 
 # --- Autodetección de Oracle Instant Client ---
+# Se resuelve en el primer uso de la base (iniciar_oracle), no al importar:
+# la interfaz y la validación funcionan aunque el equipo no tenga el cliente.
+_LIBRERIAS_OCI = ("oci.dll", "libclntsh.so", "libclntsh.dylib")
+
 def find_oracle_client_dir() -> str | None:
     env = os.environ.get("ORACLE_CLIENT_DIR")
     if env and Path(env).exists():
         return env
     for p in os.environ.get("PATH", "").split(os.pathsep):
-        if (Path(p) / "oci.dll").exists():
+        if p and any((Path(p) / lib).exists() for lib in _LIBRERIAS_OCI):
             return p
     return None
 
-lib_dir = find_oracle_client_dir()
-if not lib_dir:
-    raise RuntimeError("No se encontró Oracle Instant Client (oci.dll).")
-oracledb.init_oracle_client(lib_dir=lib_dir)
-
 
 
 DEFAULT_SID_CFG: Dict[str, str] = {"item_sid_mode": "upc", "style_sid_mode": "desc1"}
+DEFAULT_ASIGNADOR_SID_CFG: Dict[str, Any] = {
+    "nodo": 0,                 # 0-255, distinto en cada servidor que genere SID aleatorios
+    "bloque": 100000,          # SID que reserva cada proceso por acceso a disco
+    "carpeta": str(BASE / "sid"),
+}
+DEFAULT_REF_CFG: Dict[str, Any] = {
+    "ttl_seg": 900,            # vigencia de las tablas de referencia en memoria
+    "recarga_min_seg": 30,     # ante un código desconocido, recargar si el snapshot es más viejo
+    "precargar": False,        # cargar al iniciar el servidor
+    "subsidiarias": ["001"],
+}
+DEFAULT_INDICE_CFG: Dict[str, Any] = {
+    "habilitado": False,
+    "carpeta": str(BASE / "indice"),
+    "refresco_seg": 300,       # antigüedad máxima antes de sincronizar por modified_date
+    "reconstruir_seg": 86400,  # reconstrucción completa periódica (bajas en INVN_SBS)
+}
+DEFAULT_TRABAJOS_CFG: Dict[str, Any] = {
+    "workers": 2,              # generaciones simultáneas en segundo plano
+    "retener_seg": 3600,       # tiempo que se conserva el estado de un trabajo terminado
+    "carpeta": str(BASE / "trabajos"),
+}
+DEFAULT_DELTA_CFG: Dict[str, Any] = {
+    "habilitado": False,       # inventario incremental: omitir filas iguales a las ya generadas
+    "carpeta": str(BASE / "huellas"),
+    "registrar_completas": False,  # las generaciones completas también guardan sus huellas
+}
+DEFAULT_LOTE_CFG: Dict[str, Any] = {
+    "hilos": 4,                # archivos de un lote que se generan a la vez
+    "max_archivos": 200,       # por solicitud, contando los de dentro de los zip
+    "max_descomprimido_mb": 2048,
+}
+DEFAULT_VIGILANCIA_CFG: Dict[str, Any] = {
+    "entrada": str(BASE / "Entrada"),    # carpeta donde el ERP deja los archivos
+    "procesados": "",          # vacío = <entrada>/procesados
+    "fallidos": "",            # vacío = <entrada>/fallidos
+    "workers": 2,              # archivos que se generan a la vez
+    "intervalo_seg": 2,        # pausa entre recorridas de la carpeta
+    "estable_seg": 2,          # sin cambios de tamaño/fecha antes de tomarlo (copia terminada)
+    "reclamar_seg": 3600,      # reclamados por una instancia caída que vuelven a la entrada
+    "extensiones": [".txt", ".csv"],
+}
+DEFAULT_PARALELO_CFG: Dict[str, Any] = {
+    "habilitado": False,       # arma los <INVENTORY> en varios procesos
+    "procesos": 0,             # 0 = uno por núcleo
+    "filas_por_bloque": 5000,  # filas que recibe cada proceso por tarea
+    "min_filas": 50000,        # por debajo de esto se genera en secuencia
+    "min_filas_por_proceso": 25000,  # menos procesos si a cada uno le tocaría menos
+}
+DEFAULT_ORACLE_CFG: Dict[str, Any] = {
+    "modo": "auto",            # auto: thick si hay Instant Client, si no thin; o forzar "thick" / "thin"
+    "lib_dir": "",             # carpeta del Instant Client; vacío = ORACLE_CLIENT_DIR o el PATH
+}
+DEFAULT_TO_SALIDA_CFG: Dict[str, Any] = {
+    "archivo_por_to": False,   # archivos con varios bloques H/I/S: un TO###.xml por cada TO
+}
+DEFAULT_PERFIL_SALIDA_CFG: Dict[str, str] = {
+    "formato": "legible",      # "legible" (indentado) o "compacto" (sin espacios entre nodos)
+    "compresion": "ninguna",   # "ninguna" (.xml), "gzip" (.xml.gz) o "zip" (.zip con un .xml)
+}
+EXTENSIONES_SALIDA = {"ninguna": ".xml", "gzip": ".xml.gz", "zip": ".zip"}
+DEFAULT_POOL_CFG: Dict[str, int] = {
+    "min": 1, "max": 8, "increment": 1,
+    "ping_interval": 60,       # segundos ociosa antes de hacer ping al adquirir
+    "stmtcachesize": 50,
+    "timeout": 300,            # segundos para cerrar sesiones ociosas sobre `min`
+}
+DEFAULT_SERVIDOR_CFG: Dict[str, Any] = {
+    "motor": "waitress",       # waitress (Windows/POSIX), gunicorn (sólo POSIX) o flask (desarrollo)
+    "host": "127.0.0.1",
+    "puerto": 5000,
+    "workers": 1,              # procesos (sólo gunicorn); cada uno con su pool y caches
+    "hilos": 8,                # solicitudes simultáneas por proceso
+    "keep_alive_seg": 5,       # conexión HTTP ociosa antes de cerrarla
+    "max_subida_mb": 512,      # tamaño máximo de una solicitud (archivo subido)
+    "precalentar": True,       # abrir el pool y cargar caches al arrancar cada proceso
+}
+
+
+class ErrorValidacion(Exception):
+    """Datos de entrada inválidos: el mensaje se devuelve tal cual al usuario (HTTP 400)."""
+
+    def __init__(self, mensaje: str, reporte: Dict[str, Any] | None = None):
+        super().__init__(mensaje)
+        self.reporte = reporte      # reporte completo de la validación masiva, si lo hay
+
+    def respuesta(self):
+        """(json, 400) con el mensaje y, si existe, la lista de errores."""
+        extra = {}
+        if self.reporte:
+            extra = {"total_errores": self.reporte["total_errores"],
+                     "errores": self.reporte["errores"]}
+        return jsonify(error=str(self), **extra), 400
 
 
 # --- Utilidades JSON para archivo unificado ---
-def _read_config() -> dict:
-    """Leer config.json ignorando lineas de comentario"""
+# config.json se parsea una sola vez y se reutiliza mientras no cambien su mtime
+# ni su tamaño; las escrituras pasan por un archivo temporal + rename atómico.
+_config_lock = threading.RLock()
+_config_cache: Dict[str, Any] = {"firma": None, "data": None, "version": 0}
+
+
+def _firma_config() -> tuple | None:
     try:
-        text = CONFIG_FILE.read_text("utf-8")
+        st = CONFIG_FILE.stat()
     except FileNotFoundError:
-        return {}
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
 
+def _parse_config(text: str) -> dict:
     cleaned_lines = []
     in_block = False
     for line in text.splitlines():
@@ -73,27 +195,80 @@ def _read_config() -> dict:
     cleaned = "\n".join(cleaned_lines)
     return json.loads(cleaned)
 
+
+def _cached_config() -> dict:
+    """Config parseada en cache; sólo lectura (llamar con _config_lock tomado)."""
+    firma = _firma_config()
+    if firma is None:
+        return {}
+    if firma != _config_cache["firma"]:
+        _config_cache["data"] = _parse_config(CONFIG_FILE.read_text("utf-8"))
+        _config_cache["firma"] = firma
+        _config_cache["version"] += 1
+    return _config_cache["data"]
+
+
+def _read_config() -> dict:
+    """Leer config.json ignorando lineas de comentario (copia del cache en memoria)"""
+    with _config_lock:
+        return copy.deepcopy(_cached_config())
+
+
+def config_version() -> int:
+    """Contador que cambia cada vez que el contenido de config.json cambia."""
+    with _config_lock:
+        _cached_config()
+        return _config_cache["version"]
+
+
 def _write_config(data: dict):
-    CONFIG_FILE.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    texto = json.dumps(data, indent=2)
+    with _config_lock:
+        fd, tmp = tempfile.mkstemp(prefix=".config.", suffix=".tmp", dir=CONFIG_FILE.parent)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(texto)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, CONFIG_FILE)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        _config_cache["data"] = copy.deepcopy(data)
+        _config_cache["firma"] = _firma_config()
+        _config_cache["version"] += 1
 
 def _load_section(keys: list[str], default):
-    data = _read_config()
-    cur = data
-    for k in keys[:-1]:
-        cur = cur.setdefault(k, {})
-    if keys[-1] not in cur:
-        cur[keys[-1]] = default
-        _write_config(data)
-        return default
-    return cur[keys[-1]]
+    with _config_lock:
+        cur = _cached_config()
+        for k in keys:
+            if not isinstance(cur, dict) or k not in cur:
+                break
+            cur = cur[k]
+        else:
+            return copy.deepcopy(cur)
+
+        data = _read_config()
+        cur = data
+        for k in keys[:-1]:
+            cur = cur.setdefault(k, {})
+        if keys[-1] not in cur:
+            cur[keys[-1]] = default
+            _write_config(data)
+            return copy.deepcopy(default)
+        return cur[keys[-1]]
 
 def _save_section(keys: list[str], value):
-    data = _read_config()
-    cur = data
-    for k in keys[:-1]:
-        cur = cur.setdefault(k, {})
-    cur[keys[-1]] = value
-    _write_config(data)
+    with _config_lock:
+        data = _read_config()
+        cur = data
+        for k in keys[:-1]:
+            cur = cur.setdefault(k, {})
+        cur[keys[-1]] = value
+        _write_config(data)
 
 # --- Configuraciones ---
 def load_csv_cfg() -> Dict[str, Any]:
@@ -111,10 +286,68 @@ def save_sid_cfg(cfg: Dict[str, str]):
     _save_section(["sid_generator"], cfg)
 
 
+def asignador_sid_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_ASIGNADOR_SID_CFG, **_load_section(["asignador_sid"], DEFAULT_ASIGNADOR_SID_CFG)}
+
+
 def db_cfg() -> Dict[str, Any]:
     return _load_section(["database"], {})
 
 
+def oracle_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_ORACLE_CFG, **_load_section(["oracle"], DEFAULT_ORACLE_CFG)}
+
+
+def pool_cfg() -> Dict[str, int]:
+    return {**DEFAULT_POOL_CFG, **_load_section(["pool"], DEFAULT_POOL_CFG)}
+
+
+def ref_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_REF_CFG, **_load_section(["cache_referencias"], DEFAULT_REF_CFG)}
+
+
+def indice_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_INDICE_CFG, **_load_section(["indice_upc"], DEFAULT_INDICE_CFG)}
+
+
+def trabajos_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_TRABAJOS_CFG, **_load_section(["trabajos"], DEFAULT_TRABAJOS_CFG)}
+
+
+def vigilancia_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_VIGILANCIA_CFG, **_load_section(["vigilancia"], DEFAULT_VIGILANCIA_CFG)}
+
+
+def delta_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_DELTA_CFG, **_load_section(["generacion_incremental"], DEFAULT_DELTA_CFG)}
+
+
+def lote_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_LOTE_CFG, **_load_section(["lotes"], DEFAULT_LOTE_CFG)}
+
+
+def to_salida_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_TO_SALIDA_CFG, **_load_section(["transfer_orders", "salida"], DEFAULT_TO_SALIDA_CFG)}
+
+
+def perfil_salida_cfg() -> Dict[str, str]:
+    """Perfil de los XML generados (csv.salida); valores desconocidos vuelven al defecto."""
+    cfg = {**DEFAULT_PERFIL_SALIDA_CFG, **_load_section(["csv", "salida"], DEFAULT_PERFIL_SALIDA_CFG)}
+    if cfg["formato"] not in ("legible", "compacto"):
+        cfg["formato"] = DEFAULT_PERFIL_SALIDA_CFG["formato"]
+    if cfg["compresion"] not in EXTENSIONES_SALIDA:
+        cfg["compresion"] = DEFAULT_PERFIL_SALIDA_CFG["compresion"]
+    return cfg
+
+
+def servidor_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_SERVIDOR_CFG, **_load_section(["servidor"], DEFAULT_SERVIDOR_CFG)}
+
+
+def paralelo_cfg() -> Dict[str, Any]:
+    return {**DEFAULT_PARALELO_CFG, **_load_section(["generacion_paralela"], DEFAULT_PARALELO_CFG)}
+
+
 def maestros() -> List[Dict[str, Any]]:
     return _load_section(["inventory", "campos_maestros"], [])
 
@@ -137,32 +370,7 @@ def load_campos_maestros_to() -> list[dict]:
 
 def load_plantilla_to() -> dict:
     """Obtiene la configuración actual de Transfer Orders con objetos completos."""
-    cfg = _load_section(["transfer_orders", "configuracion"], {"header": [], "detail": []})
-    maestros = load_campos_maestros_to()
-
-    header = []
-    for idx, r in enumerate(cfg.get('header', [])):
-        m = next((c for c in maestros if c['rpro'] == r), None)
-        if m:
-            header.append({
-                'rpro':    m['rpro'],
-                'visual':  m['visual'],
-                'section': m['section'],
-                'pos':     idx
-            })
-
-    detail = []
-    for idx, r in enumerate(cfg.get('detail', [])):
-        m = next((c for c in maestros if c['rpro'] == r), None)
-        if m:
-            detail.append({
-                'rpro':    m['rpro'],
-                'visual':  m['visual'],
-                'section': m['section'],
-                'pos':     idx
-            })
-
-    return {'header': header, 'detail': detail}
+    return copy.deepcopy(plan_to().plantilla)
 
 
 def load_config_to() -> dict[str, list]:
@@ -170,6 +378,302 @@ def load_config_to() -> dict[str, list]:
     return _load_section(["transfer_orders", "configuracion"], {"header": [], "detail": []})
 
 
+# --- Métricas e instrumentación ---
+# Contadores e histogramas del proceso, expuestos en formato de texto de
+# Prometheus en /metrics; cada generación lleva además su propio Cronometro
+# con el desglose por etapa que se devuelve en la respuesta JSON.
+_BUCKETS_SEG = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, tuple[str, str]] = {}           # nombre → (tipo, ayuda)
+        self._contadores: Dict[tuple, float] = {}
+        self._histogramas: Dict[tuple, list] = {}             # [buckets..., suma, cantidad]
+
+    def describir(self, nombre: str, tipo: str, ayuda: str):
+        self._meta[nombre] = (tipo, ayuda)
+
+    def sumar(self, nombre: str, valor: float = 1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def observar(self, nombre: str, valor: float, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            h = self._histogramas.get(clave)
+            if h is None:
+                h = self._histogramas[clave] = [0] * len(_BUCKETS_SEG) + [0.0, 0]
+            i = bisect.bisect_left(_BUCKETS_SEG, valor)
+            if i < len(_BUCKETS_SEG):
+                h[i] += 1
+            h[-2] += valor
+            h[-1] += 1
+
+    @staticmethod
+    def _etiquetas(pares, extra: str = "") -> str:
+        partes = [f'{k}="{v}"' for k, v in pares] + ([extra] if extra else [])
+        return "{" + ",".join(partes) + "}" if partes else ""
+
+    def exponer(self, extra: Dict[str, float] | None = None) -> str:
+        """Texto para /metrics; `extra` agrega gauges calculados al momento."""
+        lineas: list[str] = []
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted((k, list(v)) for k, v in self._histogramas.items())
+        vistos: set[str] = set()
+
+        def _cabecera(nombre: str, tipo: str):
+            if nombre not in vistos:
+                vistos.add(nombre)
+                _, ayuda = self._meta.get(nombre, (tipo, ""))
+                if ayuda:
+                    lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+
+        for (nombre, pares), valor in contadores:
+            _cabecera(nombre, "counter")
+            lineas.append(f"{nombre}{self._etiquetas(pares)} {valor:g}")
+        for (nombre, pares), h in histogramas:
+            _cabecera(nombre, "histogram")
+            acumulado = 0
+            for limite, n in zip(_BUCKETS_SEG, h):
+                acumulado += n
+                le = 'le="%g"' % limite
+                lineas.append(f"{nombre}_bucket{self._etiquetas(pares, le)} {acumulado}")
+            inf = self._etiquetas(pares, 'le="+Inf"')
+            lineas.append(f"{nombre}_bucket{inf} {h[-1]}")
+            lineas.append(f"{nombre}_sum{self._etiquetas(pares)} {h[-2]:.6f}")
+            lineas.append(f"{nombre}_count{self._etiquetas(pares)} {h[-1]}")
+        for nombre, valor in (extra or {}).items():
+            _cabecera(nombre, "gauge")
+            lineas.append(f"{nombre} {valor:g}")
+        return "\n".join(lineas) + "\n"
+
+
+metricas = Metricas()
+metricas.describir("neptuno_generaciones_total", "counter", "Generaciones de XML terminadas, por tipo y resultado.")
+metricas.describir("neptuno_filas_total", "counter", "Filas procesadas en generaciones exitosas.")
+metricas.describir("neptuno_consultas_oracle_total", "counter", "Sentencias ejecutadas contra Oracle.")
+metricas.describir("neptuno_upc_resueltos_total", "counter", "UPC resueltos, por origen (indice u oracle).")
+metricas.describir("neptuno_generacion_segundos", "histogram", "Duración total de cada generación.")
+metricas.describir("neptuno_etapa_segundos", "histogram", "Tiempo por etapa dentro de cada generación.")
+
+
+class Cronometro:
+    """Tiempos por etapa y conteos de una generación."""
+
+    def __init__(self, tipo: str):
+        self.tipo = tipo
+        self.inicio = time.perf_counter()
+        self.etapas: Dict[str, float] = {}
+        self.conteos: Dict[str, int] = {}
+
+    def sumar_tiempo(self, etapa: str, seg: float):
+        self.etapas[etapa] = self.etapas.get(etapa, 0.0) + seg
+
+    def contar(self, nombre: str, n: int = 1):
+        self.conteos[nombre] = self.conteos.get(nombre, 0) + n
+
+    def resumen(self) -> Dict[str, Any]:
+        total = time.perf_counter() - self.inicio
+        etapas = {k: round(v, 4) for k, v in self.etapas.items()}
+        etapas["otros"] = round(max(total - sum(self.etapas.values()), 0.0), 4)
+        return {"total_seg": round(total, 4), "etapas_seg": etapas, "conteos": dict(self.conteos)}
+
+    def publicar(self, resultado: str, filas: int = 0):
+        total = time.perf_counter() - self.inicio
+        metricas.sumar("neptuno_generaciones_total", tipo=self.tipo, resultado=resultado)
+        metricas.observar("neptuno_generacion_segundos", total, tipo=self.tipo)
+        if resultado == "ok":
+            metricas.sumar("neptuno_filas_total", filas, tipo=self.tipo)
+        for etapa, seg in self.etapas.items():
+            metricas.observar("neptuno_etapa_segundos", seg, tipo=self.tipo, etapa=etapa)
+
+
+_cronometro: ContextVar[Cronometro | None] = ContextVar("neptuno_cronometro", default=None)
+
+
+def instrumentado(tipo: str):
+    """Mide una función de generación y agrega su resumen de tiempos al resultado."""
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            with cronometrar(tipo) as crono:
+                res = fn(*args, **kwargs)
+                crono.contar("filas", res.get("filas", 0))
+                res["tiempos"] = crono.resumen()
+            return res
+        return envoltura
+    return decorador
+
+
+@contextmanager
+def cronometrar(tipo: str):
+    """Abre el Cronometro de una generación; al salir publica sus métricas."""
+    crono = Cronometro(tipo)
+    token = _cronometro.set(crono)
+    try:
+        yield crono
+    except BaseException:
+        crono.publicar("error")
+        raise
+    else:
+        crono.publicar("ok", crono.conteos.get("filas", 0))
+    finally:
+        _cronometro.reset(token)
+
+
+@contextmanager
+def etapa(nombre: str):
+    """Suma el tiempo del bloque a la etapa `nombre` de la generación en curso."""
+    crono = _cronometro.get()
+    if crono is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        crono.sumar_tiempo(nombre, time.perf_counter() - t0)
+
+
+def contar(nombre: str, n: int = 1, **etiquetas):
+    """Conteo de la generación en curso y del contador global neptuno_<nombre>_total."""
+    crono = _cronometro.get()
+    if crono is not None:
+        crono.contar(nombre if not etiquetas else f"{nombre}_{'_'.join(map(str, etiquetas.values()))}", n)
+    metricas.sumar(f"neptuno_{nombre}_total", n, **etiquetas)
+
+
+# --- Inicialización del cliente Oracle ---
+_oracle = {"modo": None, "lib_dir": None, "init_seg": None}
+_oracle_lock = threading.Lock()
+
+
+def iniciar_oracle() -> str:
+    """
+    Elige el modo de python-oracledb la primera vez que se usa la base.
+
+    Con Instant Client disponible se usa el modo thick (como hasta ahora); si
+    no, el modo thin, que no necesita librerías nativas. Sólo se decide una
+    vez por proceso: oracledb no permite cambiar de modo después.
+    """
+    if _oracle["modo"]:
+        return _oracle["modo"]
+    with _oracle_lock:
+        if _oracle["modo"]:
+            return _oracle["modo"]
+        cfg = oracle_cfg()
+        modo = cfg["modo"]
+        t0 = time.perf_counter()
+        lib_dir = None
+        if modo != "thin":
+            lib_dir = cfg["lib_dir"] or find_oracle_client_dir()
+            try:
+                if not lib_dir:
+                    raise RuntimeError("No se encontró Oracle Instant Client (oci.dll).")
+                oracledb.init_oracle_client(lib_dir=lib_dir)
+                modo = "thick"
+            except Exception as exc:
+                if modo == "thick":
+                    raise
+                logging.warning("Oracle en modo thin: %s", exc)
+                modo, lib_dir = "thin", None
+        _oracle.update(modo=modo, lib_dir=lib_dir, init_seg=round(time.perf_counter() - t0, 4))
+        logging.info("Cliente Oracle en modo %s (%.3f s)", modo, _oracle["init_seg"])
+        return modo
+
+
+# --- Pool de conexiones Oracle ---
+_pool = None
+_pool_key: tuple | None = None
+_pool_lock = threading.Lock()
+_pool_stats = {"adquisiciones": 0, "esperas": 0, "espera_seg": 0.0}
+
+
+def _dsn(cfg: Dict[str, Any]) -> str:
+    return (
+        f"(DESCRIPTION=(ADDRESS=(PROTOCOL=TCP)(HOST={cfg.get('servidor')})"
+        f"(PORT={cfg.get('puerto')}))(CONNECT_DATA=(SERVICE_NAME={cfg.get('base_datos')})))"
+    )
+
+
+def _cerrar_pool():
+    """Cierra el pool actual; si aún tiene sesiones ocupadas se libera al devolverlas."""
+    global _pool, _pool_key
+    if _pool is not None:
+        try:
+            _pool.close()
+        except Exception as exc:
+            logging.warning("Pool Oracle retirado con sesiones en uso: %s", exc)
+    _pool, _pool_key = None, None
+
+
+def reset_pool():
+    """Fuerza que la próxima conexión reconstruya el pool (p.ej. al cambiar credenciales)."""
+    with _pool_lock:
+        _cerrar_pool()
+
+
+def get_pool():
+    """Pool de sesiones del proceso, creado a demanda desde db_cfg() y pool_cfg()."""
+    global _pool, _pool_key
+    cfg, pcfg = db_cfg(), pool_cfg()
+    key = (
+        cfg.get("servidor"), cfg.get("puerto"), cfg.get("base_datos"),
+        cfg.get("usuario"), cfg.get("password"), tuple(sorted(pcfg.items()))
+    )
+    iniciar_oracle()
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            _cerrar_pool()
+            _pool = oracledb.create_pool(
+                user=cfg.get("usuario"), password=cfg.get("password"), dsn=_dsn(cfg),
+                min=pcfg["min"], max=pcfg["max"], increment=pcfg["increment"],
+                ping_interval=pcfg["ping_interval"], stmtcachesize=pcfg["stmtcachesize"],
+                timeout=pcfg["timeout"], getmode=oracledb.POOL_GETMODE_WAIT
+            )
+            _pool_key = key
+        return _pool
+
+
+def adquirir_conexion():
+    """Toma una sesión del pool; `conn.close()` la devuelve."""
+    pool = get_pool()
+    espera = pool.busy >= pool.max
+    t0 = time.perf_counter()
+    conn = pool.acquire()
+    with _pool_lock:
+        _pool_stats["adquisiciones"] += 1
+        if espera:
+            _pool_stats["esperas"] += 1
+            _pool_stats["espera_seg"] += time.perf_counter() - t0
+    return conn
+
+
+def estado_pool() -> Dict[str, Any]:
+    with _pool_lock:
+        stats = {
+            "adquisiciones": _pool_stats["adquisiciones"],
+            "waits":         _pool_stats["esperas"],
+            "espera_seg":    round(_pool_stats["espera_seg"], 3),
+        }
+        stats["oracle"] = dict(_oracle)
+        if _pool is None:
+            return {"activo": False, **stats}
+        return {
+            "activo": True,
+            "busy":   _pool.busy,
+            "open":   _pool.opened,
+            "min":    _pool.min,
+            "max":    _pool.max,
+            **stats,
+        }
+
+
 # --- Nuevo Calculo Item_Sid & Style_Sid ---
 
 def _fix_sid_f8(value: int) -> int:
@@ -186,10 +690,8 @@ def sid_from_upc(upc: str) -> str:
     return str(_fix_sid_f8(int(upc)))
 
 def sid_random() -> str:
-    ts   = int(time.time() * 1000) % 1_000_000_000_000
-    cnt  = random.randint(0, 9_999)
-    base = int(f"{ts:012d}{cnt:04d}")
-    return str(_fix_sid_f8(base))
+    """SID "aleatorio": único, tomado del asignador por bloques (ver AsignadorSid)."""
+    return asignador_sid().siguiente()
 
 def sid_from_desc(desc: str) -> str:
     desc = desc[:19]
@@ -200,6 +702,132 @@ def sid_from_desc(desc: str) -> str:
 def sid_from_both(d1: str, d2: str) -> str:
     return sid_from_desc((d1 + d2)[:19])
 
+# ---------- Versiones en lote (mismo resultado, bit a bit) ----------
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+def _fix_sid_f8_many(values: np.ndarray) -> np.ndarray:
+    """_fix_sid_f8 sobre un arreglo uint64 completo.
+
+    Se limpian los bits 0‑2 y 58‑63, se multiplica por 0x20 y se restauran los
+    bits 0‑2 originales; el bit 63 queda siempre en 0, así que el resultado
+    leído como signed coincide con el escalar.
+    """
+    v = np.asarray(values, dtype=np.uint64)
+    fijo = (v & np.uint64(0x03FFFFFFFFFFFFF8)) << np.uint64(5)
+    return (fijo | (v & np.uint64(0x07))).astype(np.int64)
+
+def _sids_str(values: np.ndarray) -> List[str]:
+    return [str(x) for x in values.tolist()]
+
+def sid_from_upc_many(upcs) -> List[str]:
+    vals = np.fromiter((int(u) & _MASK64 for u in upcs), dtype=np.uint64)
+    return _sids_str(_fix_sid_f8_many(vals))
+
+def sid_from_desc_many(descs) -> List[str]:
+    digests = b"".join(hashlib.sha256(d[:19].encode("utf-8")).digest()[:8] for d in descs)
+    temp = np.remainder(np.frombuffer(digests, dtype="<i8"), _ONE_E18)   # igual que % en Python
+    return _sids_str(_fix_sid_f8_many(temp.astype(np.uint64)))
+
+def sid_from_both_many(d1s, d2s) -> List[str]:
+    return sid_from_desc_many((a + b)[:19] for a, b in zip(d1s, d2s))
+
+def sid_random_many(n: int) -> List[str]:
+    return asignador_sid().muchos(n)
+
+# ---------- Asignador de SID para el modo random ----------
+# valor = (secuencia << 8) | nodo, pasado por _fix_sid_f8 (inyectiva bajo 2^58).
+# La secuencia arranca por encima de todo lo que generaba el sid_random anterior
+# (ms % 10^12 seguido de 4 dígitos, siempre < 10^16) y de cualquier UPC.
+_BITS_NODO = 8
+_MAX_SECUENCIA = 1 << (58 - _BITS_NODO)
+
+def _inicio_secuencia() -> int:
+    return (int(time.time() * 1000) * 10_000 >> _BITS_NODO) + 1
+
+class AsignadorSid:
+    """
+    Entrega SID únicos sin colisiones entre hilos, procesos y reinicios.
+
+    Cada proceso reserva bloques consecutivos de la secuencia bajo un lock de
+    archivo y guarda la marca de agua (`siguiente`) antes de usarlos; dentro
+    del bloque sólo se incrementa un contador en memoria. Un bloque que no se
+    termina de usar queda como hueco: nunca se reparte dos veces.
+    """
+
+    def __init__(self, carpeta, nodo: int = 0, bloque: int = 100000):
+        if not 0 <= int(nodo) < (1 << _BITS_NODO):
+            raise ValueError(f"nodo de SID fuera de rango: {nodo}")
+        self.nodo = int(nodo)
+        self.bloque = max(int(bloque), 1)
+        self.ruta = Path(carpeta) / f"sid_nodo{self.nodo:03d}.json"
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._sig = self._fin = 0
+        self.reservas = 0
+
+    def _reservar(self, minimo: int):
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        with _bloqueo_archivo(self.ruta.with_suffix(".lock"), espera_seg=30, vencido_seg=60):
+            try:
+                siguiente = int(json.loads(self.ruta.read_text(encoding="utf-8"))["siguiente"])
+            except (OSError, ValueError, KeyError, TypeError):
+                siguiente = _inicio_secuencia()
+            fin = siguiente + max(minimo, self.bloque)
+            if fin > _MAX_SECUENCIA:
+                raise RuntimeError("Se agotó el espacio de SID del nodo")
+            _escribir_json_atomico(self.ruta, {
+                "siguiente": fin, "nodo": self.nodo,
+                "actualizado": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+            })
+        self._sig, self._fin = siguiente, fin
+        self.reservas += 1
+
+    def _tomar(self, n: int) -> int:
+        """Reserva `n` posiciones consecutivas de la secuencia y devuelve la primera."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # proceso hijo (fork): el bloque heredado pertenece al padre
+                self._pid, self._sig, self._fin = os.getpid(), 0, 0
+            if self._fin - self._sig < n:
+                self._reservar(n)
+            ini = self._sig
+            self._sig += n
+            return ini
+
+    def siguiente(self) -> str:
+        return str(_fix_sid_f8((self._tomar(1) << _BITS_NODO) | self.nodo))
+
+    def muchos(self, n: int) -> List[str]:
+        if n <= 0:
+            return []
+        ini = self._tomar(n)
+        seq = np.arange(ini, ini + n, dtype=np.uint64)
+        return _sids_str(_fix_sid_f8_many((seq << np.uint64(_BITS_NODO)) | np.uint64(self.nodo)))
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"nodo": self.nodo, "bloque": self.bloque, "reservas": self.reservas,
+                    "disponibles": self._fin - self._sig, "archivo": str(self.ruta)}
+
+_asignador: AsignadorSid | None = None
+_asignador_key: tuple | None = None
+_asignador_version = -1
+_asignador_lock = threading.Lock()
+
+def asignador_sid() -> AsignadorSid:
+    """Asignador del proceso; se recrea si cambia su configuración."""
+    global _asignador, _asignador_key, _asignador_version
+    version = config_version()
+    if _asignador is not None and _asignador_version == version:
+        return _asignador
+    cfg = asignador_sid_cfg()
+    key = (cfg["carpeta"], cfg["nodo"], cfg["bloque"])
+    with _asignador_lock:
+        if _asignador is None or _asignador_key != key:
+            _asignador, _asignador_key = AsignadorSid(cfg["carpeta"], cfg["nodo"], cfg["bloque"]), key
+        _asignador_version = version
+        return _asignador
+
 # ---------- ALIAS para que el código principal los use ----------
 sid_gen_from_upc = sid_from_upc      # genera item_sid por UPC
 sid_gen_random   = sid_random        # genera item_sid aleatorio
@@ -209,6 +837,1061 @@ sid_style_both   = sid_from_both
 sid_style_random = sid_random
 
 
+# --- Consultas masivas a Oracle ---
+# Oracle admite hasta 1000 elementos en un IN-list; se usan bloques más chicos
+# y de tamaño fijo para que el texto SQL sea siempre el mismo (cache de sentencias).
+LOOKUP_CHUNK = 500
+
+
+def _lotes(valores, tam: int = LOOKUP_CHUNK):
+    vals = list(valores)
+    for i in range(0, len(vals), tam):
+        yield vals[i:i + tam]
+
+
+def _consulta_in(cursor, sql: str, sbs: str, claves) -> list[tuple]:
+    """Ejecuta `sql` (con marcador {marcas}) por bloques de IN-list y junta las filas."""
+    filas: list[tuple] = []
+    marcas = ", ".join(f":k{i}" for i in range(LOOKUP_CHUNK))
+    for lote in _lotes(claves):
+        # se rellena el último bloque repitiendo la última clave
+        lote = lote + [lote[-1]] * (LOOKUP_CHUNK - len(lote))
+        binds = {"sbs": sbs, **{f"k{i}": v for i, v in enumerate(lote)}}
+        cursor.execute(sql.format(marcas=marcas), binds)
+        filas.extend(cursor.fetchall())
+        contar("consultas_oracle")
+    return filas
+
+
+def buscar_upcs(cursor, sbs: str, upcs) -> Dict[str, tuple]:
+    """local_upc → (style_sid, item_sid, cost, tax_code, dcs_code, vend_code) en cms.INVN_SBS."""
+    filas = _consulta_in(
+        cursor,
+        "SELECT local_upc, style_sid, item_sid, cost, tax_code, dcs_code, vend_code "
+        "FROM cms.INVN_SBS WHERE sbs_no = :sbs AND local_upc IN ({marcas})",
+        sbs, upcs
+    )
+    return {str(f[0]): tuple(f[1:]) for f in filas}
+
+
+def buscar_desc1(cursor, sbs: str, descs) -> Dict[str, str]:
+    """description1 → style_sid (primer registro encontrado por descripción)."""
+    filas = _consulta_in(
+        cursor,
+        "SELECT description1, style_sid FROM cms.INVN_SBS "
+        "WHERE sbs_no = :sbs AND description1 IN ({marcas})",
+        sbs, descs
+    )
+    res: Dict[str, str] = {}
+    for desc, style in filas:
+        res.setdefault(str(desc), str(style))
+    return res
+
+
+# --- Cache de datos de referencia (cms.dcs / cms.vendor) ---
+class RefCache:
+    """
+    Tablas chicas y casi estáticas (DCS con su tax_code y vendors) cargadas por
+    subsidiaria en memoria; se recargan al vencer `ttl_seg` o a pedido.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos: Dict[str, Dict[str, Any]] = {}
+        self._stats = {"hits": 0, "misses": 0, "recargas": 0}
+
+    @staticmethod
+    def _leer_tablas(cursor, sbs: str) -> Dict[str, Any]:
+        cursor.execute("SELECT dcs_code, tax_code FROM cms.dcs WHERE sbs_no = :1", (sbs,))
+        dcs = {str(code): tax for code, tax in cursor.fetchall()}
+        cursor.execute("SELECT vend_code FROM cms.vendor WHERE sbs_no = :1", (sbs,))
+        vendors = {str(v) for (v,) in cursor.fetchall()}
+        contar("consultas_oracle", 2)
+        return {"dcs": dcs, "vendors": vendors, "cargado": time.monotonic()}
+
+    def _cargar(self, sbs: str, cursor=None):
+        if cursor is not None:
+            snap = self._leer_tablas(cursor, sbs)
+        else:
+            conn = adquirir_conexion()
+            try:
+                with conn.cursor() as cur:
+                    snap = self._leer_tablas(cur, sbs)
+            finally:
+                conn.close()
+        self._datos[sbs] = snap
+        self._stats["recargas"] += 1
+        return snap
+
+    def _snapshot(self, sbs: str, cursor, n: int) -> Dict[str, Any]:
+        snap = self._datos.get(sbs)
+        if snap and time.monotonic() - snap["cargado"] < ref_cfg()["ttl_seg"]:
+            self._stats["hits"] += n
+            return snap
+        self._stats["misses"] += n
+        return self._cargar(sbs, cursor)
+
+    def _resolver(self, tabla: str, sbs: str, codigos, cursor=None):
+        codigos = set(codigos)
+        with self._lock:
+            snap = self._snapshot(sbs, cursor, len(codigos))
+            faltan = codigos.difference(snap[tabla])
+            # Un código recién dado de alta no debe esperar al TTL completo
+            if faltan and time.monotonic() - snap["cargado"] >= ref_cfg()["recarga_min_seg"]:
+                snap = self._cargar(sbs, cursor)
+            return snap[tabla]
+
+    def dcs(self, sbs: str, codigos, cursor=None) -> Dict[str, Any]:
+        """dcs_code → tax_code de los `codigos` que existen en cms.dcs."""
+        tabla = self._resolver("dcs", sbs, codigos, cursor)
+        return {c: tabla[c] for c in codigos if c in tabla}
+
+    def vendors(self, sbs: str, codigos, cursor=None) -> set[str]:
+        """Subconjunto de `codigos` que existe en cms.vendor."""
+        tabla = self._resolver("vendors", sbs, codigos, cursor)
+        return {c for c in codigos if c in tabla}
+
+    def refrescar(self, sbs: str | None = None):
+        """Recarga ya una subsidiaria (o todas las configuradas)."""
+        subs = [sbs] if sbs else (list(self._datos) or ref_cfg()["subsidiarias"])
+        with self._lock:
+            for s in subs:
+                self._cargar(s)
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            ahora = time.monotonic()
+            return {
+                **self._stats,
+                "ttl_seg": ref_cfg()["ttl_seg"],
+                "subsidiarias": {
+                    sbs: {
+                        "dcs": len(snap["dcs"]),
+                        "vendors": len(snap["vendors"]),
+                        "edad_seg": round(ahora - snap["cargado"], 1),
+                    }
+                    for sbs, snap in self._datos.items()
+                },
+            }
+
+
+ref_cache = RefCache()
+
+
+def precargar_referencias():
+    """Carga DCS/vendors de las subsidiarias configuradas (arranque del servidor)."""
+    try:
+        ref_cache.refrescar()
+    except Exception as exc:
+        logging.warning("No se pudo precargar el cache de referencias: %s", exc)
+
+
+# --- Bloqueo entre procesos ---
+@contextmanager
+def _bloqueo_archivo(path: Path, espera_seg: float = 120, vencido_seg: float = 900):
+    """Lock entre procesos basado en un archivo creado en modo exclusivo."""
+    limite = time.monotonic() + espera_seg
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                # un proceso que murió con el lock tomado no debe bloquear para siempre
+                if time.time() - path.stat().st_mtime > vencido_seg:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > limite:
+                raise TimeoutError(f"No se pudo tomar el bloqueo {path.name}")
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _escribir_json_atomico(path: Path, data: dict):
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+# --- Numeración de archivos de salida ---
+# Último número entregado por prefijo ({"Inventory": 41, "TO": 7}), dentro de
+# la misma carpeta de salida para que siga a la carpeta si cambia csv.ruta.
+ESTADO_NUMERACION = ".neptuno_numeracion.json"
+
+def _recuperar_numeracion(carpeta: Path) -> Dict[str, int]:
+    """Reconstruye el estado desde los archivos existentes (una sola pasada)."""
+    estado: Dict[str, int] = {}
+    with os.scandir(carpeta) as it:
+        for entrada in it:
+            base = entrada.name.split(".", 1)[0]
+            prefijo = base.rstrip("0123456789")
+            if prefijo and prefijo != base:
+                estado[prefijo] = max(estado.get(prefijo, 0), int(base[len(prefijo):]))
+    return estado
+
+
+def reservar_salida(carpeta, prefijo: str, extension: str = ".xml") -> Path:
+    """
+    Reserva el siguiente nombre `{prefijo}{n:03d}{extension}` de la carpeta.
+
+    El contador se lee e incrementa bajo un lock de archivo, así que dos
+    generaciones simultáneas (hilos o procesos) nunca reciben el mismo nombre
+    y no hace falta recorrer la carpeta. Sólo si falta el archivo de estado se
+    recupera el último número a partir de los archivos existentes.
+    """
+    carpeta = Path(carpeta)
+    carpeta.mkdir(parents=True, exist_ok=True)
+    estado_path = carpeta / ESTADO_NUMERACION
+    with _bloqueo_archivo(estado_path.with_suffix(".lock"), espera_seg=30, vencido_seg=60):
+        try:
+            estado = json.loads(estado_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            estado = _recuperar_numeracion(carpeta)
+        except (OSError, ValueError):
+            logging.warning("Estado de numeración ilegible en %s; se recupera de la carpeta", carpeta)
+            estado = _recuperar_numeracion(carpeta)
+        n = int(estado.get(prefijo, 0)) + 1
+        # un archivo dejado a mano con ese nombre no se pisa
+        while (carpeta / f"{prefijo}{n:03d}{extension}").exists():
+            n += 1
+        estado[prefijo] = n
+        _escribir_json_atomico(estado_path, estado)
+    return carpeta / f"{prefijo}{n:03d}{extension}"
+
+
+# --- Índice local ordenado (mmap) ---
+class _VistaClaves:
+    """Secuencia de claves sobre el mmap, para usar con bisect sin copiar el archivo."""
+
+    def __init__(self, mm, ancho_rec: int, ancho_clave: int, n: int):
+        self.mm, self.ancho_rec, self.ancho_clave, self.n = mm, ancho_rec, ancho_clave, n
+        self.usos = 0             # lectores en curso (bajo el lock del índice)
+        self.retirada = False     # reemplazada por otra generación: cerrar al quedar sin usos
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i: int) -> bytes:
+        off = i * self.ancho_rec
+        return self.mm[off:off + self.ancho_clave]
+
+
+class IndiceOrdenado:
+    """
+    Archivo de registros de ancho fijo ordenados por clave y mapeado en memoria de
+    sólo lectura, de modo que varios procesos comparten las mismas páginas.
+
+    Cada reconstrucción escribe una generación nueva (`<nombre>.<gen>.bin`) y luego
+    actualiza `<nombre>.json`; los lectores remapean al notar el cambio. Así nunca
+    se reescribe un archivo que otro proceso tiene mapeado (Windows no lo permite).
+    El mapeo anterior se cierra cuando termina su último lector, y las generaciones
+    que todavía no se pudieron borrar se reintentan en cada fusión.
+    """
+
+    def __init__(self, carpeta, nombre: str, ancho_clave: int, fmt_valor: str):
+        self.carpeta = Path(carpeta)
+        self.nombre = nombre
+        self.ancho_clave = ancho_clave
+        self.rec = struct.Struct(f"<{ancho_clave}s{fmt_valor}")
+        self._lock = threading.Lock()
+        self._vista: _VistaClaves | None = None
+        self._gen = None
+
+    @property
+    def manifiesto(self) -> Path:
+        return self.carpeta / f"{self.nombre}.json"
+
+    def meta(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.manifiesto.read_text("utf-8"))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def clave(self, valor: str) -> bytes | None:
+        """Clave en bytes, o None si no entra en el ancho fijo (se resuelve en Oracle)."""
+        b = valor.encode("utf-8")
+        return b.ljust(self.ancho_clave, b"\0") if 0 < len(b) <= self.ancho_clave else None
+
+    def recargar_si_cambio(self):
+        meta = self.meta()
+        gen = meta.get("gen")
+        if gen == self._gen:
+            return
+        with self._lock:
+            vista = None
+            if gen is not None and meta.get("n"):
+                with open(self.carpeta / meta["archivo"], "rb") as fh:
+                    mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                vista = _VistaClaves(mm, self.rec.size, self.ancho_clave, meta["n"])
+            previa, self._vista, self._gen = self._vista, vista, gen
+            if previa is not None:
+                previa.retirada = True
+                if not previa.usos:
+                    previa.mm.close()
+
+    @contextmanager
+    def _leyendo(self):
+        """Vista vigente, que no se cierra mientras dure el bloque."""
+        with self._lock:
+            vista = self._vista
+            if vista is not None:
+                vista.usos += 1
+        try:
+            yield vista
+        finally:
+            if vista is not None:
+                with self._lock:
+                    vista.usos -= 1
+                    if vista.retirada and not vista.usos:
+                        vista.mm.close()
+
+    def buscar(self, valor: str) -> tuple | None:
+        k = self.clave(valor)
+        if k is None:
+            return None
+        with self._leyendo() as vista:
+            if vista is None:
+                return None
+            i = bisect.bisect_left(vista, k)
+            if i < vista.n and vista[i] == k:
+                off = i * vista.ancho_rec
+                return self.rec.unpack(vista.mm[off:off + vista.ancho_rec])[1:]
+        return None
+
+    def _registros(self):
+        with self._leyendo() as vista:
+            if vista is None:
+                return
+            for i in range(vista.n):
+                off = i * vista.ancho_rec
+                yield vista.mm[off:off + vista.ancho_rec]
+
+    def _borrar_generaciones_viejas(self, vigente: str):
+        """
+        Borra las generaciones que no son la vigente. En Windows una que otro
+        proceso (o un lector de éste) todavía tiene mapeada no se puede borrar:
+        queda para la próxima fusión.
+        """
+        pendientes = []
+        for viejo_bin in self.carpeta.glob(f"{self.nombre}.*.bin"):
+            if viejo_bin.name != vigente:
+                try:
+                    viejo_bin.unlink()
+                except OSError:
+                    pendientes.append(viejo_bin.name)
+        if pendientes:
+            logging.info("Índice %s: %d generaciones en uso se borran en la próxima fusión (%s)",
+                         self.nombre, len(pendientes), ", ".join(sorted(pendientes)))
+
+    def fusionar(self, cambios: Dict[bytes, bytes], meta: Dict[str, Any],
+                 conservar_existentes: bool = False, reemplazar: bool = False):
+        """
+        Escribe una generación nueva = registros actuales + `cambios` (clave → registro
+        empaquetado). Con `conservar_existentes` gana el registro ya indexado.
+        Llamar con el bloqueo de sincronización tomado.
+        """
+        self.carpeta.mkdir(parents=True, exist_ok=True)
+        self.recargar_si_cambio()
+        actual = self.meta()
+        gen = int(actual.get("gen") or 0) + 1
+        archivo = f"{self.nombre}.{gen}.bin"
+        nuevos = sorted(cambios.items())
+        viejos = (r for r in ()) if reemplazar else self._registros()
+        ak = self.ancho_clave
+        n = 0
+        with open(self.carpeta / archivo, "wb") as fh, closing(viejos):
+            viejo = next(viejos, None)
+            for k, rec in nuevos:
+                while viejo is not None and viejo[:ak] < k:
+                    fh.write(viejo); n += 1
+                    viejo = next(viejos, None)
+                if viejo is not None and viejo[:ak] == k:
+                    if conservar_existentes:
+                        rec = viejo
+                    viejo = next(viejos, None)
+                fh.write(rec); n += 1
+            while viejo is not None:
+                fh.write(viejo); n += 1
+                viejo = next(viejos, None)
+            fh.flush()
+            os.fsync(fh.fileno())
+        _escribir_json_atomico(self.manifiesto, {**meta, "gen": gen, "archivo": archivo, "n": n})
+        self.recargar_si_cambio()
+        self._borrar_generaciones_viejas(archivo)
+
+
+# --- Índice local UPC → INVN_SBS ---
+# local_upc → style_sid, item_sid, cost, tax_code, dcs_code, vend_code
+#   (cost y tax_code se guardan como texto para reproducir exactamente str() del valor Oracle)
+# description1 → style_sid
+_indices_upc: Dict[str, tuple[IndiceOrdenado, IndiceOrdenado]] = {}
+_indices_lock = threading.Lock()
+
+
+def _txt(v) -> bytes:
+    return b"" if v is None else str(v).encode("utf-8")
+
+
+def _de_txt(b: bytes) -> str | None:
+    b = b.rstrip(b"\0")
+    return b.decode("utf-8") if b else None
+
+
+def _indices(sbs: str) -> tuple[IndiceOrdenado, IndiceOrdenado]:
+    with _indices_lock:
+        if sbs not in _indices_upc:
+            carpeta = Path(indice_cfg()["carpeta"])
+            _indices_upc[sbs] = (
+                IndiceOrdenado(carpeta, f"upc_{sbs}", 20, "qq20s12s12s12s"),
+                IndiceOrdenado(carpeta, f"desc1_{sbs}", 40, "q"),
+            )
+        return _indices_upc[sbs]
+
+
+def sincronizar_indice_upc(sbs: str = "001", completo: bool = False,
+                           solo_si_vencido: bool = False) -> Dict[str, Any]:
+    """
+    Trae de cms.INVN_SBS las filas modificadas desde la última marca (`modified_date`)
+    y las fusiona en el índice local. Con `completo` se reconstruye desde cero.
+
+    `modified_date` no ve las bajas: si la subsidiaria tiene menos filas que en la
+    pasada anterior, o pasó `reconstruir_seg` desde la última reconstrucción, la
+    pasada incremental se vuelve completa. Usa su propia sesión de Oracle.
+    """
+    cfg = indice_cfg()
+    idx_upc, idx_desc = _indices(sbs)
+    idx_upc.carpeta.mkdir(parents=True, exist_ok=True)
+    with _bloqueo_archivo(idx_upc.carpeta / f"upc_{sbs}.lock"):
+        meta = idx_upc.meta()
+        ahora = time.time()
+        if solo_si_vencido and ahora - float(meta.get("sincronizado") or 0) <= cfg["refresco_seg"]:
+            # otro proceso sincronizó mientras se esperaba el bloqueo
+            return {"sbs": sbs, "omitido": True, **meta}
+
+        conn = adquirir_conexion()
+        cursor = conn.cursor()
+        upcs: Dict[bytes, bytes] = {}
+        descs: Dict[bytes, bytes] = {}
+        try:
+            cursor.execute("SELECT COUNT(*) FROM cms.INVN_SBS WHERE sbs_no = :sbs", {"sbs": sbs})
+            filas_origen = int(cursor.fetchone()[0])
+            if not completo and (
+                filas_origen < int(meta.get("filas_origen") or 0)
+                or ahora - float(meta.get("reconstruido") or 0) > cfg["reconstruir_seg"]
+            ):
+                completo = True
+            marca = None if completo or not meta.get("marca") else datetime.fromisoformat(meta["marca"])
+            sql = (
+                "SELECT local_upc, style_sid, item_sid, cost, tax_code, dcs_code, vend_code, "
+                "description1, modified_date FROM cms.INVN_SBS WHERE sbs_no = :sbs"
+            )
+            binds: Dict[str, Any] = {"sbs": sbs}
+            if marca:
+                # >= para no perder filas confirmadas con la misma marca de tiempo
+                sql += " AND modified_date >= :marca"
+                binds["marca"] = marca
+
+            nueva_marca = marca
+            cursor.arraysize = 5000
+            cursor.execute(sql, binds)
+            while True:
+                filas = cursor.fetchmany()
+                if not filas:
+                    break
+                for upc, style, item, cost, tax, dcs, vend, desc1, modif in filas:
+                    if modif is not None and (nueva_marca is None or modif > nueva_marca):
+                        nueva_marca = modif
+                    if style is None:
+                        continue
+                    k = idx_upc.clave(str(upc)) if upc is not None and item is not None else None
+                    campos = (_txt(cost), _txt(tax), _txt(dcs), _txt(vend))
+                    if k and all(len(c) <= 12 for c in campos[1:]) and len(campos[0]) <= 20:
+                        upcs[k] = idx_upc.rec.pack(k, int(style), int(item), *campos)
+                    kd = idx_desc.clave(str(desc1)) if desc1 is not None else None
+                    if kd and kd not in descs:
+                        descs[kd] = idx_desc.rec.pack(kd, int(style))
+        finally:
+            cursor.close()
+            conn.close()
+
+        meta_nueva = {
+            "marca": nueva_marca.isoformat() if nueva_marca else None,
+            "sincronizado": ahora,
+            "reconstruido": ahora if completo else meta.get("reconstruido"),
+            "filas_origen": filas_origen,
+        }
+        idx_upc.fusionar(upcs, meta_nueva, reemplazar=completo)
+        idx_desc.fusionar(descs, meta_nueva, conservar_existentes=True, reemplazar=completo)
+        return {"sbs": sbs, "completo": completo, "upcs": len(upcs), "descripciones": len(descs),
+                **meta_nueva}
+
+
+_executor_indice: ThreadPoolExecutor | None = None
+_sync_en_curso: set[str] = set()
+
+
+def _sincronizar_y_liberar(sbs: str):
+    try:
+        res = sincronizar_indice_upc(sbs, solo_si_vencido=True)
+        if not res.get("omitido"):
+            logging.info("Índice UPC %s sincronizado: %s UPC (completo=%s)", sbs, res["upcs"], res["completo"])
+    except Exception as exc:
+        logging.warning("No se pudo sincronizar el índice UPC: %s", exc)
+    finally:
+        with _indices_lock:
+            _sync_en_curso.discard(sbs)
+
+
+def sincronizar_en_segundo_plano(sbs: str) -> bool:
+    """Encola una sincronización de `sbs` si no hay otra en curso en este proceso."""
+    global _executor_indice
+    with _indices_lock:
+        if sbs in _sync_en_curso:
+            return False
+        _sync_en_curso.add(sbs)
+        if _executor_indice is None:
+            _executor_indice = ThreadPoolExecutor(max_workers=1, thread_name_prefix="neptuno-indice")
+    _executor_indice.submit(_sincronizar_y_liberar, sbs)
+    return True
+
+
+def preparar_indice_upc(sbs: str) -> bool:
+    """
+    Antes de cada corrida: remapea si cambió y, si la última pasada es vieja, encola
+    la sincronización sin esperarla. Mientras el índice no exista, False: esa
+    corrida consulta todo en Oracle.
+    """
+    cfg = indice_cfg()
+    if not cfg.get("habilitado"):
+        return False
+    idx_upc, idx_desc = _indices(sbs)
+    meta = idx_upc.meta()
+    if time.time() - float(meta.get("sincronizado") or 0) > cfg["refresco_seg"]:
+        sincronizar_en_segundo_plano(sbs)
+    if meta.get("gen") is None:
+        return False
+    idx_upc.recargar_si_cambio()
+    idx_desc.recargar_si_cambio()
+    return True
+
+
+def resolver_upcs(cursor, sbs: str, upcs, usar_indice: bool = False) -> Dict[str, tuple]:
+    """Como buscar_upcs, pero primero en el índice local; a Oracle sólo van los faltantes."""
+    if not usar_indice:
+        res = buscar_upcs(cursor, sbs, upcs)
+        contar("upc_resueltos", len(res), origen="oracle")
+        return res
+    idx_upc = _indices(sbs)[0]
+    res: Dict[str, tuple] = {}
+    faltan = []
+    for upc in upcs:
+        rec = idx_upc.buscar(upc)
+        if rec is None:
+            faltan.append(upc)
+        else:
+            style, item, cost, tax, dcs, vend = rec
+            res[upc] = (style, item, _de_txt(cost), _de_txt(tax), _de_txt(dcs), _de_txt(vend))
+    contar("upc_resueltos", len(res), origen="indice")
+    if faltan:
+        encontrados = buscar_upcs(cursor, sbs, faltan)
+        contar("upc_resueltos", len(encontrados), origen="oracle")
+        res.update(encontrados)
+    return res
+
+
+def resolver_desc1(cursor, sbs: str, descs, usar_indice: bool = False) -> Dict[str, str]:
+    """Como buscar_desc1, pero primero en el índice local."""
+    if not usar_indice:
+        return buscar_desc1(cursor, sbs, descs)
+    idx_desc = _indices(sbs)[1]
+    res: Dict[str, str] = {}
+    faltan = []
+    for d in descs:
+        rec = idx_desc.buscar(d)
+        if rec is None:
+            faltan.append(d)
+        else:
+            res[d] = str(rec[0])
+    if faltan:
+        res.update(buscar_desc1(cursor, sbs, faltan))
+    return res
+
+
+def estado_indice_upc(sbs: str = "001") -> Dict[str, Any]:
+    idx_upc, idx_desc = _indices(sbs)
+    return {"habilitado": bool(indice_cfg().get("habilitado")),
+            "upc": idx_upc.meta(), "desc1": idx_desc.meta()}
+
+
+# --- Huellas para la generación incremental ---
+class HuellasCatalogo:
+    """
+    Huella (blake2b de 16 bytes) de los valores mapeados por la plantilla para cada
+    UPC, tal como salieron en la última generación exitosa. Una fila cuya huella
+    no cambió ya se envió igual y se omite; el resto se genera y, al terminar el
+    XML, sus huellas se fusionan en el índice ordenado `huellas_<sbs>`.
+    Con `registrar_completas` una generación completa también las registra (todas
+    sus filas salieron), así la siguiente incremental compara contra lo último que
+    se envió de verdad.
+
+    La plantilla (campos y su orden) entra en la huella: si cambia el mapeo,
+    todas las filas cuentan como modificadas.
+    """
+
+    def __init__(self, carpeta, sbs: str, campos: List[str]):
+        self.indice = IndiceOrdenado(carpeta, f"huellas_{sbs}", 20, "16s")
+        self.indice.recargar_si_cambio()
+        self._base = hashlib.blake2b("\x1f".join(campos).encode("utf-8"), digest_size=16)
+        self._pendientes: Dict[bytes, bytes] = {}
+        self.nuevas = self.modificadas = self.omitidas = 0
+
+    def huella(self, valores: List[str]) -> bytes:
+        h = self._base.copy()
+        for v in valores:
+            h.update(b"\x1e")
+            h.update(v.encode("utf-8"))
+        return h.digest()
+
+    def filtrar(self, upcs: List[str], valores: List[List[str]]) -> List[int]:
+        """Posiciones de las filas nuevas o modificadas (las demás se cuentan como omitidas)."""
+        quedan = []
+        for i, (upc, vals) in enumerate(zip(upcs, valores)):
+            huella = self.huella(vals)
+            previa = self.indice.buscar(upc)
+            if previa is not None and previa[0] == huella:
+                self.omitidas += 1
+                continue
+            if previa is None:
+                self.nuevas += 1
+            else:
+                self.modificadas += 1
+            k = self.indice.clave(upc)        # UPC que no entran en la clave se generan siempre
+            if k is not None:
+                self._pendientes[k] = self.indice.rec.pack(k, huella)
+            quedan.append(i)
+        return quedan
+
+    def registrar(self, upcs: List[str], valores: List[List[str]]):
+        """Generación completa: todas las filas salen, sus huellas pasan a ser las vigentes."""
+        for upc, vals in zip(upcs, valores):
+            k = self.indice.clave(upc)
+            if k is not None:
+                self._pendientes[k] = self.indice.rec.pack(k, self.huella(vals))
+
+    def confirmar(self):
+        """Guarda las huellas de lo generado; llamar sólo con el XML ya escrito."""
+        if not self._pendientes:
+            return
+        self.indice.carpeta.mkdir(parents=True, exist_ok=True)
+        with _bloqueo_archivo(self.indice.carpeta / f"{self.indice.nombre}.lock"):
+            self.indice.fusionar(self._pendientes, {"actualizado": time.time()})
+        self._pendientes = {}
+
+    def resumen(self) -> Dict[str, int]:
+        return {"omitidas": self.omitidas, "nuevas": self.nuevas, "modificadas": self.modificadas}
+
+
+# --- Lectura en streaming de archivos subidos ---
+# El archivo se recorre por bloques: nunca se decodifica entero ni se copia en
+# memoria; las filas se procesan en ventanas de tamaño acotado.
+BLOQUE_LECTURA = 1 << 16
+VENTANA_FILAS = 5000
+
+
+# caracteres que str.splitlines() toma como fin de línea
+_FINES_LINEA = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
+
+def _bloques_lineas(stream, encoding: str = "latin-1", tam: int = BLOQUE_LECTURA):
+    """Listas de líneas completas (sin fin de línea) por cada bloque leído del stream."""
+    dec = codecs.getincrementaldecoder(encoding)()
+    resto = ""
+    crono = _cronometro.get()
+    while True:
+        t0 = time.perf_counter()
+        bloque = stream.read(tam)
+        texto = resto + dec.decode(bloque, final=not bloque)
+        lineas = texto.splitlines()
+        if crono is not None:
+            crono.sumar_tiempo("decodificacion", time.perf_counter() - t0)
+        if not bloque:
+            if lineas:
+                yield lineas
+            return
+        # la última línea puede estar incompleta, o terminar en un '\r' cuyo
+        # '\n' llega en el próximo bloque: se guarda para unirla con lo que sigue
+        if not texto or texto[-1] not in _FINES_LINEA:
+            resto = lineas.pop() if lineas else ""
+        elif texto[-1] == "\r":
+            resto = lineas.pop() + "\r"
+        else:
+            resto = ""
+        if lineas:
+            yield lineas
+
+
+def _iter_lineas(stream, encoding: str = "latin-1", tam: int = BLOQUE_LECTURA):
+    """Líneas (sin fin de línea) de un stream binario; mismo corte que str.splitlines()."""
+    return chain.from_iterable(_bloques_lineas(stream, encoding, tam))
+
+
+def _ventanas(iterable, tam: int = VENTANA_FILAS):
+    """Agrupa un iterable en listas de hasta `tam` elementos."""
+    it = iter(iterable)
+    while lote := list(islice(it, tam)):
+        yield lote
+
+
+def _rebobinable(datos):
+    """Devuelve `datos` si admite seek(); si no, lo vuelca a un temporal en disco."""
+    try:
+        if datos.seekable():
+            return datos
+    except AttributeError:
+        pass
+    tmp = tempfile.TemporaryFile()
+    shutil.copyfileobj(datos, tmp, BLOQUE_LECTURA)
+    tmp.seek(0)
+    return tmp
+
+
+# --- Validación masiva de columnas y longitudes ---
+# Las reglas se compilan una vez desde campos_maestros + plantilla y se aplican
+# sobre bloques enteros de líneas con arreglos NumPy (conteo de columnas y
+# largo de cada campo); el reporte junta todos los errores del archivo.
+BLOQUE_VALIDACION = 1 << 20            # bytes leídos por bloque
+MAX_ERRORES = 200                      # errores detallados en el reporte
+ERRORES_EN_MENSAJE = 20                # errores listados en el texto del error
+
+MENSAJES_INVENTARIO = {
+    "columnas": "Línea {linea}: se esperaban {esperados} campos según "
+                "su plantilla, pero se encontraron {encontrados}.",
+    "longitud": "Línea {linea}, campo #{campo} ({rpro}): longitud "
+                "{largo} supera el máximo de {maximo}.",
+}
+MENSAJES_TO = {
+    "columnas": "Línea {linea}: se esperaban {esperados} campos "
+                "pero se encontraron {encontrados}.",
+    "longitud": "Línea {linea}, campo #{campo} ({rpro}): "
+                "longitud {largo} supera máximo {maximo}.",
+}
+# hallazgos de referencias: los mismos textos en la generación y en /prevalidar
+MENSAJES_REFERENCIAS = {
+    "dcs": "Línea {linea}: DCS_CODE '{valor}' no existe en la base de datos",
+    "vendor": "Línea {linea}: VEND_CODE '{valor}' no existe en la base de datos",
+    "upc_duplicado": "Línea {linea}: UPC '{upc}' repetido (primera vez en la línea {primera})",
+}
+
+_SIN_LIMITE = np.iinfo(np.int64).max
+
+
+class ValidadorLineas:
+    """
+    Reglas de estructura compiladas: columnas esperadas y largo máximo por posición.
+
+        v = ValidadorLineas(campos, maestros(), ",", MENSAJES_INVENTARIO)
+        reporte = v.validar(stream)      # {"lineas", "total_errores", "errores"}
+    """
+
+    def __init__(self, campos: List[str], campos_maestros: List[Dict[str, Any]],
+                 delimitador: str, mensajes: Dict[str, str], max_errores: int = MAX_ERRORES):
+        largos = {c["rpro"]: c.get("len") for c in campos_maestros}
+        self.campos = list(campos)
+        self.delim = delimitador
+        self.mensajes = mensajes
+        self.max_errores = max_errores
+        self.esperados = len(self.campos)
+        # sólo cuentan los largos enteros (hay maestros con textos como "Fecha")
+        self.maximos = np.array(
+            [l if isinstance(l, int) and not isinstance(l, bool) else _SIN_LIMITE
+             for l in (largos.get(r) for r in self.campos)],
+            dtype=np.int64,
+        )
+        self.con_limite = bool(self.esperados and (self.maximos < _SIN_LIMITE).any())
+        # una línea de largo <= umbral no puede tener ningún campo excedido
+        self.umbral = int(self.maximos.min()) + self.esperados - 1 if self.con_limite else 0
+
+    def _error(self, tipo: str, linea: int, **datos) -> Dict[str, Any]:
+        return {"linea": linea, "tipo": tipo,
+                "mensaje": self.mensajes[tipo].format(linea=linea, **datos), **datos}
+
+    def _validar_bloque(self, lineas: List[str], base: int, reporte: Dict[str, Any]):
+        n, esp = len(lineas), self.esperados
+        cols = np.fromiter((l.count(self.delim) for l in lineas), dtype=np.int64, count=n) + 1
+        ok = cols == esp
+        malas = np.flatnonzero(~ok)
+
+        fil = col = sospechosas = np.empty(0, dtype=np.int64)
+        if self.con_limite:
+            largo = np.fromiter(map(len, lineas), dtype=np.int64, count=n)
+            sospechosas = np.flatnonzero(ok & (largo > self.umbral))
+            if sospechosas.size:
+                sub = [lineas[i] for i in sospechosas]
+                largos = np.fromiter(
+                    map(len, chain.from_iterable(l.split(self.delim) for l in sub)),
+                    dtype=np.int64, count=len(sub) * esp,
+                ).reshape(len(sub), esp)
+                fil, col = np.nonzero(largos > self.maximos)
+
+        total = malas.size + fil.size
+        if not total:
+            return
+        reporte["total_errores"] += total
+        restantes = self.max_errores - len(reporte["errores"])
+        if restantes <= 0:
+            return
+
+        # orden del archivo: por línea y, dentro de la línea, por campo
+        lin_err = np.concatenate([malas, sospechosas[fil]])
+        campo_err = np.concatenate([np.zeros(malas.size, dtype=np.int64), col + 1])
+        orden = np.lexsort((campo_err, lin_err))[:restantes]
+        for k in orden:
+            i, c = int(lin_err[k]), int(campo_err[k])
+            if c == 0:
+                reporte["errores"].append(self._error(
+                    "columnas", base + i + 1, esperados=esp, encontrados=int(cols[i])))
+            else:
+                val = lineas[i].split(self.delim)[c - 1]
+                reporte["errores"].append(self._error(
+                    "longitud", base + i + 1, campo=c, rpro=self.campos[c - 1],
+                    largo=len(val), maximo=int(self.maximos[c - 1])))
+
+    def validar(self, stream) -> Dict[str, Any]:
+        """Recorre el stream completo y devuelve el reporte de errores (acotado a max_errores)."""
+        reporte: Dict[str, Any] = {"lineas": 0, "total_errores": 0, "errores": []}
+        for lineas in _bloques_lineas(stream, tam=BLOQUE_VALIDACION):
+            with etapa("validacion"):
+                self._validar_bloque(lineas, reporte["lineas"], reporte)
+            reporte["lineas"] += len(lineas)
+        return reporte
+
+    def exigir(self, stream) -> int:
+        """Valida y, si hay errores, lanza ErrorValidacion con el reporte; devuelve las líneas."""
+        reporte = self.validar(stream)
+        if reporte["total_errores"]:
+            raise ErrorValidacion(_resumen_errores(reporte), reporte)
+        return reporte["lineas"]
+
+
+def _resumen_errores(reporte: Dict[str, Any]) -> str:
+    textos = [e["mensaje"] for e in reporte["errores"][:ERRORES_EN_MENSAJE]]
+    faltan = reporte["total_errores"] - len(textos)
+    if faltan > 0:
+        textos.append(f"… y {faltan} errores más.")
+    return "\n".join(textos)
+
+
+# --- Plan de mapeo compilado ---
+# La plantilla y el catálogo de campos se resuelven una sola vez por versión de
+# config.json: durante la generación cada fila sólo se indexa por posición.
+class PlanMapeo:
+    """
+    Plantilla resuelta contra sus campos maestros. Por campo, en el orden de
+    las columnas del archivo: rpro, sección destino y número de UDF;
+    `columna` da la posición de cada rpro y `validador` las reglas de
+    estructura (cantidad de columnas y largo máximo) ya compiladas.
+    """
+
+    def __init__(self, plantilla_cfg: List[Dict[str, Any]], campos_maestros: List[Dict[str, Any]],
+                 seccion_defecto: str, mensajes: Dict[str, str]):
+        catalogo = {c["rpro"]: c for c in campos_maestros}
+        self.fuente = plantilla_cfg
+        self.rpros = tuple(c["rpro"] for c in plantilla_cfg)
+        self.secciones = tuple(catalogo.get(r, {}).get("section", seccion_defecto) for r in self.rpros)
+        self.udfs = tuple(r.split("_", 1)[1] if "_" in r else "" for r in self.rpros)
+        # (rpro, sección, nro. de UDF) tal como los recorre _elemento_inventario
+        self.campos = tuple(zip(self.rpros, self.secciones, self.udfs))
+        self.columna = {r: i for i, r in enumerate(self.rpros)}
+        self._maestros = campos_maestros
+        self._mensajes = mensajes
+        self._validadores: Dict[tuple, ValidadorLineas] = {}
+
+    def validador(self, delimitador: str, max_errores: int = MAX_ERRORES) -> ValidadorLineas:
+        clave = (delimitador, max_errores)
+        v = self._validadores.get(clave)
+        if v is None:
+            v = self._validadores[clave] = ValidadorLineas(
+                self.rpros, self._maestros, delimitador, self._mensajes, max_errores)
+        return v
+
+    def fila(self, columnas: List[str]) -> List[str]:
+        """Columnas de una línea ajustadas a la plantilla (las que faltan, vacías)."""
+        n = len(self.rpros)
+        return columnas[:n] if len(columnas) >= n else columnas + [""] * (n - len(columnas))
+
+
+class PlanTO:
+    """Plantilla de Transfer Orders compilada: campos de la línea H, de las I y reglas de validación."""
+
+    def __init__(self, cfg: Dict[str, list], campos_maestros: List[Dict[str, Any]]):
+        catalogo = {c["rpro"]: c for c in campos_maestros}
+
+        def resolver(lista):
+            objetos = []
+            for idx, r in enumerate(lista):
+                r = r["rpro"] if isinstance(r, dict) else r   # guardar_config_to guarda objetos
+                m = catalogo.get(r)
+                if m:
+                    objetos.append({"rpro": m["rpro"], "visual": m["visual"],
+                                    "section": m["section"], "pos": idx})
+            return objetos
+
+        self.plantilla = {"header": resolver(cfg.get("header", [])),
+                          "detail": resolver(cfg.get("detail", []))}
+        self.header = PlanMapeo(self.plantilla["header"], campos_maestros, "TO", MENSAJES_TO)
+        self.detail = PlanMapeo(self.plantilla["detail"], campos_maestros, "INVN_BASE_ITEM", MENSAJES_TO)
+        # todas las líneas se validan contra header + detail
+        self.lineas = PlanMapeo(self.plantilla["header"] + self.plantilla["detail"],
+                                campos_maestros, "TO", MENSAJES_TO)
+
+
+_planes: Dict[str, tuple[int, Any]] = {}
+_planes_lock = threading.Lock()
+
+
+def _plan_cacheado(nombre: str, construir):
+    version = config_version()
+    with _planes_lock:
+        previo = _planes.get(nombre)
+        if previo is not None and previo[0] == version:
+            return previo[1]
+    plan = construir()
+    with _planes_lock:
+        _planes[nombre] = (version, plan)
+    return plan
+
+
+def plan_inventario(plantilla_cfg: List[Dict[str, Any]] | None = None) -> PlanMapeo:
+    """Plan de la plantilla de inventario configurada (o de `plantilla_cfg`, si es otra)."""
+    plan = _plan_cacheado("inventario", lambda: PlanMapeo(
+        plantilla(), maestros(), "INVN_SBS", MENSAJES_INVENTARIO))
+    if plantilla_cfg is not None and plantilla_cfg != plan.fuente:
+        return PlanMapeo(plantilla_cfg, maestros(), "INVN_SBS", MENSAJES_INVENTARIO)
+    return plan
+
+
+def plan_to() -> PlanTO:
+    return _plan_cacheado("to", lambda: PlanTO(load_config_to(), load_campos_maestros_to()))
+
+
+# --- Resolución de SID por corrida ---
+class ResolucionCorrida:
+    """
+    Memo de una generación: cada UPC y cada description1 distintos se resuelven
+    (índice/Oracle o generación de SID) una sola vez en todo el archivo.
+
+    - UPC → (style_sid, item_sid), tanto los existentes como los generados;
+      un UPC repetido en el archivo reutiliza lo asignado en su primera línea.
+    - description1 → style_sid: el existente en la base o, si es un estilo
+      nuevo, el generado para su primera fila; todas sus tallas/colores lo comparten.
+      Con style_sid_mode "both" el estilo nuevo es el par (description1, description2).
+    """
+
+    def __init__(self, cursor, sbs: str, indice: bool, sid_cfg: Dict[str, str]):
+        self.cursor, self.sbs, self.indice = cursor, sbs, indice
+        self.modo_item = sid_cfg.get("item_sid_mode", "upc").lower()
+        self.modo_estilo = sid_cfg.get("style_sid_mode", "desc1").lower()
+        self.items: Dict[str, tuple[str, str]] = {}
+        self.estilos: Dict[str, str] = {}             # desc1 → style_sid existente en la base
+        self.generados: Dict[Any, str] = {}           # clave de estilo nuevo → style_sid
+        self._desc_consultadas: set[str] = set()
+        self._primera_linea: Dict[str, int] = {}
+        self.duplicados: Dict[str, List[int]] = {}
+
+    def consultar_upcs(self, upcs):
+        """Busca en índice/Oracle sólo los UPC que todavía no se vieron en la corrida."""
+        faltan = {u for u in upcs if u not in self._primera_linea and u not in self.items}
+        if faltan:
+            with etapa("consultas_oracle"):
+                encontrados = resolver_upcs(self.cursor, self.sbs, faltan, self.indice)
+            for upc, r in encontrados.items():
+                self.items[upc] = (str(r[0]), str(r[1]))
+
+    def _clave_estilo(self, desc1: str, desc2: str):
+        return (desc1, desc2) if self.modo_estilo == "both" else desc1
+
+    def _estilo(self, desc1: str, desc2: str) -> str:
+        sid = self.estilos.get(desc1)
+        return sid if sid is not None else self.generados[self._clave_estilo(desc1, desc2)]
+
+    def _nuevos_estilos(self, pendientes: Dict[Any, tuple[str, str]]):
+        """Genera style_sid para estilos nuevos; `pendientes` = clave → (desc1, desc2) de su 1.ª fila."""
+        claves = list(pendientes)
+        if self.modo_estilo == "both":
+            sids = sid_from_both_many([d1 for d1, _ in pendientes.values()],
+                                      [d2 for _, d2 in pendientes.values()])
+        elif self.modo_estilo == "random":
+            sids = sid_random_many(len(claves))
+        else:                                         # 'desc1'
+            sids = sid_from_desc_many(claves)
+        self.generados.update(zip(claves, sids))
+
+    def asignar(self, filas: List[tuple[int, str, str, str]]) -> List[tuple[str, str]]:
+        """(linea, upc, desc1, desc2) en orden → (style_sid, item_sid) por fila."""
+        nuevos: Dict[str, tuple[str, str]] = {}       # upc → (desc1, desc2), 1.ª aparición
+        for linea, upc, desc1, desc2 in filas:
+            primera = self._primera_linea.setdefault(upc, linea)
+            if primera != linea:
+                self.duplicados.setdefault(upc, [primera]).append(linea)
+            elif upc not in self.items:
+                nuevos[upc] = (desc1, desc2)
+
+        if nuevos:
+            # style_sid de DESC1 ya existentes, sólo para los UPC nuevos
+            desc_keys = {d1 for d1, _ in nuevos.values()
+                         if d1 not in self.estilos and d1 not in self._desc_consultadas}
+            if desc_keys:
+                self._desc_consultadas |= desc_keys
+                with etapa("consultas_oracle"):
+                    self.estilos.update(resolver_desc1(self.cursor, self.sbs, desc_keys, self.indice))
+            with etapa("sid"):
+                pendientes: Dict[Any, tuple[str, str]] = {}
+                for d1, d2 in nuevos.values():
+                    clave = self._clave_estilo(d1, d2)
+                    if d1 not in self.estilos and clave not in self.generados:
+                        pendientes.setdefault(clave, (d1, d2))
+                if pendientes:
+                    self._nuevos_estilos(pendientes)
+
+                upcs = list(nuevos)
+                if self.modo_item == "random":
+                    item_sids = sid_random_many(len(upcs))
+                else:                                 # 'upc'
+                    item_sids = sid_from_upc_many(upcs)
+                for upc, item_sid in zip(upcs, item_sids):
+                    self.items[upc] = (self._estilo(*nuevos[upc]), item_sid)
+            contar("sid_generados", len(nuevos))
+
+        return [self.items[upc] for _, upc, _, _ in filas]
+
+    def resumen_duplicados(self, limite: int = MAX_ERRORES) -> Dict[str, Any]:
+        return {
+            "total": len(self.duplicados),
+            "upcs": [{"upc": u, "lineas": l}
+                     for u, l in islice(self.duplicados.items(), limite)],
+        }
+
+
 # --- XML Helpers ---
 
 def _indent(el: ET.Element, lvl: int = 0):
@@ -245,6 +1928,176 @@ def _indent(el: ET.Element, lvl: int = 0):
         if lvl and (not el.tail or not el.tail.strip()):
             el.tail = i
 
+
+class XmlStreamWriter:
+    """
+    Escritor incremental de XML: cada bloque se escribe a disco en cuanto está listo.
+
+    Con el formato "legible" produce exactamente lo mismo que `_indent(root)` +
+    `ElementTree.write(..., xml_declaration=True)`, pero sin tener el árbol
+    completo en memoria; con "compacto" se omite la indentación y los nodos van
+    seguidos. El contenido (elementos, atributos y orden) es el mismo con
+    cualquier perfil. Si la ruta termina en .xml.gz o .zip se comprime al
+    vuelo (ver `EXTENSIONES_SALIDA`). Se escribe sobre `<ruta>.part` y sólo al terminar sin errores se renombra a
+    la ruta final.
+
+        with XmlStreamWriter(salida) as xw:
+            xw.abrir("DOCUMENT"); xw.abrir("INVENTORYS")
+            for ...:
+                xw.escribir(inv)        # ET.Element ya armado
+    """
+
+    def __init__(self, path, compacto: bool | None = None):
+        self.path = str(path)
+        self._tmp = self.path + ".part"
+        if compacto is None:
+            compacto = perfil_salida_cfg()["formato"] == "compacto"
+        self.compacto = compacto
+        compresion = next((c for c, ext in EXTENSIONES_SALIDA.items()
+                           if c != "ninguna" and self.path.endswith(ext)), "ninguna")
+        self._capas: list = []           # destinos bajo el texto, en orden de cierre
+        self._fh = self._abrir_destino(compresion)
+        self._fh.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        self._pila: list[list] = []      # [tag, attrs, ya_abierto]
+        # segundos en _indent, tostring y write (se suman al Cronometro al cerrar)
+        self._crono = _cronometro.get()
+        self._tiempos = [0.0, 0.0, 0.0]
+
+    def _abrir_destino(self, compresion: str):
+        # mismos parámetros que usa ElementTree.write al recibir un nombre de archivo
+        texto = dict(encoding="utf-8", errors="xmlcharrefreplace")
+        if compresion == "ninguna":
+            return open(self._tmp, "w", **texto)
+        crudo = open(self._tmp, "wb")
+        self._capas.append(crudo)
+        nombre = Path(self.path).name
+        try:
+            if compresion == "gzip":
+                # el nombre guardado en la cabecera es el del .xml, no el del .part
+                binario = gzip.GzipFile(filename=nombre.removesuffix(".gz"), mode="wb", fileobj=crudo)
+            else:
+                zf = zipfile.ZipFile(crudo, "w", zipfile.ZIP_DEFLATED)
+                self._capas.append(zf)
+                binario = zf.open(Path(nombre).with_suffix(".xml").name, "w", force_zip64=True)
+        except Exception:
+            crudo.close()
+            raise
+        self._capas.append(binario)
+        return io.TextIOWrapper(binario, **texto)
+
+    def _cerrar_destino(self):
+        try:
+            self._fh.close()
+        finally:
+            while self._capas:
+                self._capas.pop().close()
+
+    @staticmethod
+    def _sep(lvl: int, compacto: bool = False) -> str:
+        return "\n" + lvl * "  " if lvl and not compacto else ""
+
+    def _abrir_pendientes(self):
+        for lvl, nodo in enumerate(self._pila):
+            if not nodo[2]:
+                vacio = ET.tostring(ET.Element(nodo[0], nodo[1]), encoding="unicode")
+                self._fh.write(self._sep(lvl, self.compacto) + vacio[:-3] + ">")
+                nodo[2] = True
+
+    def abrir(self, tag: str, attrs: Dict[str, str] | None = None):
+        """Abre un contenedor; su etiqueta se emite al llegar el primer hijo."""
+        self._abrir_pendientes()
+        self._pila.append([tag, dict(attrs or {}), False])
+
+    @classmethod
+    def renderizar(cls, el: ET.Element, lvl: int, compacto: bool = False) -> str:
+        """Texto de `el` tal como se escribe en el nivel `lvl` (sirve fuera del escritor)."""
+        if not compacto:
+            _indent(el, lvl)
+        el.tail = None
+        return cls._sep(lvl, compacto) + ET.tostring(el, encoding="unicode")
+
+    @property
+    def nivel(self) -> int:
+        """Nivel que tendrán los hijos del contenedor abierto."""
+        return len(self._pila)
+
+    def escribir(self, el: ET.Element):
+        """Escribe `el` completo como hijo del contenedor abierto."""
+        self._abrir_pendientes()
+        lvl = len(self._pila)
+        t0 = time.perf_counter()
+        if not self.compacto:
+            _indent(el, lvl)
+        el.tail = None
+        t1 = time.perf_counter()
+        texto = self._sep(lvl, self.compacto) + ET.tostring(el, encoding="unicode")
+        t2 = time.perf_counter()
+        self._fh.write(texto)
+        t = self._tiempos
+        t[0] += t1 - t0
+        t[1] += t2 - t1
+        t[2] += time.perf_counter() - t2
+
+    def escribir_texto(self, texto: str):
+        """Escribe hijos ya renderizados con `renderizar` al nivel actual."""
+        if texto:
+            self._abrir_pendientes()
+            t0 = time.perf_counter()
+            self._fh.write(texto)
+            self._tiempos[2] += time.perf_counter() - t0
+
+    def _publicar_tiempos(self):
+        if self._crono is not None:
+            for nombre, seg in zip(("indentado", "serializacion", "escritura"), self._tiempos):
+                if seg:
+                    self._crono.sumar_tiempo(nombre, seg)
+            self._tiempos = [0.0, 0.0, 0.0]
+
+    def cerrar(self):
+        tag, attrs, abierto = self._pila.pop()
+        lvl = len(self._pila)
+        if abierto:
+            self._fh.write(("" if self.compacto else "\n" + lvl * "  ") + f"</{tag}>")
+        else:
+            self._fh.write(self._sep(lvl, self.compacto)
+                           + ET.tostring(ET.Element(tag, attrs), encoding="unicode"))
+        if not self._pila:
+            self._fh.write("\n")
+
+    def finalizar(self):
+        if self._fh.closed:
+            return
+        while self._pila:
+            self.cerrar()
+        t0 = time.perf_counter()
+        self._cerrar_destino()
+        os.replace(self._tmp, self.path)
+        self._tiempos[2] += time.perf_counter() - t0
+        self._publicar_tiempos()
+
+    def abortar(self):
+        if self._fh.closed:
+            return
+        self._publicar_tiempos()
+        try:
+            self._cerrar_destino()
+        except OSError:
+            pass
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finalizar()
+        else:
+            self.abortar()
+        return False
+
 # ── Crear XML con sección dinámica (Función actualmente no utilizada) ────────────────
 '''
 def crear_xml(df: pd.DataFrame, plan: List[Dict[str, Any]]) -> ET.Element:
@@ -321,6 +2174,12 @@ def crear_xml(df: pd.DataFrame, plan: List[Dict[str, Any]]) -> ET.Element:
 # ─────────────────────────────────────────────────────────────────────────────
 
 # --- Endpoints Flask ---
+def opcion_formulario(nombre: str) -> bool | None:
+    """Casilla opcional del formulario (la última si viene repetida); None si no vino."""
+    valores = request.form.getlist(nombre)
+    return valores[-1].lower() in ("1", "true", "on", "si", "sí") if valores else None
+
+
 @app.route("/")
 def home():
     return render_template(
@@ -331,7 +2190,9 @@ def home():
         maestros_to=load_campos_maestros_to(),
         plantilla_to=load_config_to(),
         maestros=maestros(),
-        plantilla=plantilla()
+        plantilla=plantilla(),
+        delta_cfg=delta_cfg(),
+        perfil_salida=perfil_salida_cfg()
     )
 
 @app.route("/generar_to", methods=["POST"])
@@ -343,177 +2204,243 @@ def generar_to():
     if f.filename == '':
         return jsonify(error="No se ha seleccionado ningún archivo"), 400
 
+    try:
+        res = procesar_to(f.stream, archivo_por_to=opcion_formulario("archivo_por_to"))
+    except ErrorValidacion as e:
+        return e.respuesta()
+    except Exception as ex:
+        return jsonify(error=f"Error al generar XML TO: {ex}"), 500
+
+    return jsonify(status="success", message="XML TO generado correctamente",
+                   path=res["path"], paths=res["paths"], transfers=res["transfers"],
+                   tiempos=res["tiempos"])
+
+
+class SalidaTO:
+    """
+    Destino de los <TO> de un archivo: todos dentro de un mismo <DOCUMENT> o
+    un archivo TO###.xml por cada uno. Si la generación falla no queda
+    ningún archivo a medias ni los TO ya terminados de esa subida.
+    """
+
+    def __init__(self, carpeta, archivo_por_to: bool = False):
+        self.carpeta = carpeta
+        self.archivo_por_to = archivo_por_to
+        self.perfil = perfil_salida_cfg()     # el mismo para todos los archivos de la subida
+        self.rutas: List[str] = []
+        self._xw: XmlStreamWriter | None = None
+        self._to_abierto = False
+
+    def _nuevo_archivo(self):
+        ruta = reservar_salida(self.carpeta, "TO", EXTENSIONES_SALIDA[self.perfil["compresion"]])
+        self._xw = XmlStreamWriter(ruta, self.perfil["formato"] == "compacto")
+        self._xw.abrir("DOCUMENT")
+        self.rutas.append(str(ruta))
+
+    def abrir_to(self, hdr_attrs: Dict[str, str]):
+        """Empieza un <TO>; una línea H sin S previa cierra el anterior."""
+        self.cerrar_to()
+        if self._xw is None:
+            self._nuevo_archivo()
+        self._xw.abrir("TO")
+        self._xw.escribir(ET.Element("TO_HDR", hdr_attrs))
+        self._xw.abrir("TO_ITEMS")
+        self._to_abierto = True
+
+    def escribir(self, el: ET.Element):
+        self._xw.escribir(el)
+
+    def cerrar_to(self):
+        if not self._to_abierto:
+            return
+        self._to_abierto = False
+        if self.archivo_por_to:
+            self._xw.finalizar()
+            self._xw = None
+        else:
+            self._xw.cerrar()     # </TO_ITEMS>
+            self._xw.cerrar()     # </TO>
+
+    def finalizar(self) -> List[str]:
+        self.cerrar_to()
+        if self._xw is not None:
+            self._xw.finalizar()
+            self._xw = None
+        return self.rutas
+
+    def abortar(self):
+        if self._xw is not None:
+            self._xw.abortar()
+            self._xw = None
+        for ruta in self.rutas:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+@instrumentado("to")
+def procesar_to(datos, progreso=None, archivo_por_to: bool | None = None) -> Dict[str, Any]:
+    """
+    Valida y genera el XML de Transfer Orders a partir de un stream binario.
+
+    El archivo puede traer varios bloques H/I/S: se generan en un solo
+    <DOCUMENT> o, con `archivo_por_to`, en un archivo por TO. Los UPC se
+    resuelven una sola vez para todos los TO del archivo.
+    """
     # 2) Cargo config CSV y delimitador
     csv_cfg = load_csv_cfg()
     delim   = csv_cfg.get("delimiter", ",")
 
-    # 3) Cargo plantilla TO (solo rpro strings) y maestro de campos
-    raw_tpl   = load_plantilla_to()            # {'header': [...], 'detail': [...]}
-    maestros  = load_campos_maestros_to()       # lista de {rpro,visual,section,len}
-    raw_h     = raw_tpl.get('header', [])
-    raw_i     = raw_tpl.get('detail', [])
+    # 3) Plantilla TO compilada (header, detail y reglas de validación)
+    plan = plan_to()
 
     # 4) Si no hay mapping, abortamos ya que no sabemos qué columnas leer
-    if not raw_h or not raw_i:
-        return jsonify(error="No hay mapping de Header o Detail. Por favor configure ambos y vuelva a intentar."), 400
-
-    # 5) Reconstruyo header_tpl y detail_tpl como listas de objetos completos
-    header_tpl = []
-    for pos, r in enumerate(raw_h):
-        m = next((x for x in maestros if x['rpro'] == r), None)
-        header_tpl.append({
-            'rpro':    r,
-            'visual':  m['visual'] if m else r,
-            'section': m['section'] if m else 'TO',
-            'pos':     pos
-        })
-    detail_tpl = []
-    for pos, r in enumerate(raw_i):
-        m = next((x for x in maestros if x['rpro'] == r), None)
-        detail_tpl.append({
-            'rpro':    r,
-            'visual':  m['visual'] if m else r,
-            'section': m['section'] if m else 'INVN_BASE_ITEM',
-            'pos':     pos
-        })
-
-    # 6) Aplano ambos para validar número y longitudes
-    all_tpl        = header_tpl + detail_tpl
-    campos_rpros   = [c['rpro'] for c in all_tpl]
-    total_expected = len(campos_rpros)
+    if not plan.header.rpros or not plan.detail.rpros:
+        raise ErrorValidacion("No hay mapping de Header o Detail. Por favor configure ambos y vuelva a intentar.")
 
-    campos_meta = {c['rpro']: c.get('len') for c in maestros}
+    # 5) Validación de número de columnas y longitudes (primera pasada, en bloque)
+    datos = _rebobinable(datos)
+    num = plan.lineas.validador(delim).exigir(datos)
 
-    # 7) Leo todo el CSV/TXT en memoria
-    raw = f.stream.read().decode('latin-1').splitlines()
-
-    # 8) Validación de número de columnas y longitudes
-    for num, line in enumerate(raw, start=1):
-        parts = line.split(delim)
-        if len(parts) != total_expected:
-            return jsonify(
-                error=(
-                    f"Línea {num}: se esperaban {total_expected} campos "
-                    f"pero se encontraron {len(parts)}."
-                )
-            ), 400
-        for idx, val in enumerate(parts, start=1):
-            rpro    = campos_rpros[idx-1]
-            max_len = campos_meta.get(rpro)
-            if max_len is not None and len(val) > max_len:
-                return jsonify(
-                    error=(
-                        f"Línea {num}, campo #{idx} ({rpro}): "
-                        f"longitud {len(val)} supera máximo {max_len}."
-                    )
-                ), 400
-
-    # 9) Directorio y nombre de salida
-    out_dir = Path(csv_cfg.get("ruta", str(BASE / "Salida")))
-    out_dir.mkdir(parents=True, exist_ok=True)
-    existing = sorted(out_dir.glob("TO*.xml"))
-    num = int(existing[-1].stem[2:]) + 1 if existing else 1
-    salida = out_dir / f"TO{num:03d}.xml"
-
-    # 10) Reconvierto a BytesIO para reutilizar
-    csv_stream = io.BytesIO("\n".join(raw).encode("latin-1"))
-
-    # 11) Conexión Oracle
-    cfg    = db_cfg()
-    dsn    = (
-        f"(DESCRIPTION=(ADDRESS=(PROTOCOL=TCP)(HOST={cfg['servidor']})"
-        f"(PORT={cfg['puerto']}))(CONNECT_DATA=(SERVICE_NAME={cfg['base_datos']})))"
-    )
-    conn   = oracledb.connect(user=cfg['usuario'], password=cfg['password'], dsn=dsn)
-    cursor = conn.cursor()
+    # 9) Salida: un <DOCUMENT> con todos los TO o un archivo por TO
+    if archivo_por_to is None:
+        archivo_por_to = to_salida_cfg()["archivo_por_to"]
+    salida = SalidaTO(csv_cfg.get("ruta", str(BASE / "Salida")), archivo_por_to)
 
-    # 12) Build XML
-    root    = ET.Element("DOCUMENT")
-    to_node = ET.SubElement(root, "TO")
+    # 10) Segunda pasada sobre el mismo stream
+    datos.seek(0)
+    lineas = _iter_lineas(datos)
 
     # — Header (línea H) —
-    header_line = raw[0]
+    header_line = next(lineas, "")
     if not header_line.startswith("H,"):
-        cursor.close(); conn.close()
-        return jsonify(error="Formato inválido: primera línea debe empezar con 'H,'"), 400
-    vals_hdr = header_line.split(delim)[1:]
-    hdr_attrs = {
-        "to_sid":        sid_random(),
-        "to_type":       "0",
-        "modified_date": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
-        "cms":           "1", "held": "1", "active": "1"
-    }
-    for campo, val in zip(header_tpl, vals_hdr):
-        hdr_attrs[campo['rpro']] = val.strip()
-    ET.SubElement(to_node, "TO_HDR", **hdr_attrs)
-
-    items_node = ET.SubElement(to_node, "TO_ITEMS")
-
-    # — Detalle (líneas I) —
-    for idx, line in enumerate(raw[1:], start=1):
-        parts = line.split(delim)
-        tipo  = parts[0]
-        if tipo == "S":
-            break
-        if tipo != "I":
-            continue
-
-        cols    = parts[1:]
-        upc     = cols[0].strip()
-        ord_qty = cols[1].strip()
-        price   = cols[2].strip() if len(cols) > 2 else ""
-
-        cursor.execute(
-            """
-            SELECT style_sid, item_sid, cost, tax_code, dcs_code, vend_code
-              FROM cms.INVN_SBS
-             WHERE sbs_no    = :1
-               AND local_upc = :2
-            """,
-            (hdr_attrs["sbs_no"], upc)
-        )
-        row = cursor.fetchone()
-        if not row:
-            cursor.close(); conn.close()
-            return jsonify(error=f"Línea detalle {idx}: UPC «{upc}» no existe"), 400
-
-        style_sid, item_sid, cost_db, tax_code_db, dcs_code, vend_code = row
-
-        ti = ET.SubElement(
-            items_node, "TO_ITEM",
-            item_pos=str(idx),
-            item_sid=str(item_sid),
-            price=price,
-            cost=str(cost_db),
-            tax_code=str(tax_code_db)
-        )
-        ET.SubElement(
-            ti, "INVN_BASE_ITEM",
-            item_sid=str(item_sid),
-            upc=upc,
-            style_sid=str(style_sid),
-            dcs_code=str(dcs_code),
-            vend_code=str(vend_code),
-            use_qty_decimals="0",
-            cost=str(cost_db),
-            tax_code=str(tax_code_db)
-        )
-        q = ET.SubElement(ti, "TO_QTYS")
-        ET.SubElement(
-            q, "TO_QTY",
-            store_no=hdr_attrs["sbs_no"],
-            ord_qty=ord_qty,
-            rcvd_qty="0"
-        )
-
-    cursor.close()
-    conn.close()
-
-    # 13) Escritura final
-    _indent(root)
-    ET.ElementTree(root).write(str(salida), encoding="utf-8", xml_declaration=True)
+        raise ErrorValidacion("Formato inválido: primera línea debe empezar con 'H,'")
+
+    def _encabezado(line: str) -> Dict[str, str]:
+        vals_hdr = line.split(delim)[1:]
+        hdr_attrs = {
+            "to_sid":        sid_random(),
+            "to_type":       "0",
+            "modified_date": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+            "cms":           "1", "held": "1", "active": "1"
+        }
+        for rpro, val in zip(plan.header.rpros, vals_hdr):
+            hdr_attrs[rpro] = val.strip()
+        return hdr_attrs
+
+    def _registros():
+        """
+        Recorre los bloques H/I/S del archivo: ("H", atributos) al abrir cada TO,
+        ("I", posición, columnas, sbs, línea) por detalle y ("S",) al cerrarlo.
+        La posición cuenta desde la línea H de su TO; fuera de un bloque se ignora todo.
+        """
+        hdr = _encabezado(header_line)
+        yield ("H", hdr)
+        abierto, pos = True, 0
+        for num_linea, line in enumerate(lineas, start=2):
+            pos += 1
+            parts = line.split(delim)
+            tipo  = parts[0]
+            if tipo == "H":
+                hdr = _encabezado(line)
+                yield ("H", hdr)
+                abierto, pos = True, 0
+            elif not abierto:
+                continue
+            elif tipo == "S":
+                yield ("S",)
+                abierto = False
+            elif tipo == "I":
+                yield ("I", pos, parts[1:], hdr.get("sbs_no", "001"), num_linea)
+
+    # 11) Conexión Oracle (sesión del pool compartido)
+    conn   = adquirir_conexion()
+    cursor = conn.cursor()
+    indices: Dict[str, bool] = {}
+    # (sbs, upc) → fila de INVN_SBS; compartido por todos los TO del archivo
+    encontrados: Dict[tuple[str, str], tuple | None] = {}
+    n_to = detalles = 0
+    try:
+        # 12) XML escrito en streaming: cada <TO_ITEM> va a disco al resolverse
+        for lote in _ventanas(_registros()):
+            # — UPC de la ventana (de todos sus TO) aún no buscados, en bloque por subsidiaria —
+            pendientes: Dict[str, set] = {}
+            for reg in lote:
+                if reg[0] == "I" and (reg[3], reg[2][0].strip()) not in encontrados:
+                    pendientes.setdefault(reg[3], set()).add(reg[2][0].strip())
+            for sbs, upcs in pendientes.items():
+                if sbs not in indices:
+                    with etapa("indice_upc"):
+                        indices[sbs] = preparar_indice_upc(sbs)
+                with etapa("consultas_oracle"):
+                    filas_db = resolver_upcs(cursor, sbs, upcs, indices[sbs])
+                for upc in upcs:
+                    encontrados[(sbs, upc)] = filas_db.get(upc)
+
+            for reg in lote:
+                if reg[0] == "H":
+                    hdr_attrs = reg[1]
+                    n_to += 1
+                    salida.abrir_to(hdr_attrs)
+                    continue
+                if reg[0] == "S":
+                    salida.cerrar_to()
+                    continue
+
+                _, idx, cols, sbs, num_linea = reg
+                upc     = cols[0].strip()
+                ord_qty = cols[1].strip()
+                price   = cols[2].strip() if len(cols) > 2 else ""
+
+                row = encontrados[(sbs, upc)]
+                if not row:
+                    donde = f"Línea detalle {idx}" if n_to == 1 else f"TO {n_to}, línea detalle {idx}"
+                    raise ErrorValidacion(f"{donde}: UPC «{upc}» no existe")
+
+                style_sid, item_sid, cost_db, tax_code_db, dcs_code, vend_code = row
+
+                ti = ET.Element(
+                    "TO_ITEM",
+                    item_pos=str(idx),
+                    item_sid=str(item_sid),
+                    price=price,
+                    cost=str(cost_db),
+                    tax_code=str(tax_code_db)
+                )
+                ET.SubElement(
+                    ti, "INVN_BASE_ITEM",
+                    item_sid=str(item_sid),
+                    upc=upc,
+                    style_sid=str(style_sid),
+                    dcs_code=str(dcs_code),
+                    vend_code=str(vend_code),
+                    use_qty_decimals="0",
+                    cost=str(cost_db),
+                    tax_code=str(tax_code_db)
+                )
+                q = ET.SubElement(ti, "TO_QTYS")
+                ET.SubElement(
+                    q, "TO_QTY",
+                    store_no=hdr_attrs["sbs_no"],
+                    ord_qty=ord_qty,
+                    rcvd_qty="0"
+                )
+                salida.escribir(ti)
+                detalles += 1
+                if progreso and num_linea % 200 == 0:
+                    progreso(num_linea, num)
+        rutas = salida.finalizar()
+    except BaseException:
+        salida.abortar()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
 
-    return jsonify(status="success", message="XML TO generado correctamente", path=str(salida))
+    if progreso:
+        progreso(num, num)
+    return {"path": rutas[0], "paths": rutas, "transfers": n_to, "filas": detalles}
 
 
 
@@ -524,13 +2451,13 @@ def guardar_config_to():
     headers_rpros = request.form.getlist("header[]")
     details_rpros = request.form.getlist("detail[]")
 
-    # 2) Cargo la definición de todos los campos maestros TO
-    maestros = load_campos_maestros_to()  # lista de dicts con 'rpro','visual',...
+    # 2) Índice de los campos maestros TO por rpro
+    catalogo = {m["rpro"]: m for m in load_campos_maestros_to()}
 
     # 3) Armo la lista de objetos para header
     header_list = []
     for idx, rpro in enumerate(headers_rpros):
-        m = next((m for m in maestros if m["rpro"] == rpro), None)
+        m = catalogo.get(rpro)
         visual = m["visual"] if m else rpro
         header_list.append({
             "rpro": rpro,
@@ -541,7 +2468,7 @@ def guardar_config_to():
     # 4) Mismo para detail
     detail_list = []
     for idx, rpro in enumerate(details_rpros):
-        m = next((m for m in maestros if m["rpro"] == rpro), None)
+        m = catalogo.get(rpro)
         visual = m["visual"] if m else rpro
         detail_list.append({
             "rpro": rpro,
@@ -566,18 +2493,30 @@ def save_csv_config():
     data  = request.get_json()
     delim = data.get("delimiter")
     ruta  = data.get("ruta")
+    salida = data.get("salida")
     if delim not in (",", ";", "|"):
         return jsonify(error="Delimiter inválido"), 400
+    if salida is not None and (
+        not isinstance(salida, dict)
+        or salida.get("formato") not in ("legible", "compacto")
+        or salida.get("compresion") not in EXTENSIONES_SALIDA
+    ):
+        return jsonify(error="Perfil de salida inválido"), 400
     cfg = load_csv_cfg()
     cfg["delimiter"] = delim
     if ruta:
         cfg["ruta"] = ruta
+    if salida is not None:
+        cfg["salida"] = {"formato": salida["formato"], "compresion": salida["compresion"]}
     save_csv_cfg(cfg)
     return "", 204
 
 @app.route("/select_folder", methods=["POST"])
 def select_folder():
-
+    try:
+        carpeta = subprocess.check_output(
+            [sys.executable, str(BASE / "choose_dir.py")], text=True
+        ).strip()
     except Exception as exc:
         return jsonify(error=f"No se pudo abrir el diálogo: {exc}"), 500
 
@@ -616,6 +2555,7 @@ def save_connection():
 
 
     _save_section(["database"], data)
+    reset_pool()
 
     # ④ Devolvemos 200 y ok=True para que tu JS lo reconozca como éxito
     return jsonify(ok=True)
@@ -623,15 +2563,64 @@ def save_connection():
 
 @app.route("/test_connection", methods=["POST"])
 def test_connection():
-    config = db_cfg()
     try:
-        dsn = f"{config['servidor']}:{config['puerto']}/{config['base_datos']}"
-        conn = oracledb.connect(user=config["usuario"], password=config["password"], dsn=dsn)
-        conn.close()
+        conn = adquirir_conexion()
+        try:
+            conn.ping()
+        finally:
+            conn.close()
         return jsonify(status="success", message="Conexión exitosa")
     except Exception as e:
         return jsonify(status="error", message=f"Error de conexión: {e}"), 500
 
+@app.route("/pool-stats", methods=["GET"])
+def pool_stats():
+    return jsonify(estado_pool())
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    pool = estado_pool()
+    ref = ref_cache.estado()
+    extra = {
+        "neptuno_pool_ocupadas": pool.get("busy", 0),
+        "neptuno_pool_abiertas": pool.get("open", 0),
+        "neptuno_pool_esperas": pool["waits"],
+        "neptuno_ref_cache_hits": ref["hits"],
+        "neptuno_ref_cache_misses": ref["misses"],
+        "neptuno_ref_cache_recargas": ref["recargas"],
+        "neptuno_arranque_segundos": ARRANQUE_SEG,
+        "neptuno_importaciones_segundos": IMPORTACIONES_SEG,
+    }
+    if _oracle["init_seg"] is not None:
+        extra["neptuno_oracle_init_segundos"] = _oracle["init_seg"]
+    return metricas.exponer(extra), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route("/ref-cache", methods=["GET"])
+def ref_cache_get():
+    return jsonify(ref_cache.estado())
+
+@app.route("/ref-cache/refresh", methods=["POST"])
+def ref_cache_refresh():
+    sbs = (request.get_json(silent=True) or {}).get("sbs") or request.form.get("sbs")
+    try:
+        ref_cache.refrescar(sbs)
+    except Exception as e:
+        return jsonify(status="error", message=f"No se pudo recargar: {e}"), 500
+    return jsonify(ref_cache.estado())
+
+@app.route("/indice-upc", methods=["GET"])
+def indice_upc_get():
+    return jsonify(estado_indice_upc(request.args.get("sbs", "001")))
+
+@app.route("/indice-upc/sync", methods=["POST"])
+def indice_upc_sync():
+    data = request.get_json(silent=True) or {}
+    try:
+        res = sincronizar_indice_upc(data.get("sbs", "001"), bool(data.get("completo")))
+    except Exception as e:
+        return jsonify(status="error", message=f"No se pudo sincronizar: {e}"), 500
+    return jsonify(status="success", **res)
+
 @app.route("/sid-config", methods=["GET"])
 def sid_config_get():
     return jsonify(load_sid_cfg())
@@ -669,30 +2658,33 @@ def guardar_config():
 
 # Corrección en función generar_xml() para asignación estricta de nodos
 
-def generar_xml(csv_file_stream, output_path, plantilla_cfg, delimiter):
+def generar_xml(csv_file_stream, output_path, plantilla_cfg, delimiter, progreso=None, total=None,
+                incremental=False):
     csv_file_stream.seek(0)
-    lines = csv_file_stream.read().decode('latin-1').splitlines()
-    reader = csv.DictReader(
-        lines,
-        delimiter=delimiter,
-        fieldnames=[c['visual'] for c in plantilla_cfg]
-    )
-    rows = list(reader)
+    # filas posicionales en el orden de la plantilla (sin armar un dict por fila)
+    reader = (fila for fila in csv.reader(_iter_lineas(csv_file_stream), delimiter=delimiter) if fila)
 
-    cfg = db_cfg()
-    dsn_str = (
-        f"(DESCRIPTION=(ADDRESS=(PROTOCOL=TCP)(HOST={cfg.get('servidor')})"
-        f"(PORT={cfg.get('puerto')}))(CONNECT_DATA=(SERVICE_NAME={cfg.get('base_datos')})))"
-    )
-    conn = oracledb.connect(
-        user=cfg.get('usuario'), password=cfg.get('password'), dsn=dsn_str
-    )
+    conn = adquirir_conexion()
     cursor = conn.cursor()
+    try:
+        return _construir_inventario(cursor, reader, output_path, plantilla_cfg, progreso, total,
+                                     incremental)
+    finally:
+        cursor.close()
+        conn.close()
 
-    root = ET.Element('DOCUMENT')
-    inventorys = ET.SubElement(root, 'INVENTORYS')
 
-    campos_seccion = {c['rpro']: c['section'] for c in maestros()}
+def _construir_inventario(cursor, rows, output_path, plantilla_cfg, progreso=None, total=None,
+                          incremental=False):
+    """
+    Escribe el XML de inventario; `rows` puede ser cualquier iterable de filas
+    (listas de columnas en el orden de la plantilla).
+    Con `incremental` sólo se generan las filas nuevas o modificadas (HuellasCatalogo);
+    si no queda ninguna no se escribe archivo y "path" vuelve en None. Una
+    incremental exitosa deja registradas las huellas de lo que envió; una completa,
+    sólo con generacion_incremental.registrar_completas.
+    """
+    mapeo = plan_inventario(plantilla_cfg)
 
     # ------------------------------------------------------------------
     # Atributos fijos que siempre van en <INVN_SBS>
@@ -710,213 +2702,975 @@ def generar_xml(csv_file_stream, output_path, plantilla_cfg, delimiter):
         "cms": "0",
     }
 
-    for idx, row in enumerate(rows, start=1):
+    # ❶ Columnas de la plantilla: UPC siempre existe; un campo que no está vale ""
+    col_upc = mapeo.columna["local_upc"]
+    col_dcs, col_vend, col_desc1, col_desc2 = (
+        mapeo.columna.get(r) for r in ("dcs_code", "vend_code", "description1", "description2"))
 
-        # ❶ Mapeo dinámico de nombres visuales → valores
-        map_vis = {c["rpro"]: c["visual"] for c in plantilla_cfg}
-        vis_upc = map_vis["local_upc"]            # UPC siempre existe
-        upc_val = row.get(vis_upc, "").strip()
+    def _columna(valores, col):
+        return [vals[col].strip() for vals in valores] if col is not None else [""] * len(valores)
 
-                # ❷ Validación DCS_CODE existe en cms.dcs
-        dcs_val = row.get(map_vis.get("dcs_code", ""), "").strip()
-        cursor.execute(
-            "SELECT 1 FROM cms.dcs WHERE sbs_no = '001' AND dcs_code = :1",
-            (dcs_val,)
-        )
-        if not cursor.fetchone():
-            raise RuntimeError(f"Línea {idx}: DCS_CODE '{dcs_val}' no existe en la base de datos")
-
-        # ❸ Validación VEND_CODE existe en cms.vendor
-        vend_val = row.get(map_vis.get("vend_code", ""), "").strip()
-        cursor.execute(
-            "SELECT VEND_CODE FROM cms.vendor WHERE sbs_no = '001' AND vend_code = :1",
-            (vend_val,)
-        )
-        if not cursor.fetchone():
-            raise RuntimeError(f"Línea {idx}: VEND_CODE '{vend_val}' no existe en la base de datos")
+    # Lo que necesita _elemento_inventario (también en los procesos hijos)
+    plan = {"static_attrs": static_attrs, "campos": mapeo.campos}
 
-        # ❷ Consulta por UPC
+    sbs = "001"
+    try:
+        with etapa("indice_upc"):
+            indice = preparar_indice_upc(sbs)
+    except Exception as db_err:
+        raise RuntimeError(f"Error al consultar Oracle: {db_err}")
+    memo = ResolucionCorrida(cursor, sbs, indice, load_sid_cfg())
+    delta = delta_cfg()
+    huellas = (HuellasCatalogo(delta["carpeta"], sbs, list(mapeo.rpros))
+               if incremental or delta["registrar_completas"] else None)
+
+    # Modo paralelo: las consultas y los SID se resuelven acá, por ventana, y
+    # cada ventana se arma y renderiza en un proceso hijo; los fragmentos se
+    # escriben en el orden original, con unas pocas ventanas en vuelo.
+    # Con pocas filas el arranque de los procesos y el envío de fragmentos cuestan
+    # más de lo que se gana: se queda en secuencia o con menos procesos.
+    par = paralelo_cfg()
+    procesos, n_procesos = None, 0
+    if par["habilitado"] and (total is None or total >= par["min_filas"]):
+        configurados = int(par["procesos"]) or os.cpu_count() or 1
+        n_procesos = configurados
+        if total is not None:
+            n_procesos = min(n_procesos, total // max(int(par["min_filas_por_proceso"]), 1))
+        if n_procesos:
+            # el pool conserva el tamaño configurado (lo comparten otras corridas);
+            # n_procesos acota las ventanas en vuelo de ésta
+            procesos = _executor_procesos(configurados)
+    tam_ventana = max(int(par["filas_por_bloque"]), 1) if procesos else VENTANA_FILAS
+    en_vuelo: deque = deque()
+
+    idx = leidas = omitidas = 0      # filas escritas, leídas y omitidas por incrementales
+    with XmlStreamWriter(output_path) as xw:
+        xw.abrir("DOCUMENT")
+        xw.abrir("INVENTORYS")
         try:
-            cursor.execute(
-                "SELECT style_sid, item_sid FROM cms.INVN_SBS "
-                "WHERE sbs_no = :1 AND local_upc = :2",
-                ("001", upc_val)
-            )
-            dbrow = cursor.fetchone()
-        except Exception as db_err:
-            raise RuntimeError(f"Error al consultar Oracle: {db_err}")
+            for lote in _ventanas(rows, tam_ventana):
+                numeros  = list(range(leidas + 1, leidas + len(lote) + 1))
+                leidas  += len(lote)
+                valores  = [mapeo.fila(fila) for fila in lote]
+                upc_vals = _columna(valores, col_upc)
+
+                # ❶b Incremental: fuera las filas con la misma huella que la última vez,
+                #     antes de gastar consultas y SID en ellas; completa: se registran todas
+                #     si así está configurado
+                if not incremental:
+                    if huellas is not None:
+                        with etapa("huellas"):
+                            huellas.registrar(upc_vals, valores)
+                else:
+                    with etapa("huellas"):
+                        quedan = huellas.filtrar(upc_vals, valores)
+                    if len(quedan) < len(valores):
+                        omitidas += len(valores) - len(quedan)
+                        numeros, valores, upc_vals = (
+                            [lista[i] for i in quedan] for lista in (numeros, valores, upc_vals))
+                    if not valores:
+                        continue
+                dcs_vals  = _columna(valores, col_dcs)
+                vend_vals = _columna(valores, col_vend)
+
+                # ❷ Claves distintas de la ventana
+                dcs_keys  = set(dcs_vals)
+                vend_keys = set(vend_vals)
+
+                # ❸ DCS (con tax_code) y VENDOR desde el cache de referencias; UPC desde
+                #    el índice local y, para los que falten, por bloques en Oracle
+                #    (sólo los que no se vieron en ventanas anteriores)
+                try:
+                    with etapa("consultas_oracle"):
+                        dcs_tax = ref_cache.dcs(sbs, dcs_keys, cursor)
+                        vendors = ref_cache.vendors(sbs, vend_keys, cursor)
+                    memo.consultar_upcs(upc_vals)
+                except Exception as db_err:
+                    raise RuntimeError(f"Error al consultar Oracle: {db_err}")
+
+                # ❹ Validación DCS / VENDOR en el orden original de las líneas
+                for num, dcs_val, vend_val in zip(numeros, dcs_vals, vend_vals):
+                    if dcs_val not in dcs_tax:
+                        raise RuntimeError(MENSAJES_REFERENCIAS["dcs"].format(linea=num, valor=dcs_val))
+                    if vend_val not in vendors:
+                        raise RuntimeError(MENSAJES_REFERENCIAS["vendor"].format(linea=num, valor=vend_val))
+
+                # ❺ style_sid / item_sid: existentes, ya asignados en la corrida o
+                #    generados una vez por description1 y por UPC nuevos
+                sids = memo.asignar(list(zip(
+                    numeros, upc_vals, _columna(valores, col_desc1), _columna(valores, col_desc2))))
+
+                # ❻ Filas listas para armar; tax_code del DCS, ya resuelto en bloque
+                filas = [
+                    (vals, style_sid, item_sid, upc_val, dcs_tax.get(dcs_val))
+                    for vals, upc_val, dcs_val, (style_sid, item_sid) in zip(valores, upc_vals, dcs_vals, sids)
+                ]
+
+                # ❼ XML de la ventana
+                if procesos:
+                    en_vuelo.append((len(filas), procesos.submit(
+                        _fragmento_inventario, plan, filas, xw.nivel, xw.compacto)))
+                    while len(en_vuelo) > 2 * n_procesos:
+                        n, fut = en_vuelo.popleft()
+                        with etapa("xml_procesos"):
+                            texto = fut.result()
+                        xw.escribir_texto(texto)
+                        idx += n
+                        if progreso:
+                            progreso(omitidas + idx, total)
+                    continue
+
+                for fila in filas:
+                    idx += 1
+                    xw.escribir(_elemento_inventario(plan, *fila))
+                    if progreso and idx % 200 == 0:
+                        progreso(omitidas + idx, total)
+
+            while en_vuelo:
+                n, fut = en_vuelo.popleft()
+                with etapa("xml_procesos"):
+                    texto = fut.result()
+                xw.escribir_texto(texto)
+                idx += n
+                if progreso:
+                    progreso(omitidas + idx, total)
+        finally:
+            for _, fut in en_vuelo:
+                fut.cancel()
+        # --- FIN del for ---
+        escrito = not (incremental and idx == 0)
+        if not escrito:
+            # nada nuevo que enviar: no queda un Inventory vacío
+            xw.abortar()
+    if huellas is not None:
+        with etapa("huellas"):
+            huellas.confirmar()
+    if incremental:
+        logging.info("%s: %d filas sin cambios omitidas, %d nuevas, %d modificadas",
+                     output_path, huellas.omitidas, huellas.nuevas, huellas.modificadas)
+    if progreso:
+        progreso(leidas, total if total is not None else leidas)
+    if memo.duplicados:
+        logging.warning("%s: %d UPC repetidos en el archivo", output_path, len(memo.duplicados))
+    return {"filas": idx, "path": output_path if escrito else None,
+            "upc_duplicados": memo.resumen_duplicados(),
+            "incremental": huellas.resumen() if incremental else None}
+
+
+# --- Armado de cada <INVENTORY> (en este proceso o en los hijos) ---
+_procesos: ProcessPoolExecutor | None = None
+_procesos_n = 0
+_procesos_lock = threading.Lock()
+
+
+def _executor_procesos(n: int) -> ProcessPoolExecutor:
+    """Pool de procesos compartido; se recrea si cambia la cantidad configurada."""
+    global _procesos, _procesos_n
+    with _procesos_lock:
+        if _procesos is None or _procesos_n != n:
+            if _procesos is not None:
+                _procesos.shutdown(wait=False)
+            _procesos, _procesos_n = ProcessPoolExecutor(max_workers=n), n
+        return _procesos
+
+
+def _elemento_inventario(plan, valores, style_sid, item_sid, upc_val, tax_code) -> ET.Element:
+    """<INVENTORY> de una fila: `valores` en el orden de la plantilla, SID ya resueltos."""
+    # --------- CREAR ESTRUCTURA XML FIJA ---------
+    inv = ET.Element("INVENTORY")
+    ET.SubElement(inv, "INVN_STYLE", style_sid=style_sid)
+    ET.SubElement(inv, "INVN", item_sid=item_sid, upc=upc_val)
+
+    invn_sbs   = ET.SubElement(inv, "INVN_SBS", dict(plan["static_attrs"]))
+    udf_buffer = {}
+
+    # --------- Rellenar atributos variables ---------
+    for (rpro, section, udf_no), valor in zip(plan["campos"], valores):
+        if section == "INVN_SBS":
+            invn_sbs.set(rpro, valor)
+        elif section == "INVN_SBS_SUPPL":
+            udf_buffer[udf_no] = valor
+
+    if tax_code is not None:
+        invn_sbs.set("tax_code", str(tax_code))
+
+    if udf_buffer:
+        supps = ET.SubElement(invn_sbs, "INVN_SBS_SUPPLS")
+        for no, val in udf_buffer.items():
+            ET.SubElement(supps, "INVN_SBS_SUPPL",
+                          udf_no=no, udf_value=val)
+    return inv
+
+
+def _fragmento_inventario(plan, filas, nivel: int, compacto: bool = False) -> str:
+    """Proceso hijo: arma y renderiza un bloque de <INVENTORY> en el orden recibido."""
+    return "".join(
+        XmlStreamWriter.renderizar(_elemento_inventario(plan, *fila), nivel, compacto)
+        for fila in filas
+    )
 
-        if dbrow:
-            style_sid, item_sid = map(str, dbrow)
 
-        else:  # UPC nuevo
-            sid_cfg = load_sid_cfg()
 
-            # ---------- ITEM SID ----------
-            mode_item = sid_cfg.get("item_sid_mode", "upc").lower()
-            if mode_item == "random":
-                item_sid = sid_gen_random()
-            else:                          # 'upc'
-                item_sid = sid_gen_from_upc(upc_val)
 
-            # ---------- STYLE SID ----------
-            desc1_val  = row.get(map_vis["description1"], "").strip()
-            desc2_val  = row.get(map_vis.get("description2", ""), "").strip()
+# ------------------------------------------------------------------
+#  RUTA: /generar  –  sube CSV/TXT, valida y genera XML
+# ------------------------------------------------------------------
+@app.route("/generar", methods=["POST"])
+def generar():
+    # ---------- 1) Comprobaciones básicas de archivo ----------
+    if "archivo" not in request.files:
+        return jsonify(error="No se ha subido ningún archivo"), 400
+    f = request.files["archivo"]
+    if f.filename == "":
+        return jsonify(error="No se ha seleccionado ningún archivo"), 400
 
-            # ❶ ¿Existe DESC1 en Oracle?
-            cursor.execute(
-                "SELECT style_sid FROM cms.INVN_SBS "
-                "WHERE sbs_no = :1 AND description1 = :2",
-                ("001", desc1_val)
-            )
-            sty_row = cursor.fetchone()
-
-            if sty_row:                           # DESC1 ya existe → reutilizar
-                style_sid = str(sty_row[0])
-
-            else:                                 # DESC1 no existe → generar
-                mode_style = sid_cfg.get("style_sid_mode", "desc1").lower()
-                if mode_style == "both":
-                    style_sid = sid_style_both(desc1_val, desc2_val)
-                elif mode_style == "random":
-                    style_sid = sid_style_random()
-                else:                             # 'desc1'
-                    style_sid = sid_style_desc1(desc1_val)
-
-        # --------- CREAR ESTRUCTURA XML FIJA ---------
-        inv = ET.SubElement(inventorys, "INVENTORY")
-        ET.SubElement(inv, "INVN_STYLE", style_sid=style_sid)
-        ET.SubElement(inv, "INVN", item_sid=item_sid, upc=upc_val)
-
-        invn_sbs   = ET.SubElement(inv, "INVN_SBS", dict(static_attrs))
-        udf_buffer = {}
-
-        # --------- Rellenar atributos variables ---------
-        for fld in plantilla_cfg:
-            key      = fld["visual"]
-            rpro     = fld["rpro"]
-            section  = campos_seccion.get(rpro, "INVN_SBS")
-            valor    = row.get(key, "")
+    try:
+        res = procesar_inventario(f.stream, incremental=opcion_formulario("incremental"))
+    except ErrorValidacion as e:
+        return e.respuesta()
+    except Exception as ex:
+        # Cualquier fallo (validaciones, Oracle, generación…) llega aquí
+        return jsonify(error=f"Error al generar XML: {ex}"), 500
 
-            if section == "INVN_SBS":
-                invn_sbs.set(rpro, valor)
-            elif section == "INVN_SBS_SUPPL":
-                udf_no = rpro.split("_", 1)[1] if "_" in rpro else ""
-                udf_buffer[udf_no] = valor
+    # ---------- 5) Éxito ----------
+    return jsonify(
+        status="success",
+        message="XML generado correctamente" if res["path"] else SIN_CAMBIOS,
+        path=res["path"],
+        upc_duplicados=res["upc_duplicados"],
+        incremental=res["incremental"],
+        tiempos=res["tiempos"]
+    )
 
-        # ——— Auto-lookup de tax_code usando el valor de dcs_code ———
-        orig_dcs = row.get(map_vis.get("dcs_code", ""), "").strip()
-        if orig_dcs:
-            cursor.execute(
-                "SELECT tax_code FROM cms.dcs WHERE sbs_no = '001' AND dcs_code = :1",
-                (orig_dcs,)
-            )
-        tax_row = cursor.fetchone()
-        if tax_row and tax_row[0] is not None:
-            invn_sbs.set("tax_code", str(tax_row[0]))
 
-        if udf_buffer:
-            supps = ET.SubElement(invn_sbs, "INVN_SBS_SUPPLS")
-            for no, val in udf_buffer.items():
-                ET.SubElement(supps, "INVN_SBS_SUPPL",
-                              udf_no=no, udf_value=val)
+SIN_CAMBIOS = "No hay filas nuevas ni modificadas: no se generó archivo"
 
-    # --- FIN del for ---
 
-    cursor.close()
-    conn.close()
+@instrumentado("inventario")
+def procesar_inventario(datos, progreso=None, incremental: bool | None = None) -> Dict[str, Any]:
+    """
+    Valida y genera el XML de inventario a partir de un stream binario.
+    `incremental` (por defecto, generacion_incremental.habilitado) omite las filas sin cambios.
+    """
+    # ---------- 2) Carga de configuraciones ----------
+    csv_cfg      = load_csv_cfg()
+    delim        = csv_cfg.get("delimiter", ",")
+    mapeo        = plan_inventario()                 # plantilla compilada (campos seleccionados)
 
-    _indent(root)
-    ET.ElementTree(root).write(output_path,
-                               encoding="utf-8",
-                               xml_declaration=True)
+    # ---------- 3) Validación de columnas y longitudes (primera pasada, en bloque) ----------
+    # Largos máximos por campo tomados del catálogo (campos_maestros en config.json)
+    datos = _rebobinable(datos)
+    num = mapeo.validador(delim).exigir(datos)
 
+    # --- 4) Generación del XML ---
+    # ––– Nombre incremental Inventory001.xml, 002, 003… (contador persistido) –––
+    extension = EXTENSIONES_SALIDA[perfil_salida_cfg()["compresion"]]
+    salida = str(reservar_salida(csv_cfg.get("ruta", str(BASE / "Salida")), "Inventory", extension))
+
+    # segunda pasada sobre el mismo stream, sin copiarlo ni re-codificarlo
+    res = generar_xml(
+        csv_file_stream=datos,
+        output_path=salida,
+        plantilla_cfg=mapeo.fuente,
+        delimiter=delim,
+        progreso=progreso,
+        total=num,
+        incremental=delta_cfg()["habilitado"] if incremental is None else incremental
+    )
+    # filas = <INVENTORY> escritos; leidas = líneas validadas del archivo
+    return {"path": res["path"], "filas": res["filas"], "leidas": num,
+            "upc_duplicados": res["upc_duplicados"], "incremental": res["incremental"]}
+
+
+# ------------------------------------------------------------------
+#  Prevalidación (dry-run): una sola pasada por el archivo con las mismas
+#  validaciones de estructura y de referencias (DCS, VENDOR, UPC) que la
+#  generación, sin armar XML ni asignar SID. Cada hallazgo se entrega en
+#  cuanto aparece para que se puedan corregir todos de una vez.
+# ------------------------------------------------------------------
+MAX_HALLAZGOS_PREVALIDACION = 50_000   # hallazgos detallados; del resto sólo se cuentan
+
+
+def prevalidar_inventario(datos):
+    """
+    Recorre un catálogo (stream binario) y produce dicts en orden de línea:
+    hallazgos {"nivel": "error"|"aviso", "tipo", "linea", "mensaje", ...},
+    {"tipo": "progreso", "lineas"} por bloque y un {"tipo": "resumen"} final.
+    Si Oracle no está disponible o falla a mitad de camino se produce
+    {"tipo": "fallo", "mensaje"} y el resto del archivo se sigue validando
+    sólo en su estructura; el resumen lo indica con "referencias": false.
+    """
+    t0 = time.perf_counter()
+    delim = load_csv_cfg().get("delimiter", ",")
+    mapeo = plan_inventario()
+    validador = mapeo.validador(delim, MAX_HALLAZGOS_PREVALIDACION)
+    # misma regla que _construir_inventario: un campo fuera de la plantilla vale ""
+    pos = {r: mapeo.columna.get(r) for r in ("local_upc", "dcs_code", "vend_code")}
+
+    sbs = "001"
+    totales = {"error": 0, "aviso": 0}
+    enviados = 0                           # hallazgos entregados con detalle
+    lineas = 0
+    primera_linea: Dict[str, int] = {}     # UPC → primera línea en que aparece
+    existentes = 0
+
+    def hallazgo(nivel: str, tipo: str, linea: int, **datos) -> Dict[str, Any]:
+        return {"nivel": nivel, "tipo": tipo, "linea": linea,
+                "mensaje": MENSAJES_REFERENCIAS[tipo].format(linea=linea, **datos), **datos}
+
+    def fallo(db_err) -> Dict[str, Any]:
+        logging.warning("Prevalidación sin referencias: %s", db_err)
+        return {"tipo": "fallo", "mensaje": f"Error al consultar Oracle: {db_err}"}
+
+    conn = cursor = None
+    indice = False
+    referencias = True                     # False desde que Oracle falla
+    try:
+        conn = adquirir_conexion()
+        cursor = conn.cursor()
+        indice = preparar_indice_upc(sbs)
+    except Exception as db_err:
+        referencias = False
+        yield fallo(db_err)
+
+    try:
+        for bloque in _bloques_lineas(datos, tam=BLOQUE_VALIDACION):
+            base, lineas = lineas, lineas + len(bloque)
+            parcial: Dict[str, Any] = {"total_errores": 0, "errores": []}
+            validador._validar_bloque(bloque, base, parcial)
+            hallazgos = [{"nivel": "error", **e} for e in parcial["errores"]]
+            totales["error"] += parcial["total_errores"]
+            con_columnas_mal = {e["linea"] for e in parcial["errores"] if e["tipo"] == "columnas"}
+
+            # filas con la cantidad de columnas correcta: a las que se les chequean referencias
+            filas = [
+                (base + i + 1, [cols[p].strip() if p is not None else "" for p in pos.values()])
+                for i, cols in enumerate(csv.reader(bloque, delimiter=delim))
+                if base + i + 1 not in con_columnas_mal and len(cols) == validador.esperados
+            ] if referencias else []
+            if filas:
+                try:
+                    dcs_tax = ref_cache.dcs(sbs, {v[1] for _, v in filas}, cursor)
+                    vendors = ref_cache.vendors(sbs, {v[2] for _, v in filas}, cursor)
+                    nuevos = {v[0] for _, v in filas if v[0] not in primera_linea}
+                    if nuevos:
+                        existentes += len(resolver_upcs(cursor, sbs, nuevos, indice))
+                except Exception as db_err:
+                    referencias, filas = False, []
+                    yield fallo(db_err)
+
+            for num, (upc, dcs, vend) in filas:
+                if dcs not in dcs_tax:
+                    hallazgos.append(hallazgo("error", "dcs", num, valor=dcs))
+                if vend not in vendors:
+                    hallazgos.append(hallazgo("error", "vendor", num, valor=vend))
+                primera = primera_linea.setdefault(upc, num)
+                if primera != num:
+                    hallazgos.append(hallazgo("aviso", "upc_duplicado", num, upc=upc, primera=primera))
+            totales["error"] += sum(h["tipo"] in ("dcs", "vendor") for h in hallazgos)
+            totales["aviso"] += sum(h["nivel"] == "aviso" for h in hallazgos)
+
+            hallazgos.sort(key=lambda h: h["linea"])
+            for h in hallazgos[:max(MAX_HALLAZGOS_PREVALIDACION - enviados, 0)]:
+                enviados += 1
+                yield h
+            yield {"tipo": "progreso", "lineas": lineas}
+    finally:
+        try:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+        except Exception as exc:
+            logging.warning("No se pudo devolver la sesión de la prevalidación: %s", exc)
+
+    yield {
+        "tipo": "resumen",
+        "ok": referencias and not totales["error"],
+        "referencias": referencias,
+        "lineas": lineas,
+        "errores": totales["error"],
+        "avisos": totales["aviso"],
+        "omitidos": totales["error"] + totales["aviso"] - enviados,
+        "upc_distintos": len(primera_linea),
+        "upc_existentes": existentes,
+        "upc_nuevos": len(primera_linea) - existentes,
+        "segundos": round(time.perf_counter() - t0, 3),
+    }
+
+
+@app.route("/prevalidar", methods=["POST"])
+def prevalidar():
+    """Prevalidación de un catálogo: NDJSON (un objeto por línea) a medida que avanza."""
+    if "archivo" not in request.files:
+        return jsonify(error="No se ha subido ningún archivo"), 400
+    f = request.files["archivo"]
+    if f.filename == "":
+        return jsonify(error="No se ha seleccionado ningún archivo"), 400
+
+    # Flask cierra los archivos subidos al terminar la vista, antes de que se
+    # consuma la respuesta: el generador trabaja sobre una copia propia
+    copia = tempfile.TemporaryFile()
+    shutil.copyfileobj(f.stream, copia, BLOQUE_LECTURA)
+    copia.seek(0)
+
+    def ndjson():
+        with copia:
+            for evento in prevalidar_inventario(copia):
+                yield json.dumps(evento, ensure_ascii=False) + "\n"
 
+    return Response(stream_with_context(ndjson()), mimetype="application/x-ndjson")
 
 
 # ------------------------------------------------------------------
-#  RUTA: /generar  –  sube CSV/TXT, valida y genera XML
+#  Trabajos asíncronos: /trabajos recibe el archivo, devuelve un id y la
+#  generación corre en un pool de hilos; el front consulta el avance.
+#  El estado se copia a <carpeta>/<id>.json para que cualquier proceso
+#  del servidor (varios workers) pueda responder la consulta.
 # ------------------------------------------------------------------
-@app.route("/generar", methods=["POST"])
-def generar():
-    # ---------- 1) Comprobaciones básicas de archivo ----------
+PROCESADORES = {"inventario": procesar_inventario, "to": procesar_to}
+
+_trabajos: Dict[str, Dict[str, Any]] = {}
+_trabajos_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+
+
+def _executor_trabajos() -> ThreadPoolExecutor:
+    global _executor
+    with _trabajos_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=trabajos_cfg()["workers"], thread_name_prefix="neptuno-trabajo"
+            )
+        return _executor
+
+
+def _archivo_trabajo(tid: str) -> Path:
+    return Path(trabajos_cfg()["carpeta"]) / f"{tid}.json"
+
+
+def _publicar_trabajo(job: Dict[str, Any]):
+    """Escribe una copia del estado (tomada bajo el lock) para los demás procesos."""
+    try:
+        _escribir_json_atomico(_archivo_trabajo(job["id"]), job)
+    except OSError as exc:
+        logging.warning("No se pudo publicar el estado del trabajo %s: %s", job["id"], exc)
+
+
+def _leer_trabajo(tid: str) -> Dict[str, Any] | None:
+    if not tid.isalnum():
+        return None
+    try:
+        return json.loads(_archivo_trabajo(tid).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _purgar_trabajos():
+    limite = time.time() - trabajos_cfg()["retener_seg"]
+    with _trabajos_lock:
+        for tid in [t for t, j in _trabajos.items() if j["fin"] and j["fin"] < limite]:
+            del _trabajos[tid]
+    carpeta = Path(trabajos_cfg()["carpeta"])
+    if not carpeta.is_dir():
+        return
+    for archivo in carpeta.glob("*.json"):
+        try:
+            if archivo.stat().st_mtime >= limite:
+                continue
+            job = json.loads(archivo.read_text(encoding="utf-8"))
+            if job.get("fin") and job["fin"] < limite:
+                os.remove(archivo)
+        except (OSError, ValueError):
+            pass
+
+
+def enviar_trabajo(tipo: str, archivo, opciones: Dict[str, Any] | None = None) -> str:
+    """
+    Guarda el archivo subido y encola su generación; devuelve el id del trabajo.
+    `opciones` se pasan tal cual al procesador (incremental, archivo_por_to).
+    """
+    if tipo not in PROCESADORES:
+        raise ErrorValidacion(f"Tipo de trabajo inválido: {tipo}")
+    _purgar_trabajos()
+    tid = uuid.uuid4().hex[:12]
+    carpeta = Path(trabajos_cfg()["carpeta"])
+    carpeta.mkdir(parents=True, exist_ok=True)
+    entrada = carpeta / f"{tid}.txt"
+    archivo.save(str(entrada))
+    with _trabajos_lock:
+        _trabajos[tid] = {
+            "id": tid, "tipo": tipo, "archivo": archivo.filename,
+            "estado": "en_cola", "filas": 0, "total": None,
+            "creado": time.time(), "inicio": None, "fin": None,
+            "path": None, "error": None,
+        }
+        copia = dict(_trabajos[tid])
+    _publicar_trabajo(copia)
+    _executor_trabajos().submit(_ejecutar_trabajo, tid, entrada, opciones or {})
+    return tid
+
+
+def _ejecutar_trabajo(tid: str, entrada: Path, opciones: Dict[str, Any]):
+    job = _trabajos[tid]
+    publicado = [0.0]
+
+    def progreso(filas: int, total: int):
+        with _trabajos_lock:
+            job["filas"], job["total"] = filas, total
+            ahora = time.monotonic()
+            copia = dict(job) if ahora - publicado[0] >= 1.0 else None
+        if copia:
+            publicado[0] = ahora
+            _publicar_trabajo(copia)
+
+    with _trabajos_lock:
+        job["estado"], job["inicio"] = "procesando", time.time()
+        copia = dict(job)
+    _publicar_trabajo(copia)
+    try:
+        with open(entrada, "rb") as fh:
+            res = PROCESADORES[job["tipo"]](fh, progreso, **opciones)
+        with _trabajos_lock:
+            job.update(res, estado="terminado")
+    except ErrorValidacion as e:
+        with _trabajos_lock:
+            job["estado"], job["error"] = "error", str(e)
+            if e.reporte:
+                job["total_errores"] = e.reporte["total_errores"]
+                job["errores"] = e.reporte["errores"]
+    except Exception as ex:
+        logging.exception("Trabajo %s falló", tid)
+        with _trabajos_lock:
+            job["estado"], job["error"] = "error", f"Error al generar XML: {ex}"
+    finally:
+        with _trabajos_lock:
+            job["fin"] = time.time()
+            copia = dict(job)
+        _publicar_trabajo(copia)
+        try:
+            os.remove(entrada)
+        except OSError:
+            pass
+
+
+def estado_trabajo(tid: str) -> Dict[str, Any] | None:
+    with _trabajos_lock:
+        job = _trabajos.get(tid)
+        res = dict(job) if job is not None else None
+    if res is None:
+        res = _leer_trabajo(tid)    # lo está procesando otro proceso del servidor
+        if res is None:
+            return None
+    if res["inicio"]:
+        transcurrido = (res["fin"] or time.time()) - res["inicio"]
+        ritmo = res["filas"] / transcurrido if transcurrido > 0 else 0.0
+        res["filas_por_seg"] = round(ritmo, 1)
+        res["transcurrido_seg"] = round(transcurrido, 2)
+        if res["estado"] == "procesando" and res["total"] and ritmo:
+            res["eta_seg"] = round((res["total"] - res["filas"]) / ritmo, 1)
+    return res
+
+
+@app.route("/trabajos", methods=["POST"])
+def trabajos_post():
     if "archivo" not in request.files:
         return jsonify(error="No se ha subido ningún archivo"), 400
     f = request.files["archivo"]
     if f.filename == "":
         return jsonify(error="No se ha seleccionado ningún archivo"), 400
+    try:
+        tipo = request.form.get("tipo", "inventario")
+        nombre = "incremental" if tipo == "inventario" else "archivo_por_to"
+        opcion = opcion_formulario(nombre)
+        tid = enviar_trabajo(tipo, f, {} if opcion is None else {nombre: opcion})
+    except ErrorValidacion as e:
+        return e.respuesta()
+    return jsonify(id=tid, estado="en_cola", url=f"/trabajos/{tid}"), 202
+
+
+@app.route("/trabajos", methods=["GET"])
+def trabajos_get():
+    _purgar_trabajos()
+    with _trabajos_lock:
+        ids = set(_trabajos)
+    carpeta = Path(trabajos_cfg()["carpeta"])
+    if carpeta.is_dir():
+        ids.update(p.stem for p in carpeta.glob("*.json"))
+    trabajos = [t for t in map(estado_trabajo, ids) if t is not None]
+    return jsonify(sorted(trabajos, key=lambda t: t["creado"]))
+
+
+@app.route("/trabajos/<tid>", methods=["GET"])
+def trabajo_get(tid):
+    res = estado_trabajo(tid)
+    if res is None:
+        return jsonify(error="Trabajo no encontrado"), 404
+    return jsonify(res)
 
-    # ---------- 2) Carga de configuraciones ----------
-    csv_cfg      = load_csv_cfg()
-    delim        = csv_cfg.get("delimiter", ",")
-    plantilla_cfg = plantilla()                      # campos seleccionados
-    campos_plant = [c["rpro"] for c in plantilla_cfg]
-    total_cols   = len(campos_plant)
-
-    # Metadatos de longitud máxima por campo (catálogo en config/config.json)
-    campos_meta = {c["rpro"]: c.get("len") for c in maestros()}
-
-    # ---------- 3) Validaciones línea a línea ----------
-    contenido = f.stream.read().decode("latin-1").splitlines()
-    for num, linea in enumerate(contenido, start=1):
-        valores = linea.split(delim)
-
-        # 3.1  Validar número de columnas
-        if len(valores) != total_cols:
-            return jsonify(
-                error=(
-                    f"Línea {num}: se esperaban {total_cols} campos según "
-                    f"su plantilla, pero se encontraron {len(valores)}."
-                )
-            ), 400
-
-        # 3.2  Validar longitud máxima por campo
-        for idx, val in enumerate(valores, start=1):
-            campo   = campos_plant[idx - 1]
-            max_len = campos_meta.get(campo)
-            if max_len is not None and len(val) > max_len:
-                return jsonify(
-                    error=(
-                        f"Línea {num}, campo #{idx} ({campo}): longitud "
-                        f"{len(val)} supera el máximo de {max_len}."
-                    )
-                ), 400
 
-    # --- 4) Generación del XML ---
-    # ––– Construir nombre incremental Inventory001.xml, 002, 003… –––
-    outdir = csv_cfg.get("ruta")
-    i = 1
-    while True:
-        fname = f"Inventory{i:03d}.xml"
-        salida = os.path.join(outdir, fname)
-        if not os.path.exists(salida):
-            break
-        i += 1
-    # sale con salida = …/Inventory00i.xml
+# ------------------------------------------------------------------
+#  Lotes: /lote recibe varios archivos (o zips con archivos), los genera
+#  a la vez compartiendo el pool de Oracle y los caches del proceso, y
+#  responde con un manifiesto por archivo.
+# ------------------------------------------------------------------
+_executor_lotes: ThreadPoolExecutor | None = None
+_lotes_lock = threading.Lock()
+
+
+def _executor_lote() -> ThreadPoolExecutor:
+    global _executor_lotes
+    with _lotes_lock:
+        if _executor_lotes is None:
+            _executor_lotes = ThreadPoolExecutor(
+                max_workers=max(int(lote_cfg()["hilos"]), 1), thread_name_prefix="neptuno-lote"
+            )
+        return _executor_lotes
+
 
-    data_bytes = ("\n".join(contenido)).encode("latin-1")
-    csv_stream = io.BytesIO(data_bytes)
-    csv_stream.seek(0)
+def detectar_tipo(stream) -> str:
+    """"to" si el archivo empieza con la línea H de un Transfer Order; si no, "inventario"."""
+    pos = stream.tell()
+    cabecera = stream.read(2)
+    stream.seek(pos)
+    return "to" if cabecera == b"H," else "inventario"
 
+
+def generar_archivo(nombre: str, ruta: Path, tipo: str = "auto") -> Dict[str, Any]:
+    """Genera el XML de un archivo en disco y devuelve su entrada de manifiesto (no lanza)."""
+    entrada: Dict[str, Any] = {"archivo": nombre, "tipo": tipo, "estado": "terminado"}
+    t0 = time.perf_counter()
     try:
-        generar_xml(
-            csv_file_stream=csv_stream,
-            output_path=salida,
-            plantilla_cfg=plantilla(),
-            delimiter=delim
-        )
+        with open(ruta, "rb") as fh:
+            if tipo == "auto":
+                entrada["tipo"] = tipo = detectar_tipo(fh)
+            entrada.update(PROCESADORES[tipo](fh))
+    except ErrorValidacion as e:
+        entrada.update(estado="error", error=str(e))
+        if e.reporte:
+            entrada.update(total_errores=e.reporte["total_errores"], errores=e.reporte["errores"])
     except Exception as ex:
-        # Cualquier fallo (validaciones, Oracle, generación…) llega aquí
-        return jsonify(error=f"Error al generar XML: {ex}"), 500   # ← 8 espacios
+        logging.exception("Archivo %s del lote falló", nombre)
+        entrada.update(estado="error", error=f"Error al generar XML: {ex}")
+    entrada["segundos"] = round(time.perf_counter() - t0, 3)
+    return entrada
+
+
+def _desempacar(archivos, carpeta: Path, cfg: Dict[str, Any]) -> List[tuple[str, Path]]:
+    """Guarda los archivos subidos en `carpeta` y expande los zip; devuelve (nombre, ruta)."""
+    salida: List[tuple[str, Path]] = []
+    limite = int(cfg["max_descomprimido_mb"]) * 2**20
+    descomprimido = 0
+    nombres = iter(range(1 << 30))
+
+    def _destino() -> Path:
+        if len(salida) >= int(cfg["max_archivos"]):
+            raise ErrorValidacion(f"El lote supera el máximo de {cfg['max_archivos']} archivos")
+        return carpeta / f"{next(nombres):05d}"
+
+    for f in archivos:
+        destino = _destino()
+        f.save(str(destino))
+        if not zipfile.is_zipfile(destino):
+            salida.append((f.filename, destino))
+            continue
+        try:
+            with zipfile.ZipFile(destino) as zf:
+                for info in zf.infolist():
+                    base = info.filename.rsplit("/", 1)[-1]
+                    if info.is_dir() or info.filename.startswith("__MACOSX/") or base.startswith("."):
+                        continue
+                    # zipfile no entrega más bytes que file_size, así que el límite es real
+                    descomprimido += info.file_size
+                    if descomprimido > limite:
+                        raise ErrorValidacion(
+                            f"El contenido de los zip supera {cfg['max_descomprimido_mb']} MB")
+                    miembro = _destino()
+                    with zf.open(info) as src, open(miembro, "wb") as dst:
+                        shutil.copyfileobj(src, dst, BLOQUE_LECTURA)
+                    salida.append((f"{f.filename}/{info.filename}", miembro))
+        except zipfile.BadZipFile as exc:
+            raise ErrorValidacion(f"Zip inválido «{f.filename}»: {exc}")
+        os.remove(destino)
+    return salida
+
+
+@app.route("/lote", methods=["POST"])
+def lote_post():
+    archivos = [f for f in request.files.getlist("archivos") if f.filename]
+    if not archivos:
+        return jsonify(error="No se ha subido ningún archivo"), 400
+    tipo = request.form.get("tipo", "auto")
+    if tipo != "auto" and tipo not in PROCESADORES:
+        return jsonify(error=f"Tipo de archivo inválido: {tipo}"), 400
 
-    # ---------- 5) Éxito ----------
-    return jsonify(                                                # ← 4 espacios
-        status="success",
-        message="XML generado correctamente",
-        path=salida
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="neptuno-lote-") as tmp:
+        try:
+            entradas = _desempacar(archivos, Path(tmp), lote_cfg())
+        except ErrorValidacion as e:
+            return e.respuesta()
+        if not entradas:
+            return jsonify(error="El lote no contiene archivos"), 400
+        futuros = [_executor_lote().submit(generar_archivo, nombre, ruta, tipo)
+                   for nombre, ruta in entradas]
+        manifiesto = [f.result() for f in futuros]
+
+    errores = sum(m["estado"] == "error" for m in manifiesto)
+    return jsonify(
+        total=len(manifiesto), terminados=len(manifiesto) - errores, con_error=errores,
+        segundos=round(time.perf_counter() - t0, 3), archivos=manifiesto,
+    )
+
+
+# ------------------------------------------------------------------
+#  Carpeta vigilada (python Neptuno.py --vigilar): el ERP deja archivos en
+#  `entrada`; cada uno se reclama renombrándolo a `.en_proceso` (atómico: si
+#  otra instancia lo tomó antes, el rename falla), se genera en un pool
+#  acotado de workers y se mueve a `procesados` o `fallidos` junto con su
+#  resultado en JSON. El XML queda en csv.ruta, como desde la interfaz.
+# ------------------------------------------------------------------
+metricas.describir("neptuno_vigilancia_archivos_total", "counter",
+                   "Archivos tomados de la carpeta vigilada, por resultado.")
+
+
+def _mover_sin_pisar(ruta: Path, carpeta: Path, nombre: str) -> Path:
+    destino = carpeta / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{nombre}"
+    if destino.exists():
+        destino = destino.with_name(f"{destino.stem}_{uuid.uuid4().hex[:6]}{destino.suffix}")
+    return Path(shutil.move(str(ruta), str(destino)))
+
+
+class VigilanteCarpeta:
+    """Toma los archivos nuevos de la carpeta de entrada y los genera en paralelo."""
+
+    SEPARADOR = "__"        # <id>__<nombre original> dentro de .en_proceso
+
+    def __init__(self, cfg: Dict[str, Any]):
+        self.entrada = Path(cfg["entrada"])
+        self.en_proceso = self.entrada / ".en_proceso"
+        self.procesados = Path(cfg["procesados"] or self.entrada / "procesados")
+        self.fallidos = Path(cfg["fallidos"] or self.entrada / "fallidos")
+        self.extensiones = {e.lower() for e in cfg["extensiones"]}
+        self.estable_seg = float(cfg["estable_seg"])
+        self.workers = max(int(cfg["workers"]), 1)
+        for carpeta in (self.entrada, self.en_proceso, self.procesados, self.fallidos):
+            carpeta.mkdir(parents=True, exist_ok=True)
+        self._cupos = threading.BoundedSemaphore(self.workers)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="neptuno-vigilancia")
+        self._vistos: Dict[str, tuple] = {}     # nombre → (tamaño, mtime) en la recorrida anterior
+
+    def recuperar(self, vencido_seg: float) -> int:
+        """Devuelve a la entrada lo reclamado hace más de `vencido_seg` (instancia caída)."""
+        limite, n = time.time() - vencido_seg, 0
+        for ruta in self.en_proceso.iterdir():
+            try:
+                if ruta.stat().st_mtime >= limite:
+                    continue
+                nombre = ruta.name.split(self.SEPARADOR, 1)[-1]
+                if not (self.entrada / nombre).exists():
+                    os.rename(ruta, self.entrada / nombre)
+                    n += 1
+            except OSError:
+                pass
+        if n:
+            logging.warning("Se devolvieron %d archivos abandonados a %s", n, self.entrada)
+        return n
+
+    def _candidatos(self) -> List[str]:
+        """Archivos de la entrada que terminaron de copiarse, del más antiguo al más nuevo."""
+        ahora = time.time()
+        listos, vistos = [], {}
+        with os.scandir(self.entrada) as it:
+            for e in it:
+                if (e.name.startswith(".") or not e.is_file()
+                        or os.path.splitext(e.name)[1].lower() not in self.extensiones):
+                    continue
+                try:
+                    st = e.stat()
+                except FileNotFoundError:       # lo reclamó otra instancia
+                    continue
+                firma = (st.st_size, st.st_mtime)
+                vistos[e.name] = firma
+                if self._vistos.get(e.name) == firma and ahora - st.st_mtime >= self.estable_seg:
+                    listos.append((st.st_mtime, e.name))
+        self._vistos = vistos
+        return [nombre for _, nombre in sorted(listos)]
+
+    def _reclamar(self, nombre: str) -> Path | None:
+        destino = self.en_proceso / f"{uuid.uuid4().hex[:12]}{self.SEPARADOR}{nombre}"
+        try:
+            os.rename(self.entrada / nombre, destino)
+        except OSError:
+            # ya lo tomó otra instancia, o en Windows todavía lo tiene abierto quien lo copia
+            return None
+        os.utime(destino)       # marca el momento del reclamo para recuperar()
+        return destino
+
+    def _procesar(self, nombre: str, ruta: Path):
+        try:
+            res = generar_archivo(nombre, ruta)
+            ok = res["estado"] == "terminado"
+            final = _mover_sin_pisar(ruta, self.procesados if ok else self.fallidos, nombre)
+            _escribir_json_atomico(final.with_name(final.name + ".json"), res)
+            metricas.sumar("neptuno_vigilancia_archivos_total", 1,
+                           resultado="terminado" if ok else "error")
+            if ok:
+                logging.info("%s → %s (%s filas, %.2f s)", nombre, res.get("path"),
+                             res.get("filas"), res["segundos"])
+            else:
+                logging.warning("%s falló: %s", nombre, res["error"].splitlines()[0])
+        except Exception:
+            logging.exception("No se pudo cerrar el procesamiento de %s", nombre)
+        finally:
+            self._cupos.release()
+
+    def recorrer(self) -> int:
+        """Reclama tantos archivos listos como workers libres haya; devuelve cuántos tomó."""
+        tomados = 0
+        for nombre in self._candidatos():
+            if not self._cupos.acquire(blocking=False):
+                break
+            ruta = self._reclamar(nombre)
+            if ruta is None:
+                self._cupos.release()
+                continue
+            self._executor.submit(self._procesar, nombre, ruta)
+            tomados += 1
+        return tomados
+
+    def ejecutar(self, detener: threading.Event, intervalo_seg: float):
+        try:
+            while not detener.is_set():
+                try:
+                    self.recorrer()
+                except OSError as exc:
+                    logging.warning("No se pudo recorrer %s: %s", self.entrada, exc)
+                detener.wait(intervalo_seg)
+        finally:
+            # no se toman archivos nuevos, pero los que están en curso terminan
+            self._executor.shutdown(wait=True)
+
+
+def vigilar(cfg: Dict[str, Any] | None = None):
+    """Modo sin interfaz: procesa lo que aparezca en la carpeta de entrada hasta Ctrl+C."""
+    cfg = {**vigilancia_cfg(), **(cfg or {})}
+    if servidor_cfg()["precalentar"]:
+        precalentar_worker()
+    vigilante = VigilanteCarpeta(cfg)
+    vigilante.recuperar(float(cfg["reclamar_seg"]))
+    detener = threading.Event()
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, lambda *_: detener.set())
+    logging.info("Vigilando %s con %d workers; XML en %s",
+                 vigilante.entrada, vigilante.workers, load_csv_cfg().get("ruta"))
+    try:
+        vigilante.ejecutar(detener, float(cfg["intervalo_seg"]))
+    except KeyboardInterrupt:
+        logging.info("Deteniendo la vigilancia; se terminan los archivos en curso")
+
+
+# ------------------------------------------------------------------
+#  Servidor de producción: waitress (hilos) o gunicorn (procesos × hilos,
+#  sólo POSIX). Cada proceso abre su propio pool y carga sus caches al
+#  arrancar, nunca antes del fork.
+# ------------------------------------------------------------------
+def precalentar_worker():
+    """Abre el pool de Oracle y carga caches del proceso actual; un fallo no impide servir."""
+    t0 = time.perf_counter()
+    try:
+        adquirir_conexion().close()
+    except Exception as exc:
+        logging.warning("No se pudo abrir el pool de Oracle al iniciar: %s", exc)
+    precargar_referencias()
+    try:
+        asignador_sid()
+        plan_inventario(), plan_to()
+    except Exception as exc:
+        logging.warning("No se pudo precargar la configuración: %s", exc)
+    if indice_cfg()["habilitado"]:
+        # el índice se arma en segundo plano; hasta entonces las corridas van a Oracle
+        preparar_indice_upc("001")
+    logging.info("Proceso %s listo en %.2f s", os.getpid(), time.perf_counter() - t0)
+
+
+def _servir_gunicorn(cfg: Dict[str, Any], precalentar: bool):
+    from gunicorn.app.base import BaseApplication
+
+    class _Aplicacion(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{cfg['host']}:{cfg['puerto']}")
+            self.cfg.set("workers", max(int(cfg["workers"]), 1))
+            self.cfg.set("threads", max(int(cfg["hilos"]), 1))
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("keepalive", int(cfg["keep_alive_seg"]))
+            # las generaciones largas no deben matar al worker
+            self.cfg.set("timeout", 0)
+            if precalentar:
+                self.cfg.set("post_worker_init", lambda worker: precalentar_worker())
+
+        def load(self):
+            return app
+
+    _Aplicacion().run()
+
+
+def servir(cfg: Dict[str, Any] | None = None):
+    """Arranca el servidor según la sección "servidor" de config.json."""
+    cfg = {**servidor_cfg(), **(cfg or {})}
+    app.config["MAX_CONTENT_LENGTH"] = int(cfg["max_subida_mb"]) * 2**20
+    motor = cfg["motor"]
+    if motor == "gunicorn" and os.name == "nt":
+        logging.warning("gunicorn no funciona en Windows; se usa waitress")
+        motor = "waitress"
+
+    precalentar = cfg["precalentar"] or ref_cfg().get("precargar")
+    if motor == "gunicorn":
+        _servir_gunicorn(cfg, precalentar)
+        return
+    if precalentar:
+        precalentar_worker()
+    if motor == "flask":
+        app.run(host=cfg["host"], port=cfg["puerto"], debug=False, threaded=True)
+        return
+    if motor != "waitress":
+        raise ValueError(f"Motor de servidor desconocido: {motor}")
+    if int(cfg["workers"]) > 1:
+        logging.warning("waitress atiende con hilos en un solo proceso; se ignora workers=%s",
+                        cfg["workers"])
+    try:
+        from waitress import serve
+    except ImportError:
+        raise SystemExit("Falta el paquete waitress (pip install waitress) o use --motor flask")
+    serve(
+        app, host=cfg["host"], port=cfg["puerto"],
+        threads=max(int(cfg["hilos"]), 1),
+        channel_timeout=int(cfg["keep_alive_seg"]),
+        max_request_body_size=app.config["MAX_CONTENT_LENGTH"],
+        ident="Neptuno",
     )
 
-# ---------- 5) Éxito ----------
+
+# costo de cargar el módulo desde su primera línea, librerías incluidas, y de
+# sólo las importaciones; /metrics expone ambos
+ARRANQUE_SEG = round(time.perf_counter() - _T_INICIO, 4)
+IMPORTACIONES_SEG = round(_T_IMPORTADO - _T_INICIO, 4)
+
 
 if __name__ == "__main__":
-    app.run(debug=False)
+    import argparse
+    ap = argparse.ArgumentParser(description="Servidor Neptuno")
+    ap.add_argument("--motor", choices=["waitress", "gunicorn", "flask"])
+    ap.add_argument("--host")
+    ap.add_argument("--puerto", type=int)
+    ap.add_argument("--workers", type=int)
+    ap.add_argument("--hilos", type=int)
+    ap.add_argument("--vigilar", action="store_true",
+                    help="sin interfaz web: procesa los archivos de la carpeta de entrada")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logging.info("Módulo cargado en %.3f s (%.3f s en importaciones)", ARRANQUE_SEG, IMPORTACIONES_SEG)
+    if args.vigilar:
+        vigilar()
+    else:
+        servir({k: v for k, v in vars(args).items() if v is not None and k != "vigilar"})
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""benchmark.py — mide el rendimiento de la generación de XML de Neptuno.
+
+Arma catálogos y archivos TO sintéticos (con la forma de los de
+"Archivos de Prueba") y los procesa con `procesar_inventario` / `procesar_to`
+contra un sustituto local de Oracle con latencia y tasas de acierto
+configurables. Cada caso corre en un proceso aparte para medir su pico de RSS.
+
+    python benchmark.py                                  # 1k, 10k y 100k líneas
+    python benchmark.py --lineas 1000 1000000 --latencia-ms 2
+    python benchmark.py --guardar benchmark/base.json    # guarda la línea base
+    python benchmark.py --comparar benchmark/base.json   # compara contra ella
+
+Sólo se comparan casos medidos con los mismos parámetros (latencia, aciertos,
+modo de SID, procesos y caches); si difieren, --comparar termina con código 3.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+BASE = Path(__file__).resolve().parent
+CARPETA = BASE / "benchmark"
+
+TALLAS = ["6", "6.5", "7", "7.5", "8", "8.5", "9", "9.5", "10", "11"]
+COLORES = ["WHHBSMOK", "BLKBLK", "NVYWHT", "GRYRED", "OLVBLK", "TANBRN"]
+DCS = ["02 02 00", "01 02 00", "03 01 00", "02 05 10"]
+VENDORS = ["APL", "AUTRY", "NIKE", "ADID"]
+
+# El sustituto de Oracle reconoce lo "existente" por prefijo
+UPC_EXISTE, UPC_NUEVO = "77", "84"
+DESC_EXISTE = "EXISTE "
+
+
+# --- Datos sintéticos ---
+def _acierto(i: int, ratio: float) -> bool:
+    """Reparto determinístico y parejo de aciertos a lo largo del archivo."""
+    return (i * 7919) % 1000 < ratio * 1000
+
+
+def _valor_catalogo(rpro: str, i: int, maximo, aciertos_upc: float, aciertos_desc: float) -> str:
+    estilo = i // len(TALLAS)
+    if rpro == "local_upc":
+        return f"{UPC_EXISTE if _acierto(i, aciertos_upc) else UPC_NUEVO}{i:010d}"
+    if rpro == "description1":
+        prefijo = DESC_EXISTE if _acierto(estilo, aciertos_desc) else ""
+        return f"{prefijo}1-2-{estilo:06d}"
+    valores = {
+        "attr": COLORES[estilo % len(COLORES)],
+        "siz": TALLAS[i % len(TALLAS)],
+        "description2": f"TECHLOOM TRACER {estilo % 500}",
+        "dcs_code": DCS[estilo % len(DCS)],
+        "vend_code": VENDORS[estilo % len(VENDORS)],
+        "description3": "HOMBRE",
+        "description4": "CALZADO DE CABALLERO",
+        "udf_13": "SPRING 2025",
+        "udf_11": COLORES[estilo % len(COLORES)],
+        "long_description": "36.5% TPU; 63.5% TEXTILE - OUTSOLE 64% EVA; 36% RB",
+        "udf_14": "CHINA",
+        "regional": "1",
+    }
+    val = valores.get(rpro, "X" * 8)
+    return val[:maximo] if isinstance(maximo, int) else val
+
+
+def generar_catalogo(ruta: Path, lineas: int, plantilla: List[Dict[str, Any]],
+                     maestros: List[Dict[str, Any]], delim: str,
+                     aciertos_upc: float, aciertos_desc: float):
+    largos = {c["rpro"]: c.get("len") for c in maestros}
+    campos = [c["rpro"] for c in plantilla]
+    with open(ruta, "w", encoding="latin-1", newline="") as fh:
+        for i in range(lineas):
+            fh.write(delim.join(
+                _valor_catalogo(r, i, largos.get(r), aciertos_upc, aciertos_desc) for r in campos
+            ) + "\r\n")
+
+
+def generar_to(ruta: Path, lineas: int, columnas: int, delim: str):
+    """Una línea H, `lineas` líneas I (UPC existentes) y la línea S de cierre."""
+    relleno = [""] * max(columnas - 4, 0)
+    with open(ruta, "w", encoding="latin-1", newline="") as fh:
+        fh.write(delim.join(["H", "001", "001", "OR-BENCH"] + relleno) + "\r\n")
+        for i in range(lineas):
+            # la validación de TO aplica los largos del header (sbs_no = 5) a
+            # todas las líneas, así que el UPC de las líneas I no puede pasar de 5
+            fh.write(delim.join(["I", f"{UPC_EXISTE}{i % 1000:03d}", str(1 + i % 3), "5.99"] + relleno) + "\r\n")
+        fh.write(delim.join(["S"] + [""] * (columnas - 1)) + "\r\n")
+
+
+# --- Sustituto de Oracle ---
+class CursorSimulado:
+    """Responde las consultas de Neptuno con datos sintéticos y una demora fija por consulta."""
+
+    consultas = 0
+
+    def __init__(self, latencia: float):
+        self.latencia = latencia
+        self._filas: list = []
+        self.arraysize = 100
+
+    def execute(self, sql, binds=None, **kw):
+        CursorSimulado.consultas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        s = " ".join(sql.split())
+        if isinstance(binds, dict):
+            claves = list(dict.fromkeys(v for k, v in binds.items() if k.startswith("k")))
+        else:
+            claves = list(binds or [])
+        if "FROM cms.dcs" in s:
+            codigos = claves if "IN (" in s else DCS
+            self._filas = [(c, i % 3) for i, c in enumerate(codigos) if c in DCS]
+        elif "FROM cms.vendor" in s:
+            codigos = claves if "IN (" in s else VENDORS
+            self._filas = [(c,) for c in codigos if c in VENDORS]
+        elif "local_upc IN" in s:
+            self._filas = [
+                (u, f"-{u[2:]}", f"9{u[2:]}", 12.5, 1, DCS[0], VENDORS[0])
+                for u in claves if str(u).startswith(UPC_EXISTE)
+            ]
+        elif "description1 IN" in s:
+            self._filas = [(d, f"-5{abs(hash(d)) % 10**12}") for d in claves
+                           if str(d).startswith(DESC_EXISTE)]
+        else:                                   # ping / select 1 from dual
+            self._filas = [(1,)]
+
+    def fetchone(self):
+        return self._filas[0] if self._filas else None
+
+    def fetchall(self):
+        filas, self._filas = self._filas, []
+        return filas
+
+    def fetchmany(self, n=100):
+        filas, self._filas = self._filas[:n], self._filas[n:]
+        return filas
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+
+class ConexionSimulada:
+    def __init__(self, latencia: float):
+        self.latencia = latencia
+
+    def cursor(self):
+        return CursorSimulado(self.latencia)
+
+    def ping(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PoolSimulado:
+    busy, opened, min, max = 0, 1, 1, 8
+
+    def __init__(self, latencia: float):
+        self.latencia = latencia
+
+    def acquire(self):
+        return ConexionSimulada(self.latencia)
+
+    def close(self, force=False):
+        pass
+
+
+# Lo que cambia el resultado de un caso además de su tipo y cantidad de líneas
+PARAMETROS_CASO = ("latencia_ms", "aciertos_upc", "aciertos_desc", "modo_sid", "procesos")
+
+
+# --- Medición ---
+def _rss_pico_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:                       # Windows
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / 2**20, 1)
+        except Exception:
+            return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def ejecutar_caso(caso: Dict[str, Any]) -> Dict[str, Any]:
+    """Corre un caso dentro de este proceso (lo invoca el proceso principal)."""
+    trabajo = Path(caso["carpeta"])
+    os.environ.setdefault("ORACLE_CLIENT_DIR", str(trabajo))
+    import oracledb
+    oracledb.init_oracle_client = lambda **kw: None
+    latencia = caso["latencia_ms"] / 1000
+    oracledb.create_pool = lambda **kw: PoolSimulado(latencia)
+
+    sys.path.insert(0, str(BASE))
+    import Neptuno as N
+
+    # config.json propia del benchmark, a partir de la del repositorio
+    config = trabajo / "config.json"
+    config.write_text((BASE / "config.json").read_text(encoding="utf-8"), encoding="utf-8")
+    N.CONFIG_FILE = config
+    salida = trabajo / "salida"
+    salida.mkdir(exist_ok=True)
+    N._save_section(["csv"], {"ruta": str(salida), "delimiter": ","})
+    N._save_section(["indice_upc"], {**N.DEFAULT_INDICE_CFG, "habilitado": False})
+    N._save_section(["asignador_sid"], {**N.DEFAULT_ASIGNADOR_SID_CFG, "carpeta": str(trabajo / "sid")})
+    N._save_section(["generacion_incremental"], {**N.DEFAULT_DELTA_CFG, "carpeta": str(trabajo / "huellas")})
+    N._save_section(["sid_generator"], {"item_sid_mode": caso["modo_sid"], "style_sid_mode":
+                                        "random" if caso["modo_sid"] == "random" else "desc1"})
+    N._save_section(["generacion_paralela"], {**N.DEFAULT_PARALELO_CFG,
+                                              "habilitado": caso["procesos"] > 0,
+                                              "procesos": caso["procesos"], "min_filas": 0,
+                                              "min_filas_por_proceso": 1})
+    N._save_section(["transfer_orders", "configuracion"], {
+        "header": ["record_type_h", "sbs_no", "store_no", "to_no"],
+        "detail": ["record_type_i", "upc", "ord_qty", "price"],
+    })
+
+    datos = Path(caso["datos"])
+    if not datos.exists():
+        tmp = datos.with_suffix(".tmp")
+        if caso["tipo"] == "inventario":
+            generar_catalogo(tmp, caso["lineas"], N.plantilla(), N.maestros(), ",",
+                             caso["aciertos_upc"], caso["aciertos_desc"])
+        else:
+            generar_to(tmp, caso["lineas"], 8, ",")
+        os.replace(tmp, datos)
+
+    procesar = N.procesar_inventario if caso["tipo"] == "inventario" else N.procesar_to
+    t0 = time.perf_counter()
+    with open(datos, "rb") as fh:
+        res = procesar(fh)
+    total = time.perf_counter() - t0
+    os.remove(res["path"])
+    ref = N.ref_cfg()
+    return {
+        "tipo": caso["tipo"], "lineas": caso["lineas"],
+        "parametros": {
+            **{k: caso[k] for k in PARAMETROS_CASO},
+            "cache_referencias": {k: ref[k] for k in ("ttl_seg", "recarga_min_seg")},
+            "indice_upc": bool(N.indice_cfg()["habilitado"]),
+        },
+        "segundos": round(total, 3),
+        "filas_por_seg": round(caso["lineas"] / total, 1) if total else None,
+        "rss_pico_mb": _rss_pico_mb(),
+        "consultas": CursorSimulado.consultas,
+        "etapas_seg": {k: round(v, 3) for k, v in res["tiempos"]["etapas_seg"].items()},
+    }
+
+
+# --- Proceso principal ---
+def _clave(r: Dict[str, Any]) -> str:
+    return f"{r['tipo']}:{r['lineas']}"
+
+
+def _diferencias(a: Dict[str, Any] | None, b: Dict[str, Any]) -> List[str]:
+    if a is None:
+        return ["la línea base no guardó sus parámetros"]
+    return [f"{k}: {a.get(k)!r} → {b.get(k)!r}" for k in sorted(set(a) | set(b)) if a.get(k) != b.get(k)]
+
+
+def comparar(base: Dict[str, Any], actuales: List[Dict[str, Any]], tolerancia: float) -> int:
+    """0 si no hay regresión, 2 si la hay y 3 si algún caso se midió con otros parámetros."""
+    previos = {_clave(r): r for r in base.get("resultados", [])}
+    codigo = 0
+    print("\nComparación contra la línea base:")
+    for r in actuales:
+        b = previos.get(_clave(r))
+        if not b or not b.get("filas_por_seg"):
+            print(f"  {_clave(r):<20} sin referencia")
+            continue
+        distintos = _diferencias(b.get("parametros"), r["parametros"])
+        if distintos:
+            print(f"  {_clave(r):<20} no comparable: {'; '.join(distintos)}")
+            codigo = 3
+            continue
+        delta = r["filas_por_seg"] / b["filas_por_seg"] - 1
+        marca = ""
+        if delta < -tolerancia:
+            marca = "  << REGRESIÓN"
+            codigo = codigo or 2
+        print(f"  {_clave(r):<20} {b['filas_por_seg']:>12.1f} → {r['filas_por_seg']:>12.1f} filas/s "
+              f"({delta:+.1%}){marca}")
+    return codigo
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark de generación de XML de Neptuno")
+    ap.add_argument("--lineas", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--tipos", nargs="+", choices=["inventario", "to"], default=["inventario", "to"])
+    ap.add_argument("--latencia-ms", type=float, default=1.0, help="demora por consulta a Oracle")
+    ap.add_argument("--aciertos-upc", type=float, default=0.3, help="fracción de UPC ya existentes")
+    ap.add_argument("--aciertos-desc", type=float, default=0.5, help="fracción de estilos ya existentes")
+    ap.add_argument("--modo-sid", choices=["upc", "random"], default="upc")
+    ap.add_argument("--procesos", type=int, default=0, help="generación paralela (0 = secuencial)")
+    ap.add_argument("--guardar", type=Path, help="guarda los resultados como línea base")
+    ap.add_argument("--comparar", type=Path, help="compara contra una línea base guardada")
+    ap.add_argument("--tolerancia", type=float, default=0.10, help="caída de filas/s aceptada")
+    ap.add_argument("--caso", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.caso:                              # proceso hijo: un solo caso
+        print(json.dumps(ejecutar_caso(json.loads(args.caso))))
+        return 0
+
+    datos = CARPETA / "datos"
+    datos.mkdir(parents=True, exist_ok=True)
+    resultados = []
+    print(f"{'caso':<20} {'seg':>9} {'filas/s':>12} {'RSS MB':>8} {'consultas':>10}  etapas (seg)")
+    for tipo in args.tipos:
+        for lineas in args.lineas:
+            nombre = (f"cat_{lineas}_{args.aciertos_upc}_{args.aciertos_desc}.txt"
+                      if tipo == "inventario" else f"to_{lineas}.txt")
+            with tempfile.TemporaryDirectory(prefix="neptuno-bench-") as tmp:
+                caso = {
+                    "tipo": tipo, "lineas": lineas, "carpeta": tmp, "datos": str(datos / nombre),
+                    "latencia_ms": args.latencia_ms, "aciertos_upc": args.aciertos_upc,
+                    "aciertos_desc": args.aciertos_desc, "modo_sid": args.modo_sid,
+                    "procesos": args.procesos,
+                }
+                proc = subprocess.run(
+                    [sys.executable, __file__, "--caso", json.dumps(caso)],
+                    capture_output=True, text=True,
+                )
+            if proc.returncode:
+                print(f"{tipo}:{lineas} falló:\n{proc.stderr}", file=sys.stderr)
+                return 1
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            resultados.append(r)
+            etapas = " ".join(f"{k}={v}" for k, v in r["etapas_seg"].items() if v)
+            print(f"{_clave(r):<20} {r['segundos']:>9.3f} {r['filas_por_seg']:>12.1f} "
+                  f"{r['rss_pico_mb'] or 0:>8.1f} {r['consultas']:>10}  {etapas}")
+
+    informe = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "parametros": {k: v for k, v in vars(args).items()
+                       if k not in ("guardar", "comparar", "caso")},
+        "resultados": resultados,
+    }
+    if args.guardar:
+        args.guardar.parent.mkdir(parents=True, exist_ok=True)
+        args.guardar.write_text(json.dumps(informe, indent=2), encoding="utf-8")
+        print(f"\nLínea base guardada en {args.guardar}")
+    if args.comparar:
+        base = json.loads(args.comparar.read_text(encoding="utf-8"))
+        return comparar(base, resultados, args.tolerancia)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
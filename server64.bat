@@ -5,8 +5,10 @@ rem -------------------------------
 
 cd /d "%~dp0"
 
-rem Inicia el servidor con Python 64-bits
-start /B "" "C:\Users\Ricardo Guerrero\AppData\Local\Programs\Python\Python313\python.exe" neptuno.py
+rem Inicia el servidor de produccion (waitress, varios hilos) con Python 64-bits.
+rem Hilos, puerto, keep-alive y tamano maximo de subida: seccion "servidor" de config.json.
+rem Requiere: python -m pip install waitress
+start /B "" "C:\Users\Ricardo Guerrero\AppData\Local\Programs\Python\Python313\python.exe" neptuno.py --motor waitress
 
 timeout /t 3 /nobreak >nul
 
@@ -80,6 +80,36 @@ function post(url, params){
   return fetch(url, {method:'POST', body: params});
 }
 
+// Envía el archivo como trabajo en segundo plano y consulta su avance
+function runJob(form, tipo, progressSel){
+  const data = new FormData(form);
+  data.append('tipo', tipo);
+  const box = q(progressSel);
+  const bar = box ? box.querySelector('.progress-bar') : null;
+  const show = (pct, txt)=>{
+    if(!box) return;
+    box.classList.remove('d-none');
+    bar.style.width = pct + '%';
+    bar.textContent = txt;
+  };
+  return fetch('/trabajos', {method:'POST', body:data})
+    .then(r=>r.json().then(res=>r.ok ? res : Promise.reject(res)))
+    .then(job=>new Promise((resolve, reject)=>{
+      const poll = ()=>{
+        fetch(job.url).then(r=>r.json()).then(st=>{
+          if(st.estado==='terminado'){ show(100, st.filas + ' filas'); resolve(st); return; }
+          if(st.estado==='error'){ reject(st); return; }
+          const pct = st.total ? Math.floor(100 * st.filas / st.total) : 0;
+          const eta = st.eta_seg != null ? ' · ETA ' + Math.ceil(st.eta_seg) + 's' : '';
+          show(pct, st.filas + (st.total ? '/' + st.total : '') + eta);
+          setTimeout(poll, 1000);
+        }).catch(reject);
+      };
+      poll();
+    }))
+    .finally(()=>{ if(box) setTimeout(()=>box.classList.add('d-none'), 3000); });
+}
+
 document.addEventListener('DOMContentLoaded', ()=>{
   // ----- Inventory Mapping -----
   if(q('#saveMapping')){
@@ -133,15 +163,93 @@ document.addEventListener('DOMContentLoaded', ()=>{
 
     q('#generateFormTO').addEventListener('submit', e=>{
       e.preventDefault();
-      const form = new FormData(e.target);
-      fetch('/generar_to', {method:'POST', body:form})
-        .then(r=>r.json())
+      runJob(e.target, 'to', '#progressTO')
+        .then(res=>alert((res.transfers>1 ? res.transfers+' Transfer Orders generados en:\n' : 'XML TO generado en:\n')+(res.paths||[res.path]).join('\n')))
+        .catch(err=>alert('Error al generar XML TO:\n'+((err && err.error)||'')))
+        .finally(()=>e.target.reset());
+    });
+  }
+
+  // ----- Prevalidación: lee el NDJSON de /prevalidar a medida que llega -----
+  if(q('#prevalidarBtn')){
+    q('#prevalidarBtn').addEventListener('click', async ()=>{
+      const form = q('#generateForm');
+      if(!q('#csv_file').files.length){ form.reportValidity(); return; }
+      const btn = q('#prevalidarBtn');
+      const estado = q('#prevalidacionEstado');
+      const lista = q('#prevalidacionLista');
+      lista.innerHTML = '';
+      estado.textContent = 'Validando…';
+      q('#prevalidacion').classList.remove('d-none');
+      btn.disabled = true;
+      const mostrar = ev=>{
+        if(ev.tipo==='progreso'){ estado.textContent = 'Validando… '+ev.lineas+' líneas'; return; }
+        if(ev.tipo==='resumen'){
+          estado.textContent = (ev.ok ? 'Sin errores' : ev.errores+' errores')
+            + (ev.avisos ? ', '+ev.avisos+' avisos' : '')
+            + ' en '+ev.lineas+' líneas ('+ev.upc_nuevos+' UPC nuevos, '+ev.upc_existentes+' existentes)'
+            + (ev.omitidos ? '; '+ev.omitidos+' hallazgos sin detalle' : '')
+            + (ev.referencias ? '' : ' — sin validar DCS, VENDOR ni UPC');
+          return;
+        }
+        const li = document.createElement('li');
+        li.className = ev.nivel==='aviso' ? 'text-warning' : 'text-danger';
+        if(ev.tipo==='fallo') li.classList.add('fw-bold');
+        li.textContent = ev.mensaje;
+        lista.appendChild(li);
+      };
+      try{
+        const r = await fetch('/prevalidar', {method:'POST', body:new FormData(form)});
+        if(!r.ok) throw await r.json();
+        const lector = r.body.getReader();
+        const dec = new TextDecoder();
+        let resto = '';
+        for(;;){
+          const {value, done} = await lector.read();
+          if(done) break;
+          const partes = (resto + dec.decode(value, {stream:true})).split('\n');
+          resto = partes.pop();
+          partes.filter(Boolean).forEach(l=>mostrar(JSON.parse(l)));
+        }
+        if(resto) mostrar(JSON.parse(resto));
+      }catch(err){
+        estado.textContent = 'Error al validar: '+((err && (err.error||err.message))||'');
+      }finally{
+        btn.disabled = false;
+      }
+    });
+  }
+
+  // ----- Batch (varios archivos o zip) -----
+  if(q('#generateFormLote')){
+    q('#generateFormLote').addEventListener('submit', e=>{
+      e.preventDefault();
+      const btn = e.target.querySelector('button[type=submit]');
+      btn.disabled = true;
+      fetch('/lote', {method:'POST', body:new FormData(e.target)})
+        .then(r=>r.json().then(res=>r.ok ? res : Promise.reject(res)))
         .then(res=>{
-          if(res.status==='success') alert('XML TO generado en:\n'+res.path);
-          else alert('Error al generar XML TO:\n'+(res.error||''));
+          const body = q('#manifestLote tbody');
+          body.innerHTML = '';
+          res.archivos.forEach(a=>{
+            const tr = document.createElement('tr');
+            if(a.estado==='error') tr.classList.add('table-danger');
+            const detalle = a.estado==='error' ? a.error
+                          : (a.path ? (a.paths||[a.path]).join('\n') : 'Sin filas nuevas ni modificadas');
+            [a.archivo, a.tipo, a.estado, a.filas ?? '', a.segundos, detalle].forEach(v=>{
+              const td = document.createElement('td');
+              td.textContent = v;
+              td.style.whiteSpace = 'pre-line';
+              tr.appendChild(td);
+            });
+            body.appendChild(tr);
+          });
+          q('#manifestLote').classList.remove('d-none');
+          alert(res.terminados+' de '+res.total+' archivos generados en '+res.segundos+' s'
+                + (res.con_error ? '\nCon error: '+res.con_error : ''));
         })
-        .catch(()=>alert('Error al generar XML TO'))
-        .finally(()=>e.target.reset());
+        .catch(err=>alert('Error al procesar el lote:\n'+((err && err.error)||'')))
+        .finally(()=>{ btn.disabled = false; e.target.reset(); });
     });
   }
 
@@ -163,10 +271,11 @@ document.addEventListener('DOMContentLoaded', ()=>{
     q('#saveCsvConfig').addEventListener('click', ()=>{
       const delim = q('#csv-delimiter').value;
       const ruta  = q('#outputPath').value;
+      const salida = {formato: q('#salida-formato').value, compresion: q('#salida-compresion').value};
       fetch('/save_csv_config', {
         method:'POST',
         headers:{'Content-Type':'application/json'},
-        body: JSON.stringify({delimiter:delim, ruta:ruta})
+        body: JSON.stringify({delimiter:delim, ruta:ruta, salida:salida})
       })
       .then(r=>{if(!r.ok) return r.json().then(x=>Promise.reject(x));})
       .then(()=>alert('Configuración guardada correctamente'))
@@ -178,11 +287,15 @@ document.addEventListener('DOMContentLoaded', ()=>{
   if(q('#generateForm')){
     q('#generateForm').addEventListener('submit', e=>{
       e.preventDefault();
-      const form = new FormData(e.target);
-      fetch('/generar', {method:'POST', body:form})
-        .then(r=>r.json())
-        .then(res=>{ alert('XML generado en:\n'+res.path); })
-        .catch(err=>alert(err.error||'Error desconocido'))
+      runJob(e.target, 'inventario', '#progressInv')
+        .then(res=>{
+          const dup = res.upc_duplicados && res.upc_duplicados.total;
+          const inc = res.incremental;
+          alert((res.path ? 'XML generado en:\n'+res.path : 'No hay filas nuevas ni modificadas: no se generó archivo')
+                + (dup ? '\nUPC repetidos en el archivo: '+dup : '')
+                + (inc ? '\nSin cambios (omitidas): '+inc.omitidas+' · nuevas: '+inc.nuevas+' · modificadas: '+inc.modificadas : ''));
+        })
+        .catch(err=>alert((err && err.error)||'Error desconocido'))
         .finally(()=>e.target.reset());
     });
   }
@@ -0,0 +1,142 @@
+"""
+Entorno común de las pruebas de generación: config.json temporal y un cursor
+falso que responde las consultas de cms.INVN_SBS, cms.dcs y cms.vendor desde
+memoria, sin Oracle.
+"""
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Neptuno as N  # noqa: E402
+
+CAMPOS_INVENTARIO = [
+    {"visual": "UPC", "rpro": "local_upc", "len": 18, "section": "INVN"},
+    {"visual": "Description 1", "rpro": "description1", "len": 30, "section": "INVN_SBS"},
+    {"visual": "Description 2", "rpro": "description2", "len": 30, "section": "INVN_SBS"},
+    {"visual": "DCS", "rpro": "dcs_code", "len": 9, "section": "INVN_SBS"},
+    {"visual": "Vendor Code", "rpro": "vend_code", "len": 6, "section": "INVN_SBS"},
+    {"visual": "UDF 2", "rpro": "udf_2", "len": 50, "section": "INVN_SBS_SUPPL"},
+]
+
+# Las líneas H, I y S tienen las mismas columnas (header + detail) y los largos
+# se aplican por posición a todas, así que aquí son holgados.
+CAMPOS_TO = [
+    {"visual": "Subsidiaria", "rpro": "sbs_no", "len": 20, "section": "TO"},
+    {"visual": "Tienda", "rpro": "store_no", "len": 20, "section": "TO"},
+    {"visual": "Nro. TO", "rpro": "to_no", "len": 20, "section": "TO"},
+    {"visual": "UPC", "rpro": "upc", "len": 20, "section": "INVN_BASE_ITEM"},
+    {"visual": "Cantidad", "rpro": "ord_qty", "len": 20, "section": "INVN_BASE_ITEM"},
+    {"visual": "Precio", "rpro": "price", "len": 20, "section": "INVN_BASE_ITEM"},
+]
+
+
+class CursorFalso:
+    """
+    Lo mínimo de un cursor de oracledb para las consultas de la generación.
+    `invn` son filas de INVN_SBS como dicts (local_upc, style_sid, item_sid,
+    description1, cost, tax_code, dcs_code, vend_code).
+    """
+
+    def __init__(self, invn=(), dcs=None, vendors=()):
+        self.invn = [dict(r) for r in invn]
+        self.dcs = dict(dcs or {})
+        self.vendors = set(vendors)
+        self.sentencias = []
+        self._filas = []
+
+    def execute(self, sql, binds=None):
+        self.sentencias.append(sql)
+        claves = set()
+        if isinstance(binds, dict):
+            claves = {v for k, v in binds.items() if k.startswith("k")}
+        if "FROM cms.dcs" in sql:
+            self._filas = list(self.dcs.items())
+        elif "FROM cms.vendor" in sql:
+            self._filas = [(v,) for v in self.vendors]
+        elif "local_upc IN" in sql:
+            self._filas = [
+                (r["local_upc"], r["style_sid"], r["item_sid"], r.get("cost"),
+                 r.get("tax_code"), r.get("dcs_code"), r.get("vend_code"))
+                for r in self.invn if r["local_upc"] in claves
+            ]
+        elif "description1 IN" in sql:
+            self._filas = [(r["description1"], r["style_sid"])
+                           for r in self.invn if r.get("description1") in claves]
+        else:
+            raise AssertionError(f"consulta inesperada: {sql}")
+
+    def fetchall(self):
+        return list(self._filas)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConexionFalsa:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    """
+    config.json propio en `tmp_path` (salida, huellas, SID aleatorios y
+    trabajos adentro) y caches del módulo vacíos. Devuelve un dict con la
+    config, para ajustarla con `escribir_config`.
+    """
+    cfg = {
+        "csv": {"ruta": str(tmp_path / "Salida"), "delimiter": ","},
+        "sid_generator": dict(N.DEFAULT_SID_CFG),
+        "asignador_sid": {"nodo": 7, "bloque": 1000, "carpeta": str(tmp_path / "sid")},
+        "indice_upc": {**N.DEFAULT_INDICE_CFG, "habilitado": False, "carpeta": str(tmp_path / "indice")},
+        "generacion_incremental": {**N.DEFAULT_DELTA_CFG, "carpeta": str(tmp_path / "huellas")},
+        "generacion_paralela": {**N.DEFAULT_PARALELO_CFG, "habilitado": False},
+        "trabajos": {**N.DEFAULT_TRABAJOS_CFG, "carpeta": str(tmp_path / "trabajos")},
+        "inventory": {
+            "campos_maestros": CAMPOS_INVENTARIO,
+            "configuracion": [{"rpro": c["rpro"], "visual": c["visual"], "pos": i}
+                              for i, c in enumerate(CAMPOS_INVENTARIO)],
+        },
+        "transfer_orders": {
+            "campos_maestros": CAMPOS_TO,
+            "configuracion": {"header": ["sbs_no", "store_no", "to_no"],
+                              "detail": ["upc", "ord_qty", "price"]},
+            "salida": dict(N.DEFAULT_TO_SALIDA_CFG),
+        },
+    }
+    monkeypatch.setattr(N, "CONFIG_FILE", tmp_path / "config.json")
+    monkeypatch.setattr(N, "_config_cache", {"firma": None, "data": None, "version": 0})
+    monkeypatch.setattr(N, "_planes", {})
+    monkeypatch.setattr(N, "_asignador", None)
+    monkeypatch.setattr(N, "ref_cache", N.RefCache())
+    escribir_config(cfg)
+    return cfg
+
+
+def escribir_config(cfg):
+    N._write_config(json.loads(json.dumps(cfg)))
+
+
+@pytest.fixture
+def oracle_falso(monkeypatch):
+    """Instala un CursorFalso como la sesión que entrega adquirir_conexion()."""
+    def instalar(cursor: CursorFalso) -> CursorFalso:
+        monkeypatch.setattr(N, "adquirir_conexion", lambda: ConexionFalsa(cursor))
+        return cursor
+    return instalar
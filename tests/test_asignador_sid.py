@@ -0,0 +1,91 @@
+"""
+AsignadorSid: SID del modo random sin repetidos entre hilos, procesos y
+reinicios, y sin chocar con los que generaba el sid_random anterior.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from conftest import N
+
+_compartido = None        # asignador heredado por los hijos de fork
+
+
+def _tomar_en_otro_proceso(carpeta, n):
+    a = N.AsignadorSid(carpeta, nodo=3, bloque=50)
+    return [a.siguiente() for _ in range(n)] + a.muchos(n)
+
+
+def _tomar_del_heredado(n):
+    return _compartido.muchos(n)
+
+
+def test_lote_igual_a_uno_por_uno(tmp_path):
+    a = N.AsignadorSid(tmp_path, nodo=5, bloque=1000)
+    ini = a._tomar(1) + 1                     # reserva el bloque y salta una posición
+    esperado = [str(N._fix_sid_f8(((ini + i) << N._BITS_NODO) | 5)) for i in range(21)]
+    assert a.muchos(20) + [a.siguiente()] == esperado
+    assert a.muchos(0) == []
+
+
+def test_sin_repetidos_entre_hilos_y_reinicios(tmp_path):
+    a = N.AsignadorSid(tmp_path, nodo=3, bloque=64)
+    vistos, lock = [], threading.Lock()
+
+    def trabajar():
+        propios = []
+        for _ in range(200):
+            propios.append(a.siguiente())
+            propios.extend(a.muchos(7))
+        with lock:
+            vistos.extend(propios)
+
+    hilos = [threading.Thread(target=trabajar) for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    # un reinicio continúa desde la marca de agua guardada, no desde el reloj
+    vistos += N.AsignadorSid(tmp_path, nodo=3, bloque=64).muchos(500)
+
+    assert len(vistos) == 8 * 200 * 8 + 500
+    assert len(set(vistos)) == len(vistos)
+
+
+def test_sin_repetidos_entre_procesos(tmp_path):
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("spawn")) as ex:
+        partes = list(ex.map(_tomar_en_otro_proceso, [tmp_path] * 4, [300] * 4))
+    todos = [s for p in partes for s in p]
+    todos += N.AsignadorSid(tmp_path, nodo=3, bloque=50).muchos(300)
+
+    assert len(set(todos)) == len(todos) == 4 * 600 + 300
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="sin fork")
+def test_hijo_de_fork_no_usa_el_bloque_del_padre(tmp_path, monkeypatch):
+    a = N.AsignadorSid(tmp_path, nodo=3, bloque=1000)
+    monkeypatch.setitem(globals(), "_compartido", a)
+    padre = a.muchos(10)                       # el padre ya tiene un bloque reservado
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("fork")) as ex:
+        hijo = ex.submit(_tomar_del_heredado, 100).result()
+    padre += a.muchos(100)                     # sigue con el resto de su bloque
+
+    assert not set(hijo) & set(padre)
+
+
+def test_nodos_distintos_no_chocan(tmp_path):
+    uno = N.AsignadorSid(tmp_path, nodo=1, bloque=100).muchos(1000)
+    dos = N.AsignadorSid(tmp_path, nodo=2, bloque=100).muchos(1000)
+    assert not set(uno) & set(dos)
+
+
+def test_por_encima_del_sid_random_anterior():
+    # el anterior armaba ms % 10^12 seguido de 4 dígitos: siempre < 10^16
+    assert N._inicio_secuencia() << N._BITS_NODO >= 10 ** 16
+
+
+def test_nodo_fuera_de_rango(tmp_path):
+    with pytest.raises(ValueError):
+        N.AsignadorSid(tmp_path, nodo=256)
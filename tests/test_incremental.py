@@ -0,0 +1,115 @@
+"""
+Generación incremental: huellas por UPC, filas omitidas y cuándo se guardan.
+"""
+import io
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import pytest
+
+from conftest import CursorFalso, N, escribir_config
+
+DCS = {"1-2-011": "5"}
+VENDORS = {"V01"}
+
+
+def _catalogo(*filas):
+    return io.BytesIO("".join(",".join(f) + "\n" for f in filas).encode("latin-1"))
+
+
+def _fila(upc, udf="a", desc1="CAMISA"):
+    return (upc, desc1, "AZUL", "1-2-011", "V01", udf)
+
+
+def _generar(oracle_falso, filas, **opciones):
+    oracle_falso(CursorFalso((), DCS, VENDORS))
+    return N.procesar_inventario(_catalogo(*filas), **opciones)
+
+
+def _upcs(path):
+    return [inv.find("INVN").get("upc") for inv in ET.parse(path).getroot().iter("INVENTORY")]
+
+
+def _huellas(entorno):
+    carpeta = Path(entorno["generacion_incremental"]["carpeta"])
+    return sorted(p.name for p in carpeta.glob("huellas_*")) if carpeta.exists() else []
+
+
+def test_completa_no_guarda_huellas_por_defecto(entorno, oracle_falso):
+    res = _generar(oracle_falso, [_fila("1001"), _fila("1002")], incremental=False)
+
+    assert Path(res["path"]).exists()
+    assert res["incremental"] is None
+    assert _huellas(entorno) == []
+
+
+def test_completa_registra_huellas_si_se_pide(entorno, oracle_falso):
+    entorno["generacion_incremental"]["registrar_completas"] = True
+    escribir_config(entorno)
+    filas = [_fila("1001"), _fila("1002")]
+    _generar(oracle_falso, filas, incremental=False)
+
+    assert _huellas(entorno)
+    res = _generar(oracle_falso, filas, incremental=True)
+    assert res["path"] is None
+    assert res["incremental"] == {"omitidas": 2, "nuevas": 0, "modificadas": 0}
+
+
+def test_filas_cuenta_lo_escrito(entorno, oracle_falso):
+    _generar(oracle_falso, [_fila("1001"), _fila("1002")], incremental=True)
+    res = _generar(oracle_falso, [_fila("1001"), _fila("1002", udf="b"), _fila("1003")],
+                   incremental=True)
+
+    assert res["leidas"] == 3
+    assert res["filas"] == 2
+    assert res["tiempos"]["conteos"]["filas"] == 2
+
+    res = _generar(oracle_falso, [_fila("1001")], incremental=True)
+    assert (res["path"], res["filas"], res["leidas"]) == (None, 0, 1)
+
+
+@pytest.mark.parametrize("procesos", [0, 2])
+def test_solo_salen_filas_nuevas_o_modificadas(entorno, oracle_falso, procesos):
+    if procesos:
+        entorno["generacion_paralela"] = {**N.DEFAULT_PARALELO_CFG, "habilitado": True,
+                                          "procesos": procesos, "filas_por_bloque": 2,
+                                          "min_filas": 0, "min_filas_por_proceso": 1}
+        escribir_config(entorno)
+    primera = _generar(oracle_falso, [_fila("1001"), _fila("1002"), _fila("1003")], incremental=True)
+    assert _upcs(primera["path"]) == ["1001", "1002", "1003"]
+    assert primera["incremental"] == {"omitidas": 0, "nuevas": 3, "modificadas": 0}
+
+    segunda = _generar(oracle_falso, [_fila("1001"), _fila("1002", udf="b"), _fila("1003"),
+                                      _fila("1004"), _fila("1005", desc1="BOTA")], incremental=True)
+    assert _upcs(segunda["path"]) == ["1002", "1004", "1005"]
+    assert segunda["incremental"] == {"omitidas": 2, "nuevas": 2, "modificadas": 1}
+
+    # lo enviado en la segunda ya es la referencia
+    tercera = _generar(oracle_falso, [_fila("1002", udf="b"), _fila("1004")], incremental=True)
+    assert tercera["path"] is None
+    assert tercera["incremental"] == {"omitidas": 2, "nuevas": 0, "modificadas": 0}
+
+
+def test_cambio_de_plantilla_cuenta_todo_como_modificado(entorno, oracle_falso):
+    filas = [_fila("1001"), _fila("1002")]
+    _generar(oracle_falso, filas, incremental=True)
+
+    entorno["inventory"]["configuracion"][-1]["visual"] = "Otra etiqueta"   # mismo mapeo
+    escribir_config(entorno)
+    assert _generar(oracle_falso, filas, incremental=True)["path"] is None
+
+    # mismas columnas, pero description2 y UDF 2 intercambian su lugar
+    conf = entorno["inventory"]["configuracion"]
+    conf[2]["rpro"], conf[5]["rpro"] = conf[5]["rpro"], conf[2]["rpro"]
+    escribir_config(entorno)
+    res = _generar(oracle_falso, filas, incremental=True)
+    assert res["incremental"] == {"omitidas": 0, "nuevas": 0, "modificadas": 2}
+
+
+def test_corrida_fallida_no_registra_huellas(entorno, oracle_falso):
+    filas = [_fila("1001"), ("1002", "CAMISA", "AZUL", "9-9-999", "V01", "a")]
+    with pytest.raises(RuntimeError, match="DCS_CODE '9-9-999'"):
+        _generar(oracle_falso, filas, incremental=True)
+
+    res = _generar(oracle_falso, [_fila("1001")], incremental=True)
+    assert res["incremental"] == {"omitidas": 0, "nuevas": 1, "modificadas": 0}
@@ -0,0 +1,69 @@
+"""
+IndiceOrdenado: generaciones, cierre de los mapeos reemplazados y borrado de
+los .bin viejos.
+"""
+from pathlib import Path
+
+from conftest import N
+
+
+def _indice(tmp_path):
+    return N.IndiceOrdenado(tmp_path / "indice", "prueba", 8, "q")
+
+
+def _cambios(idx, **valores):
+    return {idx.clave(k): idx.rec.pack(idx.clave(k), v) for k, v in valores.items()}
+
+
+def _bins(idx):
+    return sorted(p.name for p in idx.carpeta.glob(f"{idx.nombre}.*.bin"))
+
+
+def test_fusion_cierra_el_mapeo_anterior(tmp_path):
+    idx = _indice(tmp_path)
+    idx.fusionar(_cambios(idx, a=1, c=3), {})
+    previa = idx._vista
+    idx.fusionar(_cambios(idx, b=2), {})
+
+    assert previa.mm.closed
+    assert [idx.buscar(k) for k in "abcd"] == [(1,), (2,), (3,), None]
+    assert _bins(idx) == ["prueba.2.bin"]
+
+
+def test_lector_en_curso_conserva_su_mapeo(tmp_path):
+    idx = _indice(tmp_path)
+    idx.fusionar(_cambios(idx, a=1), {})
+    with idx._leyendo() as vista:
+        idx.fusionar(_cambios(idx, a=9), {})
+        assert not vista.mm.closed
+        assert vista[0] == idx.clave("a")
+    assert vista.mm.closed
+    assert idx.buscar("a") == (9,)
+
+
+def test_generacion_bloqueada_se_borra_en_la_proxima_fusion(tmp_path, monkeypatch):
+    idx = _indice(tmp_path)
+    idx.fusionar(_cambios(idx, a=1), {})
+
+    unlink = Path.unlink
+
+    def bloqueado(self, *args, **kwargs):
+        raise PermissionError("mapeado por otro proceso")
+
+    monkeypatch.setattr(Path, "unlink", bloqueado)
+    idx.fusionar(_cambios(idx, b=2), {})
+    assert _bins(idx) == ["prueba.1.bin", "prueba.2.bin"]
+
+    monkeypatch.setattr(Path, "unlink", unlink)
+    idx.fusionar(_cambios(idx, c=3), {})
+    assert _bins(idx) == ["prueba.3.bin"]
+    assert [idx.buscar(k) for k in "abc"] == [(1,), (2,), (3,)]
+
+
+def test_reemplazo_completo_descarta_lo_anterior(tmp_path):
+    idx = _indice(tmp_path)
+    idx.fusionar(_cambios(idx, a=1, b=2), {})
+    idx.fusionar(_cambios(idx, c=3), {}, reemplazar=True)
+
+    assert [idx.buscar(k) for k in "abc"] == [None, None, (3,)]
+    assert idx.meta()["n"] == 1
@@ -0,0 +1,162 @@
+"""
+Generación de inventario contra un Oracle falso: el XML tiene que ser, byte a
+byte, el que armaba la generación original fila por fila (consultas de a una
+y un árbol completo indentado con _indent), en cada modo de SID.
+"""
+import io
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import pytest
+
+from conftest import CursorFalso, N, escribir_config
+
+DCS = {"1-2-011": "5", "1-2-012": None}
+VENDORS = {"V01", "V02"}
+
+# INVN_SBS: un UPC ya dado de alta y un estilo existente por description1
+INVN = [
+    {"local_upc": "7700000001", "style_sid": -5001, "item_sid": 9001, "description1": "BOTA",
+     "cost": 12.5, "tax_code": 1, "dcs_code": "1-2-011", "vend_code": "V01"},
+    {"local_upc": "7700000002", "style_sid": -5002, "item_sid": 9002, "description1": "SANDALIA",
+     "cost": 3, "tax_code": 0, "dcs_code": "1-2-012", "vend_code": "V02"},
+]
+
+CATALOGO = [
+    ("7700000001", "BOTA", "NEGRA", "1-2-011", "V01", "exist"),      # UPC existente
+    ("8400000010", "SANDALIA", "AZUL", "1-2-012", "V02", "desc"),    # estilo existente, UPC nuevo
+    ("8400000011", "CAMISA", "AZUL", "1-2-011", "V01", "nuevo"),     # estilo nuevo
+    ("8400000012", "CAMISA", "ROJA", "1-2-011", "V02", ""),          # mismo desc1, otro desc2
+    ("8400000013", "CAMISA", "AZUL", "1-2-012", "V01", "talla"),     # mismo par
+    ("8400000014", "PANTALÓN", "GRIS", "1-2-011", "V01", "ñandú & <x>"),
+    ("8400000011", "CAMISA", "AZUL", "1-2-011", "V01", "repetido"),  # UPC repetido
+]
+
+ESTATICOS = {
+    "sbs_no": "001", "modified_date": "2026-01-02T03:04:05", "currency_id": "1",
+    "currency_name": "DOLLARS", "flag": "0", "kit_type": "0", "max_disc_perc1": "100",
+    "max_disc_perc2": "100", "print_tag": "1", "active": "1", "cms": "0",
+}
+
+
+class _FechaFija(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2026, 1, 2, 3, 4, 5)
+
+
+@pytest.fixture(autouse=True)
+def fecha_fija(monkeypatch):
+    monkeypatch.setattr(N, "datetime", _FechaFija)
+
+
+def _catalogo(*filas):
+    """Líneas upc,desc1,desc2,dcs,vend,udf_2 como stream binario."""
+    return io.BytesIO("".join(",".join(f) + "\n" for f in filas).encode("latin-1"))
+
+
+def _generar(entorno, oracle_falso, filas, invn=(), sid=None, **opciones):
+    if sid:
+        entorno["sid_generator"] = sid
+        escribir_config(entorno)
+    oracle_falso(CursorFalso(invn, DCS, VENDORS))
+    return N.procesar_inventario(_catalogo(*filas), **opciones)
+
+
+def _items(path):
+    """(upc, style_sid, item_sid) de cada <INVENTORY> en orden."""
+    raiz = ET.parse(path).getroot()
+    return [(inv.find("INVN").get("upc"), inv.find("INVN_STYLE").get("style_sid"),
+             inv.find("INVN").get("item_sid"))
+            for inv in raiz.iter("INVENTORY")]
+
+
+def test_modo_both_distingue_description2(entorno, oracle_falso):
+    filas = [
+        ("840423322247", "CAMISA", "AZUL", "1-2-011", "V01", "a"),
+        ("840423322248", "CAMISA", "ROJA", "1-2-011", "V01", "b"),
+        ("840423322249", "CAMISA", "AZUL", "1-2-012", "V02", "c"),
+    ]
+    res = _generar(entorno, oracle_falso, filas,
+                   sid={"item_sid_mode": "upc", "style_sid_mode": "both"})
+
+    estilos = [s for _, s, _ in _items(res["path"])]
+    assert estilos == [N.sid_from_both("CAMISA", "AZUL"),
+                       N.sid_from_both("CAMISA", "ROJA"),
+                       N.sid_from_both("CAMISA", "AZUL")]
+    assert estilos[0] != estilos[1]
+
+
+def _documento_original(tmp_path, filas, modo_estilo: str) -> bytes:
+    """XML que producía la generación fila por fila original (modos deterministas)."""
+    por_upc = {r["local_upc"]: r for r in INVN}
+    por_desc = {}
+    for r in INVN:
+        por_desc.setdefault(r["description1"], str(r["style_sid"]))
+
+    raiz = ET.Element("DOCUMENT")
+    invs = ET.SubElement(raiz, "INVENTORYS")
+    for upc, d1, d2, dcs, vend, udf in filas:
+        if upc in por_upc:
+            style, item = str(por_upc[upc]["style_sid"]), str(por_upc[upc]["item_sid"])
+        else:
+            item = N.sid_from_upc(upc)
+            style = por_desc.get(d1) or (
+                N.sid_from_both(d1, d2) if modo_estilo == "both" else N.sid_from_desc(d1))
+        inv = ET.SubElement(invs, "INVENTORY")
+        ET.SubElement(inv, "INVN_STYLE", style_sid=style)
+        ET.SubElement(inv, "INVN", item_sid=item, upc=upc)
+        sbs = ET.SubElement(inv, "INVN_SBS", dict(ESTATICOS))
+        for rpro, valor in (("description1", d1), ("description2", d2),
+                            ("dcs_code", dcs), ("vend_code", vend)):
+            sbs.set(rpro, valor)
+        if DCS[dcs] is not None:
+            sbs.set("tax_code", DCS[dcs])
+        supps = ET.SubElement(sbs, "INVN_SBS_SUPPLS")
+        ET.SubElement(supps, "INVN_SBS_SUPPL", udf_no="2", udf_value=udf)
+    N._indent(raiz)
+    ruta = tmp_path / "original.xml"
+    ET.ElementTree(raiz).write(ruta, encoding="utf-8", xml_declaration=True)
+    return ruta.read_bytes()
+
+
+@pytest.mark.parametrize("modo_estilo", ["desc1", "both"])
+@pytest.mark.parametrize("procesos", [0, 2])
+def test_xml_igual_al_original(entorno, oracle_falso, tmp_path, modo_estilo, procesos):
+    if procesos:
+        entorno["generacion_paralela"] = {**N.DEFAULT_PARALELO_CFG, "habilitado": True,
+                                          "procesos": procesos, "filas_por_bloque": 2,
+                                          "min_filas": 0, "min_filas_por_proceso": 1}
+    res = _generar(entorno, oracle_falso, CATALOGO, INVN,
+                   sid={"item_sid_mode": "upc", "style_sid_mode": modo_estilo})
+
+    with open(res["path"], "rb") as fh:
+        assert fh.read() == _documento_original(tmp_path, CATALOGO, modo_estilo)
+    assert res["filas"] == len(CATALOGO)
+    assert res["upc_duplicados"] == {"total": 1, "upcs": [{"upc": "8400000011", "lineas": [3, 7]}]}
+
+
+def test_modo_random_respeta_existentes_y_no_repite(entorno, oracle_falso):
+    res = _generar(entorno, oracle_falso, CATALOGO, INVN,
+                   sid={"item_sid_mode": "random", "style_sid_mode": "random"})
+    items = _items(res["path"])
+
+    # lo que ya está en la base no cambia
+    assert items[0] == ("7700000001", "-5001", "9001")
+    assert items[1][1] == "-5002"
+    # un UPC repetido reutiliza lo asignado en su primera línea
+    assert items[6] == items[2]
+    nuevos = items[1:6]
+    assert len({item for _, _, item in nuevos}) == len(nuevos)
+    # un estilo nuevo se comparte entre sus tallas y no choca con otros estilos
+    estilos = [s for _, s, _ in items]
+    assert estilos[2] == estilos[3] == estilos[4]
+    assert len({estilos[0], estilos[1], estilos[2], estilos[5]}) == 4
+    assert all(s.isdigit() for s in estilos[2:] + [i for _, _, i in nuevos])
+
+
+def test_referencia_inexistente_no_deja_archivo(entorno, oracle_falso, tmp_path):
+    filas = CATALOGO[:2] + [("8400000099", "X", "Y", "9-9-999", "V01", "")]
+    with pytest.raises(RuntimeError, match="Línea 3: DCS_CODE '9-9-999'"):
+        _generar(entorno, oracle_falso, filas, INVN)
+    assert not [p for p in (tmp_path / "Salida").iterdir() if p.name.startswith("Inventory")]
@@ -0,0 +1,74 @@
+"""
+reservar_salida: nombres Inventory###/TO### sin repetidos entre hilos y
+procesos, y recuperación del contador desde los archivos de la carpeta.
+"""
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from conftest import N
+
+
+def _reservar_varios(carpeta, n):
+    return [N.reservar_salida(carpeta, "Inventory").name for _ in range(n)]
+
+
+def test_numeros_consecutivos_por_prefijo(tmp_path):
+    nombres = [N.reservar_salida(tmp_path, p, ext).name
+               for p, ext in (("Inventory", ".xml"), ("TO", ".xml"), ("Inventory", ".xml.gz"),
+                              ("TO", ".xml"))]
+    assert nombres == ["Inventory001.xml", "TO001.xml", "Inventory002.xml.gz", "TO002.xml"]
+    estado = json.loads((tmp_path / N.ESTADO_NUMERACION).read_text(encoding="utf-8"))
+    assert estado == {"Inventory": 2, "TO": 2}
+
+
+def test_sin_repetidos_entre_hilos_y_procesos(tmp_path):
+    nombres, lock = [], threading.Lock()
+
+    def trabajar():
+        propios = _reservar_varios(tmp_path, 25)
+        with lock:
+            nombres.extend(propios)
+
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("spawn")) as ex:
+        futuros = [ex.submit(_reservar_varios, tmp_path, 25) for _ in range(4)]
+        hilos = [threading.Thread(target=trabajar) for _ in range(4)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        for f in futuros:
+            nombres.extend(f.result())
+
+    assert len(nombres) == 200
+    assert sorted(nombres) == [f"Inventory{n:03d}.xml" for n in range(1, 201)]
+
+
+def test_recupera_el_maximo_numerico_si_falta_el_estado(tmp_path):
+    for nombre in ("TO999.xml", "TO1000.xml", "Inventory041.zip", "Inventory007.xml", "notas.txt"):
+        (tmp_path / nombre).write_text("")
+
+    assert N.reservar_salida(tmp_path, "TO").name == "TO1001.xml"
+    assert N.reservar_salida(tmp_path, "Inventory").name == "Inventory042.xml"
+
+
+def test_estado_ilegible_se_recupera(tmp_path):
+    (tmp_path / "Inventory003.xml").write_text("")
+    (tmp_path / N.ESTADO_NUMERACION).write_text("{roto", encoding="utf-8")
+
+    assert N.reservar_salida(tmp_path, "Inventory").name == "Inventory004.xml"
+
+
+def test_no_pisa_un_archivo_dejado_a_mano(tmp_path):
+    N.reservar_salida(tmp_path, "Inventory")
+    (tmp_path / "Inventory002.xml").write_text("a mano")
+
+    assert N.reservar_salida(tmp_path, "Inventory").name == "Inventory003.xml"
+    assert (tmp_path / "Inventory002.xml").read_text() == "a mano"
+
+
+def test_crea_la_carpeta(tmp_path):
+    carpeta = tmp_path / "no" / "existe"
+    assert N.reservar_salida(str(carpeta), "TO") == Path(carpeta) / "TO001.xml"
@@ -0,0 +1,93 @@
+"""
+Vectores fijos de los SID deterministas (UPC, description1, description1+2).
+
+Los valores esperados salen de las funciones escalares originales; las versiones
+en lote (*_many) tienen que dar exactamente lo mismo, elemento por elemento.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Neptuno as N  # noqa: E402
+
+UPC = [
+    ("0", "0"),
+    ("1", "1"),
+    ("840423322247", "26893546311687"),
+    ("7615537120775", "243697187864583"),
+    ("00000000000077777", "2488833"),
+    ("9" * 13, "319999999999751"),
+    # más de 64 bits: se toman los 64 bits bajos
+    ("9" * 40, "4516019710717853447"),
+    ("123456789012345678901234567890", "7961270993763260930"),
+]
+
+DESC = [
+    ("", "5154577114885135363"),
+    ("X", "2202892208345778435"),
+    ("1-2-011-125-160", "5230516441813058565"),
+    ("ÑANDÚ", "1564771999599665414"),
+    ("CAFÉ 漢字", "6083339656144098817"),
+    ("A" * 19, "4508530149278966787"),
+    # sólo cuentan los primeros 19 caracteres
+    ("A" * 500, "4508530149278966787"),
+    ("é" * 30, "1595257613030316039"),
+]
+
+AMBAS = [
+    (("", ""), "5154577114885135363"),
+    (("CAMISA", "AZUL"), "6081365788178864640"),
+    (("ÑANDÚ ", "漢字"), "4171508997390704135"),
+    (("A" * 15, "B" * 15), "8366096119429068033"),
+    (("", "SOLO D2"), "566360762903177984"),
+]
+
+
+@pytest.mark.parametrize("upc, esperado", UPC)
+def test_sid_from_upc(upc, esperado):
+    assert N.sid_from_upc(upc) == esperado
+
+
+@pytest.mark.parametrize("desc, esperado", DESC)
+def test_sid_from_desc(desc, esperado):
+    assert N.sid_from_desc(desc) == esperado
+
+
+@pytest.mark.parametrize("par, esperado", AMBAS)
+def test_sid_from_both(par, esperado):
+    assert N.sid_from_both(*par) == esperado
+
+
+def test_sid_from_upc_many_igual_al_escalar():
+    upcs = [u for u, _ in UPC]
+    assert N.sid_from_upc_many(upcs) == [e for _, e in UPC]
+    assert N.sid_from_upc_many(upcs) == [N.sid_from_upc(u) for u in upcs]
+
+
+def test_sid_from_desc_many_igual_al_escalar():
+    descs = [d for d, _ in DESC]
+    assert N.sid_from_desc_many(descs) == [e for _, e in DESC]
+    assert N.sid_from_desc_many(descs) == [N.sid_from_desc(d) for d in descs]
+
+
+def test_sid_from_both_many_igual_al_escalar():
+    d1s = [a for (a, _), _ in AMBAS]
+    d2s = [b for (_, b), _ in AMBAS]
+    assert N.sid_from_both_many(d1s, d2s) == [e for _, e in AMBAS]
+    assert N.sid_from_both_many(d1s, d2s) == [N.sid_from_both(a, b) for a, b in zip(d1s, d2s)]
+
+
+def test_lotes_vacios():
+    assert N.sid_from_upc_many([]) == []
+    assert N.sid_from_desc_many([]) == []
+    assert N.sid_from_both_many([], []) == []
+
+
+def test_upc_vacio_falla_igual():
+    with pytest.raises(ValueError):
+        N.sid_from_upc("")
+    with pytest.raises(ValueError):
+        N.sid_from_upc_many([""])
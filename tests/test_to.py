@@ -0,0 +1,89 @@
+"""
+Transfer Orders con varios bloques H/I/S: un <DOCUMENT> con todos los <TO> o
+un archivo por TO, y nada escrito si algún TO falla.
+"""
+import io
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import pytest
+
+from conftest import CursorFalso, N
+
+INVN = [
+    {"local_upc": "7700001", "style_sid": -51, "item_sid": 91, "cost": 12.5, "tax_code": 1,
+     "dcs_code": "1-2-011", "vend_code": "V01"},
+    {"local_upc": "7700002", "style_sid": -52, "item_sid": 92, "cost": 3, "tax_code": None,
+     "dcs_code": "1-2-012", "vend_code": "V02"},
+]
+
+ARCHIVO = [
+    "H,001,002,TO-1,,",
+    "I,7700001,2,5.99,,",
+    "I,7700002,1,,,",
+    "S,,,,,",
+    "H,001,003,TO-2,,",
+    "I,7700002,4,1.50,,",
+    "S,,,,,",
+]
+
+
+def _procesar(oracle_falso, lineas, **opciones):
+    oracle_falso(CursorFalso(INVN))
+    return N.procesar_to(io.BytesIO(("\r\n".join(lineas) + "\r\n").encode("latin-1")), **opciones)
+
+
+def _to(el):
+    """(atributos del encabezado sin los variables, [(atributos de cada TO_ITEM, INVN_BASE_ITEM, TO_QTY)])."""
+    hdr = dict(el.find("TO_HDR").attrib)
+    assert hdr.pop("to_sid").isdigit()
+    hdr.pop("modified_date")
+    items = [(dict(ti.attrib), dict(ti.find("INVN_BASE_ITEM").attrib), dict(ti.find("TO_QTYS/TO_QTY").attrib))
+             for ti in el.find("TO_ITEMS")]
+    return hdr, items
+
+
+ESPERADOS = [
+    ({"to_type": "0", "cms": "1", "held": "1", "active": "1",
+      "sbs_no": "001", "store_no": "002", "to_no": "TO-1"},
+     [({"item_pos": "1", "item_sid": "91", "price": "5.99", "cost": "12.5", "tax_code": "1"},
+       {"item_sid": "91", "upc": "7700001", "style_sid": "-51", "dcs_code": "1-2-011",
+        "vend_code": "V01", "use_qty_decimals": "0", "cost": "12.5", "tax_code": "1"},
+       {"store_no": "001", "ord_qty": "2", "rcvd_qty": "0"}),
+      ({"item_pos": "2", "item_sid": "92", "price": "", "cost": "3", "tax_code": "None"},
+       {"item_sid": "92", "upc": "7700002", "style_sid": "-52", "dcs_code": "1-2-012",
+        "vend_code": "V02", "use_qty_decimals": "0", "cost": "3", "tax_code": "None"},
+       {"store_no": "001", "ord_qty": "1", "rcvd_qty": "0"})]),
+    ({"to_type": "0", "cms": "1", "held": "1", "active": "1",
+      "sbs_no": "001", "store_no": "003", "to_no": "TO-2"},
+     [({"item_pos": "1", "item_sid": "92", "price": "1.50", "cost": "3", "tax_code": "None"},
+       {"item_sid": "92", "upc": "7700002", "style_sid": "-52", "dcs_code": "1-2-012",
+        "vend_code": "V02", "use_qty_decimals": "0", "cost": "3", "tax_code": "None"},
+       {"store_no": "001", "ord_qty": "4", "rcvd_qty": "0"})]),
+]
+
+
+def test_varios_to_en_un_documento(entorno, oracle_falso):
+    res = _procesar(oracle_falso, ARCHIVO)
+
+    assert res["transfers"] == 2 and res["filas"] == 3
+    assert res["paths"] == [res["path"]] and Path(res["path"]).name == "TO001.xml"
+    raiz = ET.parse(res["path"]).getroot()
+    assert raiz.tag == "DOCUMENT"
+    assert [_to(el) for el in raiz.findall("TO")] == ESPERADOS
+
+
+def test_un_archivo_por_to(entorno, oracle_falso):
+    res = _procesar(oracle_falso, ARCHIVO, archivo_por_to=True)
+
+    assert [Path(p).name for p in res["paths"]] == ["TO001.xml", "TO002.xml"]
+    assert [[_to(el) for el in ET.parse(p).getroot().findall("TO")] for p in res["paths"]] \
+        == [[ESPERADOS[0]], [ESPERADOS[1]]]
+
+
+@pytest.mark.parametrize("archivo_por_to", [False, True])
+def test_un_to_con_error_no_deja_archivos(entorno, oracle_falso, tmp_path, archivo_por_to):
+    lineas = ARCHIVO[:5] + ["I,7799999,1,1.00,,", "S,,,,,"]
+    with pytest.raises(N.ErrorValidacion, match="TO 2, línea detalle 1: UPC «7799999» no existe"):
+        _procesar(oracle_falso, lineas, archivo_por_to=archivo_por_to)
+    assert not [p for p in (tmp_path / "Salida").iterdir() if p.name.startswith("TO")]
@@ -0,0 +1,69 @@
+"""
+XmlStreamWriter: el formato legible es byte a byte el de _indent + ElementTree.write,
+y los demás perfiles tienen el mismo contenido.
+"""
+import gzip
+import xml.etree.ElementTree as ET
+import zipfile
+
+import pytest
+
+from conftest import N
+
+
+def _arbol():
+    raiz = ET.Element("DOCUMENT")
+    invs = ET.SubElement(raiz, "INVENTORYS")
+    for i in range(3):
+        inv = ET.SubElement(invs, "INVENTORY")
+        ET.SubElement(inv, "INVN", item_sid=str(i), upc=f"84{i}")
+        sbs = ET.SubElement(inv, "INVN_SBS", description1=f"ÑANDÚ & <{i}>", vacio="")
+        supps = ET.SubElement(sbs, "INVN_SBS_SUPPLS")
+        ET.SubElement(supps, "INVN_SBS_SUPPL", udf_no="2", udf_value="漢字")
+    ET.SubElement(raiz, "VACIO")
+    return raiz
+
+
+def _escribir(ruta, compacto=False):
+    with N.XmlStreamWriter(ruta, compacto) as xw:
+        xw.abrir("DOCUMENT")
+        xw.abrir("INVENTORYS")
+        for inv in _arbol().find("INVENTORYS"):
+            xw.escribir(inv)
+        xw.cerrar()
+        xw.abrir("VACIO")
+
+
+def test_legible_igual_a_indent_y_write(tmp_path):
+    raiz = _arbol()
+    N._indent(raiz)
+    ET.ElementTree(raiz).write(tmp_path / "arbol.xml", encoding="utf-8", xml_declaration=True)
+    _escribir(tmp_path / "stream.xml")
+
+    assert (tmp_path / "stream.xml").read_bytes() == (tmp_path / "arbol.xml").read_bytes()
+    assert not (tmp_path / "stream.xml.part").exists()
+
+
+@pytest.mark.parametrize("nombre, leer", [
+    ("c.xml", lambda p: p.read_bytes()),
+    ("c.xml.gz", lambda p: gzip.decompress(p.read_bytes())),
+    ("c.zip", lambda p: zipfile.ZipFile(p).read("c.xml")),
+])
+def test_perfiles_mismo_contenido(tmp_path, nombre, leer):
+    _escribir(tmp_path / nombre, compacto=True)
+    compacto = ET.fromstring(leer(tmp_path / nombre))
+    _escribir(tmp_path / "legible.xml")
+    legible = ET.parse(tmp_path / "legible.xml").getroot()
+
+    for el in legible.iter():
+        el.text = el.tail = None
+    assert ET.tostring(compacto) == ET.tostring(legible)
+
+
+def test_abortar_no_deja_archivo(tmp_path):
+    with pytest.raises(RuntimeError):
+        with N.XmlStreamWriter(tmp_path / "x.xml", False) as xw:
+            xw.abrir("DOCUMENT")
+            xw.escribir(ET.Element("A"))
+            raise RuntimeError("falla a mitad")
+    assert list(tmp_path.iterdir()) == []